@@ -0,0 +1,161 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import librosa
+import soundfile as sf
+
+from bg_cache import file_sha256
+
+# Output formats the server can deliver; the WAV written by process_audio is the master copy
+AUDIO_FORMATS = {
+    'wav': {'extension': 'wav', 'mimetype': 'audio/wav', 'format': 'WAV', 'subtype': None},
+    'flac': {'extension': 'flac', 'mimetype': 'audio/flac', 'format': 'FLAC', 'subtype': 'PCM_16'},
+    'ogg': {'extension': 'ogg', 'mimetype': 'audio/ogg', 'format': 'OGG', 'subtype': 'VORBIS'},
+    'opus': {'extension': 'opus', 'mimetype': 'audio/ogg; codecs=opus', 'format': 'OGG', 'subtype': 'OPUS'},
+}
+
+# MIME types accepted in Accept headers for each format
+AUDIO_MIMETYPES = {
+    'audio/wav': 'wav', 'audio/wave': 'wav', 'audio/x-wav': 'wav',
+    'audio/flac': 'flac', 'audio/x-flac': 'flac',
+    'audio/ogg': 'ogg', 'audio/vorbis': 'ogg',
+    'audio/opus': 'opus',
+}
+
+# Sample rates the Opus encoder supports; anything else is resampled to 48 kHz
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Frames encoded per block, so long meditations are never fully decoded into memory
+ENCODE_BLOCK_FRAMES = 65536
+
+def audio_path(directory, job_id, audio_format='wav'):
+    """Path of a job's audio in the given format"""
+    return os.path.join(directory, f"{job_id}.{AUDIO_FORMATS[audio_format]['extension']}")
+
+def available_formats(directory, job_id):
+    """Formats already on disk for a job, as a dict of format -> size in bytes"""
+    sizes = {}
+    for audio_format in AUDIO_FORMATS:
+        try:
+            sizes[audio_format] = os.path.getsize(audio_path(directory, job_id, audio_format))
+        except FileNotFoundError:
+            continue
+    return sizes
+
+@lru_cache(maxsize=1024)
+def _content_etag(path, size, mtime_ns):
+    return file_sha256(path)[:32]
+
+def artifact_etag(path):
+    """
+    Strong ETag for a finished audio file: a hash of its contents, computed once
+    per (path, size, mtime). Artifacts are only ever replaced atomically, never
+    modified in place, so the hash stays valid for as long as the file exists.
+    """
+    st = os.stat(path)
+    return _content_etag(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+def parse_accept(accept_header):
+    """
+    Audio formats named in an Accept header, most preferred first.
+
+    'audio/ogg; codecs=opus' selects Opus; wildcards and unknown types are ignored.
+    """
+    preferences = []
+    for index, item in enumerate((accept_header or '').split(',')):
+        parts = [part.strip() for part in item.split(';')]
+        mimetype = parts[0].lower()
+        params = dict(part.split('=', 1) for part in parts[1:] if '=' in part)
+        try:
+            quality = float(params.get('q', 1))
+        except ValueError:
+            quality = 0
+        audio_format = AUDIO_MIMETYPES.get(mimetype)
+        if mimetype == 'audio/ogg' and params.get('codecs', '').strip('"').lower() == 'opus':
+            audio_format = 'opus'
+        if audio_format and quality > 0:
+            preferences.append((-quality, index, audio_format))
+    return [audio_format for _, _, audio_format in sorted(preferences)]
+
+def encode_audio(wav_path, output_path, audio_format):
+    """
+    Encode a WAV file into one of AUDIO_FORMATS.
+
+    The result is written next to output_path and renamed into place, so a
+    partially encoded file is never served.
+    """
+    spec = AUDIO_FORMATS[audio_format]
+    tmp_path = output_path + ".tmp"
+    try:
+        info = sf.info(wav_path)
+        if audio_format == 'opus' and info.samplerate not in OPUS_SAMPLE_RATES:
+            audio, sr = sf.read(wav_path)
+            audio = librosa.resample(audio.T, orig_sr=sr, target_sr=48000).T
+            sf.write(tmp_path, audio, 48000, format=spec['format'], subtype=spec['subtype'])
+        else:
+            with sf.SoundFile(tmp_path, 'w', info.samplerate, info.channels,
+                              format=spec['format'], subtype=spec['subtype']) as out:
+                for block in sf.blocks(wav_path, blocksize=ENCODE_BLOCK_FRAMES):
+                    out.write(block)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output_path
+
+class AudioEncoder:
+    """
+    Encodes finished meditations into compressed formats on a small thread pool.
+
+    Encodes of the same file are coalesced, so concurrent requests for a variant
+    that is not on disk yet share one encode.
+
+    Parameters:
+    - directory: where job audio lives (UPLOAD_FOLDER)
+    - workers: concurrent encodes
+    """
+
+    def __init__(self, directory, workers=1):
+        self.directory = directory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-encoder")
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, job_id, audio_format):
+        """
+        Start encoding a job's WAV into audio_format (no-op if already on disk or in progress).
+
+        Returns:
+        - a Future resolving to the encoded file's path
+        """
+        output_path = audio_path(self.directory, job_id, audio_format)
+        with self._lock:
+            future = self._pending.get(output_path)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._encode, job_id, audio_format, output_path)
+            self._pending[output_path] = future
+        return future
+
+    def _encode(self, job_id, audio_format, output_path):
+        try:
+            if not os.path.exists(output_path):
+                wav_path = audio_path(self.directory, job_id, 'wav')
+                print(f"Encoding {job_id} to {audio_format}...")
+                encode_audio(wav_path, output_path, audio_format)
+                artifact_etag(output_path)  # Hash now rather than on the first download
+                print(f"Encoded {os.path.basename(output_path)} "
+                      f"({os.path.getsize(output_path) / 1024 / 1024:.1f} MB, "
+                      f"WAV {os.path.getsize(wav_path) / 1024 / 1024:.1f} MB)")
+            return output_path
+        finally:
+            with self._lock:
+                self._pending.pop(output_path, None)
+
+    def encoding(self, job_id, audio_format):
+        """Whether an encode of this variant is in progress"""
+        with self._lock:
+            return audio_path(self.directory, job_id, audio_format) in self._pending
@@ -0,0 +1,361 @@
+"""
+Throughput, memory and allocation benchmarks of the DSP hot path, with JSON baselines.
+
+Runs PaulStretch engines and post-processing (process_audio_array / process_audio)
+over a matrix of inputs (synthetic noise and tones, samples/breakfill.wav,
+samples/Preprocess.wav), mono and stereo, stretch factors, time resolutions and
+output lengths. Every case is warmed up once, then timed --repeat times (the best
+run counts) and run once more under tracemalloc. Each case reports:
+
+- throughput: seconds of output audio per second of wall time (higher is better)
+- peak_traced_mb: peak memory traced by tracemalloc (Python and NumPy allocations)
+  above what was allocated before the run
+- retained_blocks: memory blocks still allocated after the run (sys.getallocatedblocks()),
+  which grows when a change starts leaking or caching per call
+
+Inputs are generated from fixed seeds and the renders are seeded, so runs are
+repeatable and need nothing but the bundled samples (no network, no GPU).
+
+With --save-baseline the results are written as a JSON baseline. Otherwise they are
+compared with the suite's baseline (benchmarks/baselines/dsp-<suite>.json, or
+--baseline), and the script exits non-zero if any case lost more than --threshold of
+its throughput or grew its peak memory or retained blocks by more than
+--memory-threshold. Throughput depends on the machine, so record a baseline on the
+box the comparison runs on; the recorded machine is printed when it differs.
+
+Run from the backend directory:
+    python benchmarks/bench_dsp.py
+    python benchmarks/bench_dsp.py --suite full --save-baseline
+    python benchmarks/bench_dsp.py --filter paulstretch/breakfill --repeat 5
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+import soundfile as sf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+sys.path.insert(0, BACKEND_DIR)
+from dsp import PAULSTRETCH_ENGINES, _load_background, process_audio, process_audio_array
+
+SAMPLE_RATE = 24000
+SYNTHETIC_SECONDS = 20
+SEED = 1234
+# Bundled inputs, loaded at SAMPLE_RATE
+SAMPLES = {
+    'breakfill': "samples/breakfill.wav",
+    'preprocess': "samples/Preprocess.wav",
+}
+# Peak memory and retained blocks below these are noise, not regressions
+MEMORY_SLACK_MB = 1.0
+BLOCKS_SLACK = 500
+
+
+def paulstretch_case(source, channels, stretch, time_resolution, seconds, engine="batched"):
+    return {
+        'id': f"paulstretch/{engine}/{source}/{'stereo' if channels == 2 else 'mono'}/"
+              f"x{stretch:g}/t{time_resolution:g}/{seconds:g}s",
+        'kind': 'paulstretch', 'engine': engine, 'source': source, 'channels': channels,
+        'stretch': stretch, 'time_resolution': time_resolution, 'seconds': seconds,
+    }
+
+
+def process_case(mode, background, channels, time_resolution, seconds):
+    return {
+        'id': f"process/{mode}/{background}/{'stereo' if channels == 2 else 'mono'}/"
+              f"t{time_resolution:g}/{seconds:g}s",
+        'kind': 'process', 'mode': mode, 'background': background, 'channels': channels,
+        'time_resolution': time_resolution, 'seconds': seconds,
+    }
+
+
+def quick_suite():
+    """Under a minute on one core: each dimension varied around a 5 minute batched render"""
+    return [
+        paulstretch_case('synthetic', 1, 8, 0.25, 300),
+        paulstretch_case('synthetic', 1, 2, 0.25, 300),
+        paulstretch_case('synthetic', 1, 32, 0.25, 300),
+        paulstretch_case('synthetic', 1, 8, 0.125, 300),
+        paulstretch_case('synthetic', 1, 8, 0.5, 300),
+        paulstretch_case('synthetic', 2, 8, 0.25, 300),
+        paulstretch_case('synthetic', 1, 8, 0.25, 1200),
+        paulstretch_case('breakfill', 1, 8, 0.25, 300),
+        paulstretch_case('breakfill', 2, 8, 0.25, 300),
+        paulstretch_case('preprocess', 1, 4, 0.25, 300),
+        process_case('array', 'breakfill', 1, 0.25, 300),
+        process_case('array', 'breakfill', 2, 0.25, 300),
+        process_case('array', 'synthetic', 1, 0.25, 300),
+        process_case('file', 'breakfill', 1, 0.25, 300),
+        process_case('streaming', 'breakfill', 1, 0.25, 300),
+    ]
+
+
+def full_suite():
+    """The quick suite plus the full stretch/resolution/layout matrix, long outputs and the classic engine"""
+    cases = quick_suite()
+    for source in ('synthetic', 'breakfill', 'preprocess'):
+        for channels in (1, 2):
+            for stretch in (2, 4, 8, 16, 32):
+                for time_resolution in (0.125, 0.25, 0.5):
+                    cases.append(paulstretch_case(source, channels, stretch, time_resolution, 300))
+    for seconds in (1200, 2400):
+        cases.append(paulstretch_case('breakfill', 1, 8, 0.25, seconds))
+        cases.append(paulstretch_case('breakfill', 2, 8, 0.25, seconds))
+    for channels in (1, 2):
+        cases.append(paulstretch_case('breakfill', channels, 8, 0.25, 120, engine="classic"))
+    for mode in ('array', 'file', 'streaming'):
+        for channels in (1, 2):
+            for time_resolution in (0.125, 0.25, 0.5):
+                cases.append(process_case(mode, 'breakfill', channels, time_resolution, 300))
+    for mode in ('array', 'streaming'):
+        cases.append(process_case(mode, 'preprocess', 1, 0.25, 2400))
+    unique = {}
+    for case in cases:
+        unique.setdefault(case['id'], case)
+    return list(unique.values())
+
+
+SUITES = {'quick': quick_suite, 'full': full_suite}
+
+
+def synthetic_background(seconds, seed=SEED):
+    """Noise with a 1/f-ish tilt under a few slowly beating partials, like an ambient bed"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    spectrum /= np.sqrt(np.maximum(np.arange(len(spectrum)), 1))
+    audio = np.fft.irfft(spectrum, n)
+    t = np.arange(n) / SAMPLE_RATE
+    for frequency in (110.0, 165.0, 220.5, 330.0):
+        audio += 0.02 * np.sin(2 * np.pi * frequency * t) * (1 + 0.5 * np.sin(2 * np.pi * 0.1 * t))
+    return (0.5 * audio / np.max(np.abs(audio))).astype(np.float32)
+
+
+def synthetic_voice(seconds, channels, seed=SEED):
+    """Voice-like test track: pitched, amplitude-modulated tones broken up by pauses"""
+    rng = np.random.default_rng(seed + 1)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    pitch = 140 + 20 * np.sin(2 * np.pi * 0.3 * t)
+    voice = np.sin(2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    voice *= np.repeat(rng.random(-(-n // SAMPLE_RATE)) > 0.2, SAMPLE_RATE)[:n]
+    voice = (0.3 * voice).astype(np.float32)
+    return to_channels(voice, channels)
+
+
+def to_channels(audio, channels):
+    """Mono as is, or stereo with a slightly delayed right channel so the channels differ"""
+    if channels == 1:
+        return audio
+    return np.column_stack((audio, np.roll(audio, int(0.011 * SAMPLE_RATE))))
+
+
+class Inputs:
+    """Source audio for the cases, loaded or generated once, and background files for process_audio"""
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self._sources = {}
+
+    def source(self, name):
+        if name not in self._sources:
+            if name == 'synthetic':
+                self._sources[name] = synthetic_background(SYNTHETIC_SECONDS)
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    audio = _load_background(os.path.join(BACKEND_DIR, SAMPLES[name]), SAMPLE_RATE)
+                self._sources[name] = audio.astype(np.float32)
+        return self._sources[name]
+
+    def paulstretch_input(self, case):
+        """The source, tiled or trimmed so that stretching it by the case's factor gives its output length"""
+        length = int(case['seconds'] * SAMPLE_RATE / case['stretch'])
+        return to_channels(np.resize(self.source(case['source']), length), case['channels'])
+
+    def background_path(self, name):
+        if name in SAMPLES:
+            return os.path.join(BACKEND_DIR, SAMPLES[name])
+        path = os.path.join(self.work_dir, f"{name}.wav")
+        if not os.path.exists(path):
+            sf.write(path, self.source(name), SAMPLE_RATE)
+        return path
+
+    def voice_path(self, channels, seconds):
+        path = os.path.join(self.work_dir, f"voice-{channels}-{seconds:g}.wav")
+        if not os.path.exists(path):
+            sf.write(path, synthetic_voice(seconds, channels), SAMPLE_RATE)
+        return path
+
+
+def make_runner(case, inputs):
+    """Callable running the case once (inputs prepared up front, so only the DSP is measured)"""
+    if case['kind'] == 'paulstretch':
+        audio = inputs.paulstretch_input(case)
+        engine = PAULSTRETCH_ENGINES[case['engine']]
+        if case['engine'] == "classic":
+            def run():
+                np.random.seed(SEED)
+                engine(SAMPLE_RATE, audio, case['stretch'], case['time_resolution'])
+        else:
+            def run():
+                engine(SAMPLE_RATE, audio, case['stretch'], case['time_resolution'], seed=SEED)
+        return run
+
+    background = inputs.background_path(case['background'])
+    output_path = os.path.join(inputs.work_dir, "out.wav")
+    if case['mode'] == 'array':
+        voice = synthetic_voice(case['seconds'], case['channels'])
+
+        def run():
+            process_audio_array(voice, SAMPLE_RATE, background, output_path, case['time_resolution'])
+        return run
+    voice_path = inputs.voice_path(case['channels'], case['seconds'])
+
+    def run():
+        process_audio(voice_path, background, output_path, case['time_resolution'],
+                      streaming=case['mode'] == 'streaming')
+    return run
+
+
+def measure(case, inputs, repeat):
+    """Throughput, peak traced memory and retained blocks of one case"""
+    run = make_runner(case, inputs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up: lazily imported modules, FFT plans and other per-process caches
+        run()
+        timings = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+
+        gc.collect()
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.start()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1] - traced_before
+        finally:
+            tracemalloc.stop()
+        gc.collect()
+        retained = sys.getallocatedblocks() - blocks_before
+
+    seconds = min(timings)
+    return {
+        'audio_seconds': case['seconds'],
+        'seconds': round(seconds, 4),
+        'throughput': round(case['seconds'] / seconds, 2),
+        'peak_traced_mb': round(peak / 1024 / 1024, 2),
+        'retained_blocks': retained,
+    }
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+
+
+def regressions(result, baseline, threshold, memory_threshold):
+    """Descriptions of the ways result is worse than baseline beyond the thresholds"""
+    problems = []
+    if result['throughput'] < baseline['throughput'] * (1 - threshold):
+        problems.append(f"throughput {result['throughput']:.1f} < {baseline['throughput']:.1f} "
+                        f"(-{1 - result['throughput'] / baseline['throughput']:.0%})")
+    if result['peak_traced_mb'] > baseline['peak_traced_mb'] * (1 + memory_threshold) + MEMORY_SLACK_MB:
+        problems.append(f"peak {result['peak_traced_mb']:.1f} MB > {baseline['peak_traced_mb']:.1f} MB")
+    if result['retained_blocks'] > baseline['retained_blocks'] * (1 + memory_threshold) + BLOCKS_SLACK:
+        problems.append(f"retained blocks {result['retained_blocks']} > {baseline['retained_blocks']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PaulStretch and process_audio against JSON baselines")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick", help="Case matrix to run")
+    parser.add_argument("--filter", "-k", default=None, help="Only run cases whose id contains this")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Timed runs per case (best time is reported)")
+    parser.add_argument("--baseline", default=None,
+                        help="Baseline JSON to compare with or save to (default baselines/dsp-<suite>.json)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write the results as the baseline instead of comparing")
+    parser.add_argument("--output", "-o", default=None, help="Also write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fail if a case loses more than this fraction of its baseline throughput")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="Fail if a case's peak memory or retained blocks grow by more than this fraction")
+    args = parser.parse_args()
+
+    cases = SUITES[args.suite]()
+    if args.filter:
+        cases = [case for case in cases if args.filter in case['id']]
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"dsp-{args.suite}.json")
+    baseline = None
+    if not args.save_baseline and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline['machine'] != machine_info():
+            print(f"Baseline was recorded on a different machine: {baseline['machine']}")
+
+    print(f"{len(cases)} cases, {args.repeat} timed runs each, {os.cpu_count()} CPUs")
+    print(f"{'case':<56} {'audio s/s':>10} {'peak MB':>8} {'blocks':>7}")
+    results = {}
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        inputs = Inputs(work_dir)
+        for case in cases:
+            result = measure(case, inputs, args.repeat)
+            results[case['id']] = result
+            line = (f"{case['id']:<56} {result['throughput']:>10.1f} {result['peak_traced_mb']:>8.1f} "
+                    f"{result['retained_blocks']:>7}")
+            reference = (baseline or {}).get('cases', {}).get(case['id'])
+            if reference is not None:
+                problems = regressions(result, reference, args.threshold, args.memory_threshold)
+                line += f"  ({result['throughput'] / reference['throughput']:.2f}x baseline)"
+                if problems:
+                    line += "  REGRESSION: " + "; ".join(problems)
+                    failed = True
+            print(line)
+
+    report = {'suite': args.suite, 'repeat': args.repeat, 'machine': machine_info(), 'cases': results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        if args.filter and os.path.exists(baseline_path):
+            # Update only the cases that ran
+            with open(baseline_path) as f:
+                previous = json.load(f)
+            report['cases'] = dict(previous['cases'], **results)
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+    elif baseline is None:
+        print(f"No baseline at {baseline_path}; record one with --save-baseline")
+    else:
+        missing = [case['id'] for case in cases if case['id'] not in baseline['cases']]
+        if missing:
+            print(f"{len(missing)} cases have no baseline yet (add them with --save-baseline --filter ...)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Peak memory (RSS) of post-processing one meditation.
+
+Each measurement runs process_audio in a fresh child process on a synthetic voice
+track of the given length, once rendering the background from scratch and once
+from a background cache warmed by another process, and reports the child's peak
+RSS above its RSS after a short warm-up job. With --max-mb the script exits
+non-zero if any run exceeds the budget, so it can guard against memory regressions.
+With --streaming, process_audio runs in its bounded-memory streaming mode, whose
+peak should not grow with --minutes.
+
+Run from the backend directory:
+    python benchmarks/bench_memory.py --minutes 20 --max-mb 1024
+    python benchmarks/bench_memory.py --minutes 60 --streaming
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def child(args):
+    """Prepare (--prepare) or measure one process_audio run in this fresh process"""
+    sys.path.insert(0, BACKEND_DIR)
+    import numpy as np
+    import soundfile as sf
+
+    from bg_cache import StretchedBackgroundCache
+    from dsp import process_audio
+
+    voice_path = os.path.join(args.work_dir, "voice.wav")
+    bg_cache = StretchedBackgroundCache(os.path.join(args.work_dir, "backgrounds")) if args.cached else None
+
+    if args.prepare:
+        sr = args.sr
+        with sf.SoundFile(voice_path, "w", sr, 1, subtype="PCM_16") as f:
+            for start in range(0, int(args.minutes * 60 * sr), sr * 10):
+                f.write(0.1 * np.sin(np.arange(start, start + sr * 10) * 0.01))
+        if bg_cache is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                process_audio(voice_path, args.background, os.path.join(args.work_dir, "warm.wav"),
+                              stretch_engine=args.engine, bg_cache=bg_cache, streaming=args.streaming)
+        return
+
+    # A short job first, so lazily imported and JIT-compiled code (loaded once per
+    # server process) does not count towards the job
+    warmup_path = os.path.join(args.work_dir, "warmup.wav")
+    sf.write(warmup_path, np.zeros(args.sr * 10, dtype=np.float32), args.sr)
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_audio(warmup_path, args.background, os.path.join(args.work_dir, "warmup-out.wav"),
+                      stretch_engine=args.engine, streaming=args.streaming)
+
+    baseline = current_rss_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        process_audio(voice_path, args.background, os.path.join(args.work_dir, "out.wav"),
+                      stretch_engine=args.engine, bg_cache=bg_cache, streaming=args.streaming)
+    print(json.dumps({'baseline_mb': baseline, 'peak_mb': peak_rss_mb()}))
+
+
+def measure(args, cached):
+    """Peak RSS above baseline (MB) of one run in a fresh process"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--work-dir", work_dir,
+                   "--minutes", str(args.minutes), "--sr", str(args.sr), "--background", args.background,
+                   "--engine", args.engine]
+        if cached:
+            command.append("--cached")
+        if args.streaming:
+            command.append("--streaming")
+        subprocess.run(command + ["--prepare"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+        result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    result = json.loads(result.stdout.strip().splitlines()[-1])
+    return result['peak_mb'] - result['baseline_mb']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS of process_audio")
+    parser.add_argument("--background", "-b", default="samples/breakfill.wav", help="Background audio to stretch")
+    parser.add_argument("--minutes", "-m", type=float, default=20.0, help="Voice track length in minutes")
+    parser.add_argument("--sr", type=int, default=24000, help="Voice sample rate")
+    parser.add_argument("--engine", default="batched", help="PaulStretch engine")
+    parser.add_argument("--streaming", action="store_true", help="Measure the streaming mode of process_audio")
+    parser.add_argument("--max-mb", type=float, default=None, help="Fail if a run's peak exceeds this many MB")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cached", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    voice_mb = args.minutes * 60 * args.sr * 4 / 1024 / 1024
+    print(f"{args.minutes} minute voice track at {args.sr}Hz ({voice_mb:.0f} MB as float32), engine {args.engine}"
+          f"{', streaming' if args.streaming else ''}")
+    failed = False
+    for cached in (False, True):
+        used = measure(args, cached)
+        label = "cached background" if cached else "rendered background"
+        print(f"{label:>20}: peak {used:.0f} MB above baseline ({used / voice_mb:.1f}x the voice track)")
+        if args.max_mb is not None and used > args.max_mb:
+            print(f"  exceeds the {args.max_mb:.0f} MB budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
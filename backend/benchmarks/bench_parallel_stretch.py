@@ -0,0 +1,73 @@
+"""
+Scaling of the multi-process PaulStretch engine with the number of worker processes.
+
+Stretches samples/breakfill.wav to a meditation-sized length with the batched engine
+and with paulstretch_parallel at increasing worker counts, reports wall time and
+speedup, and checks that every parallel render matches the single-process render
+with the same seed (so the segment seams are exact).
+
+Run from the backend directory:
+    python benchmarks/bench_parallel_stretch.py --minutes 20
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dsp import PAULSTRETCH_SEGMENTS_PER_WORKER, paulstretch_batched, paulstretch_parallel
+from dsp_pool import new_process_pool
+
+
+def timed(func):
+    """Run func with its progress output silenced, returning (seconds, output)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = func()
+    return time.perf_counter() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-process PaulStretch scaling")
+    parser.add_argument("--background", "-b", default="samples/breakfill.wav", help="Background audio to stretch")
+    parser.add_argument("--minutes", "-m", type=float, default=20.0, help="Target output length in minutes")
+    parser.add_argument("--time-resolution", "-t", type=float, default=0.25, help="PaulStretch window size in seconds")
+    parser.add_argument("--workers", "-w", type=int, nargs="+", default=None,
+                        help="Worker counts to test (default: powers of two up to the CPU count)")
+    parser.add_argument("--seed", type=int, default=1234, help="Phase seed shared by all renders")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)})
+
+    audio, sr = librosa.load(args.background, sr=None)
+    stretch = args.minutes * 60 * sr / len(audio)
+    print(f"Background: {args.background} ({len(audio) / sr:.1f}s at {sr}Hz), target {args.minutes} minutes, "
+          f"{cpus} CPUs")
+
+    serial_time, serial_output = timed(
+        lambda: paulstretch_batched(sr, audio, stretch, args.time_resolution, seed=args.seed))
+    print(f" batched: {serial_time:.2f}s")
+
+    for count in workers:
+        executor = new_process_pool(count)
+        try:
+            # Start the workers before timing
+            list(executor.map(abs, range(count)))
+            elapsed, output = timed(lambda: paulstretch_parallel(
+                sr, audio, stretch, args.time_resolution, executor=executor,
+                segments=count * PAULSTRETCH_SEGMENTS_PER_WORKER, seed=args.seed))
+        finally:
+            executor.shutdown()
+        difference = np.max(np.abs(output - serial_output))
+        print(f"{count:>2} workers: {elapsed:.2f}s (speedup {serial_time / elapsed:.2f}x, "
+              f"efficiency {serial_time / elapsed / count:.0%}), max difference to batched {difference:.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Speed comparison between the classic and frame-batched PaulStretch engines.
+
+Stretches samples/breakfill.wav to a meditation-sized length with both engines,
+reports wall time and speedup, and checks that the two outputs are statistically
+equivalent: the script exits non-zero if their overall RMS differs by more than
+--rms-tolerance or the energy in any of 32 spectral bands by more than
+--band-tolerance (relative to the classic engine). The phases are random, so the
+two never match sample for sample; they typically agree within a few percent.
+
+Run from the backend directory:
+    python benchmarks/bench_paulstretch.py --minutes 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dsp import PAULSTRETCH_ENGINES
+
+
+def band_energies(audio, num_bands=32):
+    """Mean spectral power in num_bands equal-width bands (mono mixdown)"""
+    if len(audio.shape) > 1:
+        audio = np.mean(audio, axis=1)
+    power = np.abs(np.fft.rfft(audio)) ** 2
+    return np.array([band.mean() for band in np.array_split(power, num_bands)])
+
+
+def run_engine(name, sr, audio, stretch, time_resolution):
+    """Run one engine with its progress output silenced, returning (seconds, output)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = PAULSTRETCH_ENGINES[name](sr, audio.copy(), stretch, time_resolution)
+    return time.perf_counter() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PaulStretch engines")
+    parser.add_argument("--background", "-b", default="samples/breakfill.wav", help="Background audio to stretch")
+    parser.add_argument("--minutes", "-m", type=float, default=5.0, help="Target output length in minutes")
+    parser.add_argument("--time-resolution", "-t", type=float, default=0.25, help="PaulStretch window size in seconds")
+    parser.add_argument("--stereo", action="store_true", help="Duplicate the background into two channels")
+    parser.add_argument("--repeat", "-r", type=int, default=1, help="Runs per engine (best time is reported)")
+    parser.add_argument("--rms-tolerance", type=float, default=0.05,
+                        help="Fail if the batched output's RMS differs from the classic one's by more than this fraction")
+    parser.add_argument("--band-tolerance", type=float, default=0.10,
+                        help="Fail if any band's energy differs from the classic one's by more than this fraction")
+    args = parser.parse_args()
+
+    audio, sr = librosa.load(args.background, sr=None)
+    if args.stereo:
+        audio = np.column_stack((audio, audio))
+    stretch = args.minutes * 60 * sr / len(audio)
+
+    print(f"Background: {args.background} ({len(audio) / sr:.1f}s at {sr}Hz, {'stereo' if args.stereo else 'mono'})")
+    print(f"Target: {args.minutes} minutes (stretch factor {stretch:.2f}), time resolution {args.time_resolution}s")
+
+    results = {}
+    for name in ("classic", "batched"):
+        timings = []
+        for _ in range(args.repeat):
+            elapsed, output = run_engine(name, sr, audio, stretch, args.time_resolution)
+            timings.append(elapsed)
+        results[name] = (min(timings), output)
+        print(f"{name:>8}: {min(timings):.2f}s ({args.minutes * 60 / min(timings):.1f} seconds of audio per second)")
+
+    classic_time, classic_output = results["classic"]
+    batched_time, batched_output = results["batched"]
+    print(f" speedup: {classic_time / batched_time:.2f}x")
+
+    classic_rms = np.sqrt(np.mean(classic_output ** 2))
+    batched_rms = np.sqrt(np.mean(batched_output ** 2))
+    band_ratio = band_energies(batched_output) / np.maximum(band_energies(classic_output), 1e-20)
+    print(f"RMS classic={classic_rms:.5f} batched={batched_rms:.5f}")
+    print(f"Band energy ratio batched/classic: min={band_ratio.min():.3f} max={band_ratio.max():.3f}")
+
+    failed = False
+    if abs(batched_rms / classic_rms - 1) > args.rms_tolerance:
+        print(f"  RMS differs by more than {args.rms_tolerance:.0%}")
+        failed = True
+    if np.abs(band_ratio - 1).max() > args.band_tolerance:
+        print(f"  band energy differs by more than {args.band_tolerance:.0%}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
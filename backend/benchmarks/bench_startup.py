@@ -0,0 +1,105 @@
+"""
+Time from launching the API server to answering health and readiness probes.
+
+Starts server.py in a child process on a free port and polls /api/health and
+/api/ready, reporting how long after launch each first answered 200 and, for the
+readiness probe, how long each warmup component took. Heavy dependencies are
+imported and warmed up on a background thread, so the health check should answer
+within about a second however long the warmup takes. With --max-health-seconds
+(and --max-ready-seconds) the script exits non-zero if a probe answers too late,
+so it can guard against startup regressions. Extra arguments after -- are passed
+to the server.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py --max-health-seconds 2
+    python benchmarks/bench_startup.py --ready-timeout 300 -- --no-ollama-warmup
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def probe(url):
+    """(HTTP status, JSON body) of a GET, or (None, None) if the server is not listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError):
+        return None, None
+
+
+def wait_for(url, start, timeout, interval):
+    """Seconds after start at which url first answered 200 (None on timeout), and its last body"""
+    body = None
+    while time.perf_counter() - start < timeout:
+        status, body = probe(url)
+        if status == 200:
+            return time.perf_counter() - start, body
+        time.sleep(interval)
+    return None, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API server startup time")
+    parser.add_argument("--health-timeout", type=float, default=60.0, help="Seconds to wait for /api/health")
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="Seconds to wait for /api/ready")
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between probes")
+    parser.add_argument("--max-health-seconds", type=float, default=None,
+                        help="Fail if /api/health answers later than this")
+    parser.add_argument("--max-ready-seconds", type=float, default=None,
+                        help="Fail if /api/ready answers later than this (or not at all)")
+    parser.add_argument("server_args", nargs="*", help="Extra server arguments (after --)")
+    args = parser.parse_args()
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "server.py", "--port", str(port), "--job-store", "memory"] + args.server_args
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    failed = False
+    try:
+        health_seconds, _ = wait_for(base + "/api/health", start, args.health_timeout, args.interval)
+        if health_seconds is None:
+            print(f"/api/health did not answer within {args.health_timeout:.0f}s")
+            sys.exit(1)
+        print(f"/api/health answered {health_seconds:.2f}s after launch")
+        if args.max_health_seconds is not None and health_seconds > args.max_health_seconds:
+            print(f"  later than the {args.max_health_seconds:.1f}s budget")
+            failed = True
+
+        ready_seconds, status = wait_for(base + "/api/ready", start, args.ready_timeout, args.interval)
+        if ready_seconds is None:
+            print(f"/api/ready did not answer 200 within {args.ready_timeout:.0f}s")
+        else:
+            print(f"/api/ready answered {ready_seconds:.2f}s after launch")
+        for name, component in (status or {}).get('components', {}).items():
+            seconds = f"{component['seconds']:.2f}s" if component['seconds'] is not None else "-"
+            error = f" ({component['error']})" if component['error'] else ""
+            print(f"{name:>20}: {component['status']:<8} {seconds}{error}")
+        if args.max_ready_seconds is not None and (ready_seconds is None or ready_seconds > args.max_ready_seconds):
+            print(f"  not ready within the {args.max_ready_seconds:.1f}s budget")
+            failed = True
+    finally:
+        server.terminate()
+        server.wait()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+from bg_cache import StretchedBackgroundCache
+
+# Default location, length and size limit of pre-rendered ambient beds
+BED_DIR = "cache/beds"
+BED_SECONDS = 600.0
+BED_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+class AmbientBedLibrary:
+    """
+    Pre-rendered ambient beds, looped to any length.
+
+    Rendering the background for each job's exact length costs a full PaulStretch
+    render per job. Instead, one long bed is rendered per background, sample rate and
+    time_resolution, and a job's background is the start of the bed or, for jobs longer
+    than the bed, the bed crossfade-looped at low-spectral-flux loop points
+    (dsp.bed_loop_points()). Per job that is a copy of the needed samples.
+
+    Beds are stored like stretched backgrounds (a StretchedBackgroundCache in bed_dir,
+    whose length quantum is the bed length); the loop points of each bed are kept in
+    a JSON file next to it.
+
+    Parameters:
+    - bed_dir: directory holding the beds
+    - bed_seconds: length beds are rendered at
+    - max_bytes: total size cap for all beds
+    """
+
+    def __init__(self, bed_dir=BED_DIR, bed_seconds=BED_SECONDS, max_bytes=BED_MAX_BYTES):
+        self.bed_seconds = bed_seconds
+        self.beds = StretchedBackgroundCache(bed_dir, max_bytes=max_bytes, quantum_seconds=bed_seconds,
+                                             max_overshoot=float("inf"))
+        self._lock = threading.Lock()
+        self._loop_points = {}
+
+    def loop_points(self, bed, sr):
+        """Loop points of a bed memory-mapped from the library, computed once and stored beside it"""
+        from dsp import bed_loop_points
+
+        path = bed.filename
+        # A new render replaces the file, so the inode identifies it (the mtime is touched on every use)
+        st = os.stat(path)
+        render_id = [st.st_ino, st.st_size]
+        memo_key = (path, *render_id)
+        with self._lock:
+            if memo_key in self._loop_points:
+                return self._loop_points[memo_key]
+
+        loop_path = os.path.splitext(path)[0] + ".loop.json"
+        try:
+            with open(loop_path) as f:
+                loop = json.load(f)
+            if loop['render'] != render_id:
+                raise ValueError("loop points of an earlier render")
+            points = (loop['loop_start'], loop['loop_end'])
+        except (OSError, ValueError, KeyError):
+            points = bed_loop_points(bed, sr)
+            with open(loop_path, "w") as f:
+                json.dump({'loop_start': points[0], 'loop_end': points[1], 'render': render_id}, f)
+            print(f"Ambient bed loop points: {points[0] / sr:.1f}s to {points[1] / sr:.1f}s")
+        with self._lock:
+            self._loop_points[memo_key] = points
+        return points
+
+    def prepare(self, background_path, sr, time_resolution, render=None):
+        """
+        Render (if needed) a background's bed and find its loop points ahead of the first job.
+
+        Parameters:
+        - background_path, sr, time_resolution: identify the bed
+        - render: callable(length) rendering a bed of that length if there is none yet, as for
+          StretchedBackgroundCache.get_or_render() (the batched engine in this thread if None)
+
+        Returns:
+        - (bed, loop_start, loop_end), the bed memory-mapped
+        """
+        if render is None:
+            from dsp import _stretch_background
+            render = lambda length: _stretch_background(background_path, sr, length, time_resolution)
+        bed = self.beds.get_or_render(background_path, sr, time_resolution, self.beds.quantize_length(1, sr), render)
+        return (bed,) + self.loop_points(bed, sr)
+
+    def background(self, background_path, sr, time_resolution, length, render=None):
+        """
+        Ambient background of exactly length samples from the background's bed.
+
+        Parameters:
+        - background_path, sr, time_resolution, render: as for prepare()
+        - length: required length in samples
+
+        Returns:
+        - (shape, blocks) as from dsp.loop_bed()
+        """
+        from dsp import loop_bed
+
+        bed, loop_start, loop_end = self.prepare(background_path, sr, time_resolution, render)
+        if length <= len(bed):
+            return loop_bed(bed, 0, len(bed), length, sr)
+        return loop_bed(bed, loop_start, loop_end, length, sr)
+
+    def stats(self):
+        return self.beds.stats()
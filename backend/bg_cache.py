@@ -0,0 +1,213 @@
+import glob
+import hashlib
+import math
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# Default location and limits for stretched background renders
+BACKGROUND_CACHE_DIR = "cache/backgrounds"
+BACKGROUND_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+BACKGROUND_CACHE_QUANTUM_SECONDS = 60.0  # Target lengths are rounded up to this
+BACKGROUND_CACHE_MAX_OVERSHOOT = 1.5  # Longest cached render (relative to target) we will trim
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Return the hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class StretchedBackgroundCache:
+    """
+    Disk-backed, content-addressed cache of stretched ambient backgrounds.
+
+    Entries are plain float32 .npy files named after the background file hash,
+    sample rate, time_resolution and a quantized target length, so they can be
+    loaded (memory-mapped) directly. Least recently used entries are evicted once
+    the cache exceeds max_bytes; file modification times serve as the LRU clock.
+    A new render is never evicted by its own store, so one larger than max_bytes is
+    still served and only makes way for the next.
+
+    Parameters:
+    - cache_dir: directory holding the .npy renders
+    - max_bytes: total size cap for all entries
+    - quantum_seconds: target lengths are rounded up to a multiple of this, so
+      jobs of similar length share one render
+    - max_overshoot: a cached render up to this many times longer than the target
+      is trimmed and reused instead of rendering a new one
+    """
+
+    def __init__(self, cache_dir=BACKGROUND_CACHE_DIR, max_bytes=BACKGROUND_CACHE_MAX_BYTES,
+                 quantum_seconds=BACKGROUND_CACHE_QUANTUM_SECONDS, max_overshoot=BACKGROUND_CACHE_MAX_OVERSHOOT):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quantum_seconds = quantum_seconds
+        self.max_overshoot = max_overshoot
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._render_locks = {}
+        self._file_hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def background_hash(self, background_path):
+        """Content hash of a background file, memoized on (path, size, mtime)"""
+        st = os.stat(background_path)
+        memo_key = (os.path.abspath(background_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+        digest = file_sha256(background_path)
+        with self._lock:
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def quantize_length(self, target_length, sr):
+        """Round a target length in samples up to the cache quantum"""
+        quantum = max(1, int(self.quantum_seconds * sr))
+        return int(math.ceil(target_length / quantum)) * quantum
+
+    def _prefix(self, bg_hash, sr, time_resolution):
+        return f"{bg_hash[:32]}-{sr}hz-{time_resolution:g}s-"
+
+    def _entry_path(self, prefix, length):
+        return os.path.join(self.cache_dir, f"{prefix}{length}.npy")
+
+    def _find(self, prefix, target_length):
+        """Path of the shortest cached render covering target_length, or None"""
+        best_length = None
+        for path in glob.glob(os.path.join(self.cache_dir, glob.escape(prefix) + "*.npy")):
+            try:
+                length = int(os.path.basename(path)[len(prefix):-len(".npy")])
+            except ValueError:
+                continue
+            if target_length <= length <= target_length * self.max_overshoot:
+                if best_length is None or length < best_length:
+                    best_length = length
+        return None if best_length is None else self._entry_path(prefix, best_length)
+
+    def _load(self, path):
+        try:
+            audio = np.load(path, mmap_mode="r")
+            os.utime(path)  # Mark as recently used
+            return audio
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, path, audio):
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy.tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(audio, tuple):
+                    self._write_blocks(f, *audio)
+                else:
+                    np.save(f, np.asarray(audio, dtype=np.float32))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _write_blocks(self, f, shape, blocks):
+        """Write a streamed render as an .npy file without holding it in memory"""
+        np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(np.float32).str, 'fortran_order': False,
+                                                 'shape': tuple(shape)})
+        written = 0
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=np.float32)
+            f.write(block.data)
+            written += block.size
+        if written != math.prod(shape):
+            raise RuntimeError(f"Streamed background has {written} samples, expected shape {shape}")
+
+    def get_or_render(self, background_path, sr, time_resolution, target_length, render):
+        """
+        Return a stretched background at least target_length samples long.
+
+        Parameters:
+        - background_path: background audio file (hashed for the cache key)
+        - sr: sample rate of the render
+        - time_resolution: PaulStretch window size in seconds
+        - target_length: required length in samples
+        - render: callable(length) that renders the background at that length on a miss,
+          returning an array or, to store it without holding it in memory, a
+          (shape, blocks) pair as from dsp.paulstretch_stream()
+
+        Returns:
+        - float32 array (memory-mapped from disk) that may be longer than target_length
+        """
+        prefix = self._prefix(self.background_hash(background_path), sr, time_resolution)
+        with self._lock:
+            render_lock = self._render_locks.setdefault(prefix, threading.Lock())
+
+        # Serialize renders of the same background so concurrent jobs share one result
+        with render_lock:
+            path = self._find(prefix, target_length)
+            audio = self._load(path) if path else None
+            if audio is not None:
+                with self._lock:
+                    self.hits += 1
+                print(f"Background cache hit: {os.path.basename(path)} ({self.format_stats()})")
+                return audio
+
+            with self._lock:
+                self.misses += 1
+            quantized_length = self.quantize_length(target_length, sr)
+            print(f"Background cache miss, rendering {quantized_length} samples ({self.format_stats()})")
+            path = self._entry_path(prefix, quantized_length)
+            self._store(path, render(quantized_length))
+            audio = self._load(path)
+            if audio is None:
+                raise RuntimeError(f"Could not read back cached background: {path}")
+            # Evict only once the render is mapped, and never the render itself
+            self.evict(keep=path)
+            return audio
+
+    def entries(self):
+        """List (path, size, mtime) for every cached render, oldest first"""
+        result = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npy")):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((path, st.st_size, st.st_mtime))
+        return sorted(result, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """Delete least recently used renders, other than keep, until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                print(f"Evicted cached background: {os.path.basename(path)}")
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Hit/miss counters and current disk usage"""
+        entries = self.entries()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return f"hits={stats['hits']}, misses={stats['misses']}, entries={stats['entries']}"
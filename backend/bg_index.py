@@ -0,0 +1,157 @@
+import glob
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from bg_cache import file_sha256
+
+# Default location of precomputed background analyses
+BACKGROUND_INDEX_DIR = "cache/background_index"
+
+class BackgroundIndex:
+    """
+    Disk-backed index of analyzed ambient backgrounds.
+
+    PaulStretch windows and FFTs the same background frames, and recomputes the same
+    onset values, for every render; only the stretch factor differs between jobs. The
+    index stores that analysis (dsp.paulstretch_analyze()) once per background file
+    hash, sample rate and time_resolution: the frame spectra and onsets as .npy files
+    that are memory-mapped on use, plus a small JSON file with the remaining fields,
+    written last so an entry is only visible once complete. Renders from the index
+    neither load nor resample the background.
+
+    Parameters:
+    - index_dir: directory holding the entries
+    """
+
+    def __init__(self, index_dir=BACKGROUND_INDEX_DIR):
+        self.index_dir = index_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._file_hashes = {}
+        os.makedirs(index_dir, exist_ok=True)
+
+    def background_hash(self, background_path):
+        """Content hash of a background file, memoized on (path, size, mtime)"""
+        st = os.stat(background_path)
+        memo_key = (os.path.abspath(background_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+        digest = file_sha256(background_path)
+        with self._lock:
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def _prefix(self, bg_hash, sr, time_resolution):
+        return os.path.join(self.index_dir, f"{bg_hash[:32]}-{sr}hz-{time_resolution:g}s")
+
+    def _load(self, prefix):
+        try:
+            with open(prefix + ".json") as f:
+                meta = json.load(f)
+            return {
+                'spectra': np.load(prefix + "-spectra.npy", mmap_mode="r"),
+                'onsets': np.load(prefix + "-onsets.npy"),
+                'nsamples': meta['nsamples'],
+                'windowsize': meta['windowsize'],
+                'input_is_mono': meta['input_is_mono'],
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.index_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _store(self, prefix, analysis):
+        self._write(prefix + "-spectra.npy", lambda f: np.save(f, analysis['spectra']))
+        self._write(prefix + "-onsets.npy", lambda f: np.save(f, analysis['onsets']))
+        meta = {
+            'nsamples': int(analysis['nsamples']),
+            'windowsize': int(analysis['windowsize']),
+            'input_is_mono': bool(analysis['input_is_mono']),
+        }
+        self._write(prefix + ".json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    def contains(self, background_path, sr, time_resolution):
+        """Whether the analysis of a background is already stored (get() would not compute it)"""
+        prefix = self._prefix(self.background_hash(background_path), sr, time_resolution)
+        return os.path.exists(prefix + ".json")
+
+    def get(self, background_path, sr, time_resolution):
+        """
+        Analysis of a background at a sample rate and time_resolution, computed and
+        stored on first use.
+
+        Returns:
+        - dict as from dsp.paulstretch_analyze(), with the spectra memory-mapped
+        """
+        from dsp import _load_background, paulstretch_analyze
+
+        prefix = self._prefix(self.background_hash(background_path), sr, time_resolution)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(prefix, threading.Lock())
+
+        # Serialize analyses of the same background so concurrent jobs share one result
+        with build_lock:
+            analysis = self._load(prefix)
+            if analysis is not None:
+                with self._lock:
+                    self.hits += 1
+                return analysis
+
+            with self._lock:
+                self.misses += 1
+            print(f"Indexing background {background_path} at {sr}Hz, {time_resolution:g}s windows")
+            bg_audio = _load_background(background_path, sr)
+            self._store(prefix, paulstretch_analyze(sr, bg_audio, time_resolution))
+            analysis = self._load(prefix)
+            if analysis is None:
+                raise RuntimeError(f"Could not read back background index entry: {prefix}")
+            return analysis
+
+    def build(self, background_paths, sr, time_resolutions):
+        """Index every background for every time_resolution ahead of the first job"""
+        for background_path in background_paths:
+            for time_resolution in time_resolutions:
+                try:
+                    self.get(background_path, sr, time_resolution)
+                except Exception as e:
+                    print(f"Could not index background {background_path}: {e}")
+
+    def entries(self):
+        """List (prefix, size) for every complete entry"""
+        result = []
+        for meta_path in glob.glob(os.path.join(self.index_dir, "*.json")):
+            prefix = meta_path[:-len(".json")]
+            try:
+                size = sum(os.path.getsize(prefix + suffix) for suffix in (".json", "-spectra.npy", "-onsets.npy"))
+            except FileNotFoundError:
+                continue
+            result.append((prefix, size))
+        return result
+
+    def stats(self):
+        """Hit/miss counters and current disk usage"""
+        entries = self.entries()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size in entries),
+        }
@@ -0,0 +1,1359 @@
+import math
+import mmap
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import librosa
+import scipy.fft
+import scipy.ndimage
+import soundfile as sf
+
+from metrics import DSP_STEP_SECONDS
+
+def paulstretch(samplerate, smp, stretch, windowsize_seconds=0.25, onset_level=10.0):
+    """
+    Paul's Extreme Sound Stretch (Paulstretch) algorithm
+    Based on the implementation by Nasca Octavian Paul
+    https://github.com/paulnasca/paulstretch_python
+    
+    Parameters:
+    - samplerate: sample rate of the audio
+    - smp: audio samples (numpy array)
+    - stretch: stretch factor
+    - windowsize_seconds: window size in seconds
+    - onset_level: onset sensitivity (0.0=max, 1.0=min)
+    
+    Returns:
+    - stretched audio (numpy array)
+    """
+    # Check if input is mono
+    input_is_mono = len(smp.shape) == 1
+    
+    # If input is mono, convert to stereo format expected by the algorithm
+    if input_is_mono:
+        smp = np.tile(smp, (2, 1))
+    elif len(smp.shape) == 2 and smp.shape[0] > 2:  # Channels in rows format
+        smp = smp.T
+    
+    nchannels = smp.shape[0]
+    
+    # Make sure that windowsize is even and larger than 16
+    windowsize = int(windowsize_seconds * samplerate)
+    if windowsize < 16:
+        windowsize = 16
+    windowsize = int(windowsize / 2) * 2
+    half_windowsize = int(windowsize / 2)
+    
+    # Correct the end of the smp
+    nsamples = smp.shape[1]
+    end_size = int(samplerate * 0.05)
+    if end_size < 16:
+        end_size = 16
+    
+    # Apply fade out at the end
+    if nsamples > end_size:
+        smp[:, nsamples-end_size:nsamples] *= np.linspace(1, 0, end_size)
+    
+    # Create Hann window
+    window = 0.5 - np.cos(np.arange(windowsize, dtype='float') * 2.0 * math.pi / (windowsize - 1)) * 0.5
+    
+    # Initialize processing variables
+    old_windowed_buf = np.zeros((nchannels, windowsize))
+    hinv_sqrt2 = (1 + np.sqrt(0.5)) * 0.5
+    hinv_buf = 2.0 * (hinv_sqrt2 - (1.0 - hinv_sqrt2) * np.cos(np.arange(half_windowsize, dtype='float') * 2.0 * math.pi / half_windowsize)) / hinv_sqrt2
+    
+    freqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
+    old_freqs = freqs
+    
+    # For onset detection
+    num_bins_scaled_freq = 32
+    freqs_scaled = np.zeros(num_bins_scaled_freq)
+    old_freqs_scaled = freqs_scaled
+    
+    # Processing variables
+    start_pos = 0.0
+    displace_pos = windowsize * 0.5
+    
+    displace_tick = 0.0
+    displace_tick_increase = 1.0 / stretch
+    if displace_tick_increase > 1.0:
+        displace_tick_increase = 1.0
+    
+    extra_onset_time_credit = 0.0
+    get_next_buf = True
+    
+    # Output array
+    output_length = int(nsamples * stretch)
+    output_array = np.zeros((nchannels, output_length))
+    output_index = 0
+    
+    # For progress reporting
+    total_progress_steps = int((nsamples - windowsize) / displace_pos)
+    progress_counter = 0
+    last_progress_percent = -1
+    
+    # Main processing loop
+    while start_pos < nsamples - windowsize:
+        # Show progress updates
+        progress_percent = int(100.0 * start_pos / nsamples)
+        if progress_percent != last_progress_percent and progress_percent % 10 == 0:
+            print(f"PaulStretch progress: {progress_percent}%")
+            last_progress_percent = progress_percent
+            
+        if get_next_buf:
+            old_freqs = freqs.copy()
+            old_freqs_scaled = freqs_scaled.copy()
+            
+            # Get the windowed buffer
+            istart_pos = int(start_pos)
+            buf = smp[:, istart_pos:istart_pos+windowsize]
+            
+            # Apply window
+            buf = buf * window
+            
+            # FFT
+            freqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
+            for channel in range(nchannels):
+                freqs[channel, :] = np.fft.rfft(buf[channel, :])
+            
+            # Calculate the magnitudes of the frequencies
+            freqs_mag = np.abs(freqs)
+            
+            # Calculate scaled frequencies for onset detection
+            if num_bins_scaled_freq > 0:
+                freqs_scaled = np.zeros(num_bins_scaled_freq)
+                for i in range(num_bins_scaled_freq):
+                    si = i * half_windowsize // num_bins_scaled_freq
+                    ei = ((i + 1) * half_windowsize // num_bins_scaled_freq) - 1
+                    if ei < 0:
+                        ei = 0
+                    if si > half_windowsize:
+                        si = half_windowsize
+                    
+                    # Calculate the average magnitude for this bin
+                    bin_sum = 0
+                    for channel in range(nchannels):
+                        bin_sum += np.sum(freqs_mag[channel, si:ei+1])
+                    bin_sum /= (ei - si + 1) * nchannels
+                    freqs_scaled[i] = bin_sum
+            
+            # Onset detection
+            onset = 0.0
+            if num_bins_scaled_freq > 0:
+                # Calculate onset detection function
+                sum1 = sum2 = 0.0
+                for i in range(num_bins_scaled_freq):
+                    sum1 += abs(freqs_scaled[i])
+                    sum2 += abs(old_freqs_scaled[i])
+                
+                if sum2 > 1e-10:
+                    onset = sum1 / sum2
+                else:
+                    onset = 1.0
+                
+                if onset > onset_level:
+                    displace_tick = 1.0
+                    extra_onset_time_credit += 1.0
+        
+        # Interpolate between the old and new frequencies
+        cfreqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
+        for channel in range(nchannels):
+            cfreqs[channel, :] = (freqs[channel, :] * displace_tick) + (old_freqs[channel, :] * (1.0 - displace_tick))
+        
+        # Randomize the phases by multiplication with a random complex number with modulus=1
+        ph = np.random.uniform(0, 2 * math.pi, (nchannels, half_windowsize + 1)) * 1j
+        cfreqs = cfreqs * np.exp(ph)
+        
+        # Do the inverse FFT for each channel
+        buf = np.zeros((nchannels, windowsize))
+        for channel in range(nchannels):
+            buf[channel, :] = np.fft.irfft(cfreqs[channel, :])
+        
+        # Window again the output buffer
+        buf = buf * window
+        
+        # Overlap-add the output
+        output = np.zeros((nchannels, half_windowsize))
+        for channel in range(nchannels):
+            output[channel, :] = buf[channel, :half_windowsize] + old_windowed_buf[channel, half_windowsize:]
+        old_windowed_buf = buf
+        
+        # Remove the resulted amplitude modulation
+        output = output * hinv_buf
+        
+        # Clamp the values to -1..1
+        output = np.clip(output, -1.0, 1.0)
+        
+        # Store the output
+        if output_index + half_windowsize <= output_length:
+            output_array[:, output_index:output_index + half_windowsize] = output
+            output_index += half_windowsize
+        
+        if get_next_buf:
+            start_pos += displace_pos
+            get_next_buf = False
+        
+        # Advance the displacement tick and handle onsets
+        if extra_onset_time_credit <= 0.0:
+            displace_tick += displace_tick_increase
+        else:
+            credit_get = 0.5 * displace_tick_increase
+            extra_onset_time_credit -= credit_get
+            if extra_onset_time_credit < 0:
+                extra_onset_time_credit = 0
+            displace_tick += displace_tick_increase - credit_get
+        
+        if displace_tick >= 1.0:
+            displace_tick = displace_tick % 1.0
+            get_next_buf = True
+    
+    # Return the same format (mono/stereo) as the input
+    if input_is_mono:
+        return output_array[0]  # Return only first channel if input was mono
+    else:
+        return output_array.T if output_array.shape[0] <= 2 else output_array
+
+def _paulstretch_prepare(samplerate, smp, windowsize_seconds):
+    """
+    Shared setup for the frame-batched PaulStretch engine.
+
+    Unlike paulstretch() this never modifies the caller's array, and mono input
+    stays a single channel (paulstretch() renders a duplicate channel and throws it away).
+    The batched engines work in single precision throughout.
+
+    Returns:
+    - (smp, input_is_mono, windowsize, half_windowsize, window, hinv_buf) where smp
+      is a float32 (channels, samples) copy with the end fade applied
+    """
+    input_is_mono = len(smp.shape) == 1
+    if input_is_mono:
+        smp = np.array(smp, dtype=np.float32)[np.newaxis, :]
+    elif smp.shape[0] > 2:  # Channels in rows format
+        smp = np.array(smp.T, dtype=np.float32)
+    else:
+        smp = np.array(smp, dtype=np.float32)
+
+    windowsize = int(windowsize_seconds * samplerate)
+    if windowsize < 16:
+        windowsize = 16
+    windowsize = int(windowsize / 2) * 2
+    half_windowsize = int(windowsize / 2)
+
+    nsamples = smp.shape[1]
+    end_size = int(samplerate * 0.05)
+    if end_size < 16:
+        end_size = 16
+    if nsamples > end_size:
+        smp[:, nsamples-end_size:nsamples] *= np.linspace(1, 0, end_size, dtype=np.float32)
+
+    window, hinv_buf = _paulstretch_windows(windowsize)
+    return smp, input_is_mono, windowsize, half_windowsize, window, hinv_buf
+
+def _paulstretch_windows(windowsize):
+    """Analysis/synthesis window and the overlap-add compensation curve for a window size"""
+    half_windowsize = windowsize // 2
+    window = 0.5 - np.cos(np.arange(windowsize, dtype='float') * 2.0 * math.pi / (windowsize - 1)) * 0.5
+    hinv_sqrt2 = (1 + np.sqrt(0.5)) * 0.5
+    hinv_buf = 2.0 * (hinv_sqrt2 - (1.0 - hinv_sqrt2) * np.cos(np.arange(half_windowsize, dtype='float') * 2.0 * math.pi / half_windowsize)) / hinv_sqrt2
+    return window.astype(np.float32), hinv_buf.astype(np.float32)
+
+def _paulstretch_input_spectra(smp, window, half_windowsize):
+    """
+    Window and FFT every input frame paulstretch() would read, in one batched call.
+
+    Frame k starts at sample k * half_windowsize. Row 0 of the result is an all-zero
+    spectrum standing in for the "previous frame" of the very first read, so input
+    frame k lives in row k + 1.
+
+    Returns:
+    - complex64 array of shape (frames + 1, channels, half_windowsize + 1)
+    """
+    windowsize = 2 * half_windowsize
+    nchannels, nsamples = smp.shape
+    nframes = max(0, -(-(nsamples - windowsize) // half_windowsize))
+
+    spectra = np.zeros((nframes + 1, nchannels, half_windowsize + 1), dtype=np.complex64)
+    if nframes > 0:
+        frames = np.lib.stride_tricks.sliding_window_view(smp, windowsize, axis=1)[:, ::half_windowsize][:, :nframes]
+        # scipy.fft keeps single precision (numpy.fft computes in double before NumPy 2)
+        spectra[1:] = scipy.fft.rfft(frames.transpose(1, 0, 2) * window, axis=-1)
+    return spectra
+
+def _paulstretch_onsets(spectra, half_windowsize, num_bins_scaled_freq=32):
+    """
+    Onset detection values for every input frame, matching the 32-bin
+    scaled-magnitude ratio computed inside paulstretch().
+
+    Returns:
+    - float array with one onset value per input frame (spectra rows 1..)
+    """
+    nchannels = spectra.shape[1]
+    bins = np.arange(num_bins_scaled_freq)
+    si = np.minimum(bins * half_windowsize // num_bins_scaled_freq, half_windowsize)
+    ei = np.maximum((bins + 1) * half_windowsize // num_bins_scaled_freq - 1, 0)
+
+    # Per-bin averages via a cumulative sum over the channel-summed magnitudes
+    mags = np.abs(spectra).sum(axis=1, dtype=np.float64)
+    cumulative = np.concatenate((np.zeros((mags.shape[0], 1)), np.cumsum(mags, axis=1)), axis=1)
+    freqs_scaled = (cumulative[:, ei + 1] - cumulative[:, si]) / ((ei - si + 1) * nchannels)
+
+    sums = np.abs(freqs_scaled).sum(axis=1)
+    new_sums, old_sums = sums[1:], sums[:-1]
+    onsets = np.ones(len(new_sums))
+    valid = old_sums > 1e-10
+    onsets[valid] = new_sums[valid] / old_sums[valid]
+    return onsets
+
+def _paulstretch_plan(onsets, nsamples, windowsize, stretch, onset_level, max_frames):
+    """
+    Replay paulstretch()'s scheduling loop (start_pos, displace_tick and onset credit)
+    without touching any audio, so every output frame is known before rendering.
+
+    Returns:
+    - (rows, ticks): for output frame j, rows[j] is the spectra row of the current
+      input frame and ticks[j] the interpolation weight towards it from rows[j] - 1
+    """
+    displace_pos = windowsize * 0.5
+    displace_tick_increase = min(1.0 / stretch, 1.0)
+
+    rows = []
+    ticks = []
+    start_pos = 0.0
+    displace_tick = 0.0
+    extra_onset_time_credit = 0.0
+    get_next_buf = True
+    frame = 0
+
+    while start_pos < nsamples - windowsize and len(rows) < max_frames:
+        if get_next_buf:
+            frame += 1
+            if onsets[frame - 1] > onset_level:
+                displace_tick = 1.0
+                extra_onset_time_credit += 1.0
+
+        rows.append(frame)
+        ticks.append(displace_tick)
+
+        if get_next_buf:
+            start_pos += displace_pos
+            get_next_buf = False
+
+        if extra_onset_time_credit <= 0.0:
+            displace_tick += displace_tick_increase
+        else:
+            credit_get = 0.5 * displace_tick_increase
+            extra_onset_time_credit -= credit_get
+            if extra_onset_time_credit < 0:
+                extra_onset_time_credit = 0
+            displace_tick += displace_tick_increase - credit_get
+
+        if displace_tick >= 1.0:
+            displace_tick = displace_tick % 1.0
+            get_next_buf = True
+
+    return np.array(rows, dtype=np.intp), np.array(ticks)
+
+# Unit phasors for phase randomization: drawing table indices is far cheaper than
+# evaluating exp(1j * uniform) per bin, and 4096 steps (~0.09 degrees) is inaudible
+PAULSTRETCH_PHASE_STEPS = 4096
+_PAULSTRETCH_PHASORS = np.exp(2j * math.pi * np.arange(PAULSTRETCH_PHASE_STEPS) / PAULSTRETCH_PHASE_STEPS).astype(np.complex64)
+
+# Output frames rendered per batch by the batched and parallel engines
+PAULSTRETCH_BATCH_FRAMES = 32
+
+class _PaulStretchScratch:
+    """Work arrays of a batched render, allocated once and reused by every batch"""
+
+    def __init__(self, batch_frames, nchannels, windowsize):
+        half_windowsize = windowsize // 2
+        self.cfreqs = np.empty((batch_frames, nchannels, half_windowsize + 1), dtype=np.complex64)
+        self.other = np.empty_like(self.cfreqs)
+        self.weights = np.empty((batch_frames, 1, 1), dtype=np.float32)
+        self.output = np.empty((batch_frames, nchannels, half_windowsize), dtype=np.float32)
+        # Second half of the previous windowed frame, overlap-added to the next batch
+        self.carry = np.zeros((nchannels, half_windowsize), dtype=np.float32)
+
+def _paulstretch_render(spectra, rows, ticks, window, hinv_buf, scratch, rng=None):
+    """
+    Render a batch of planned output frames: interpolate spectra, randomize phases,
+    inverse FFT, window and overlap-add against the previous frame.
+
+    Everything happens in the scratch arrays (only the inverse FFT allocates), so the
+    returned output is only valid until the next call.
+
+    Parameters:
+    - scratch: _PaulStretchScratch of the render; its carry is read and updated
+    - rng: numpy Generator for the phases (the global numpy random state if None)
+
+    Returns:
+    - output of shape (frames, channels, half_windowsize), a view into scratch
+    """
+    windowsize = len(window)
+    half_windowsize = windowsize // 2
+    nframes = len(rows)
+    cfreqs = scratch.cfreqs[:nframes]
+    other = scratch.other[:nframes]
+    weights = scratch.weights[:nframes]
+
+    weights[:, 0, 0] = ticks
+    np.take(spectra, rows, axis=0, out=cfreqs)
+    cfreqs *= weights
+    np.take(spectra, rows - 1, axis=0, out=other)
+    np.subtract(1.0, weights, out=weights)
+    other *= weights
+    cfreqs += other
+
+    # Randomize the phases by multiplication with a random complex number with modulus=1
+    randint = rng.integers if rng is not None else np.random.randint
+    np.take(_PAULSTRETCH_PHASORS, randint(0, PAULSTRETCH_PHASE_STEPS, cfreqs.shape, dtype=np.int16), out=other)
+    cfreqs *= other
+
+    buf = scipy.fft.irfft(cfreqs, n=windowsize, axis=-1, overwrite_x=True)
+    buf *= window
+
+    output = scratch.output[:nframes]
+    np.copyto(output, buf[:, :, :half_windowsize])
+    output[0] += scratch.carry
+    output[1:] += buf[:-1, :, half_windowsize:]
+    output *= hinv_buf
+    np.clip(output, -1.0, 1.0, out=output)
+    scratch.carry[...] = buf[-1, :, half_windowsize:]
+    return output
+
+# Parallel segments per worker process, so segments of concurrent renders interleave evenly
+PAULSTRETCH_SEGMENTS_PER_WORKER = 2
+
+def paulstretch_analyze(samplerate, smp, windowsize_seconds=0.25):
+    """
+    The part of a batched PaulStretch render that depends only on the input: the
+    windowed input frame spectra and their onset values. Computed once per input and
+    window size, it can be passed as analysis= to the batched, streaming and parallel
+    engines for any stretch factor, which then skip straight to planning and rendering.
+
+    Returns:
+    - dict with spectra (complex64, see _paulstretch_input_spectra()), onsets,
+      nsamples, windowsize and input_is_mono
+    """
+    smp, input_is_mono, windowsize, half_windowsize, window, _ = _paulstretch_prepare(
+        samplerate, smp, windowsize_seconds)
+    spectra = _paulstretch_input_spectra(smp, window, half_windowsize)
+    return {
+        'spectra': spectra,
+        'onsets': _paulstretch_onsets(spectra, half_windowsize),
+        'nsamples': smp.shape[1],
+        'windowsize': windowsize,
+        'input_is_mono': input_is_mono,
+    }
+
+def _paulstretch_setup(samplerate, smp, stretch, windowsize_seconds, onset_level, analysis=None):
+    """
+    Input spectra and the complete output frame schedule for a stretch, analyzing
+    smp unless a paulstretch_analyze() result for it is given.
+
+    Returns:
+    - dict with spectra, rows, ticks, windowsize, output_length and input_is_mono
+    """
+    if analysis is None:
+        analysis = paulstretch_analyze(samplerate, smp, windowsize_seconds)
+    nsamples, windowsize = int(analysis['nsamples']), int(analysis['windowsize'])
+    output_length = int(nsamples * stretch)
+
+    rows, ticks = _paulstretch_plan(analysis['onsets'], nsamples, windowsize, stretch, onset_level,
+                                    output_length // (windowsize // 2))
+    return {
+        'spectra': analysis['spectra'],
+        'rows': rows,
+        'ticks': ticks,
+        'windowsize': windowsize,
+        'output_length': output_length,
+        'input_is_mono': bool(analysis['input_is_mono']),
+    }
+
+def _paulstretch_output(output_array, input_is_mono):
+    """Return a (channels, samples) render in the layout paulstretch() returns"""
+    if input_is_mono:
+        return output_array[0]
+    else:
+        return output_array.T if output_array.shape[0] <= 2 else output_array
+
+def _paulstretch_batch_rng(seed, batch_index):
+    """Phase generator of one output batch: the same (seed, batch) always draws the same phases"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(batch_index,)))
+
+def _paulstretch_iter_batches(spectra, rows, ticks, window, hinv_buf, start_batch, stop_batch,
+                              batch_frames=PAULSTRETCH_BATCH_FRAMES, seed=None, report_progress=False):
+    """
+    Render output batches [start_batch, stop_batch) of a plan one after another.
+
+    With a seed every batch draws its phases from its own generator, so a range of batches
+    renders exactly as it would as part of a full render. A range that does not start at the
+    beginning first re-renders the batch before it (the overlap margin) to recover the
+    overlap-add tail its first frame is added to, which makes the seam exact.
+
+    Yields:
+    - (first output frame, output) per batch, output being a (frames, channels, half_windowsize)
+      view that is only valid until the next batch
+    """
+    nchannels = spectra.shape[1]
+    nframes = len(rows)
+
+    scratch = _PaulStretchScratch(batch_frames, nchannels, len(window))
+    if start_batch > 0:
+        if seed is None:
+            raise ValueError("Rendering a range of batches needs a seed")
+        start = (start_batch - 1) * batch_frames
+        _paulstretch_render(spectra, rows[start:start + batch_frames], ticks[start:start + batch_frames],
+                            window, hinv_buf, scratch, _paulstretch_batch_rng(seed, start_batch - 1))
+
+    last_progress_percent = -1
+    for batch in range(start_batch, stop_batch):
+        start = batch * batch_frames
+        if report_progress:
+            progress_percent = int(100.0 * start / nframes) // 10 * 10
+            if progress_percent != last_progress_percent:
+                print(f"PaulStretch progress: {progress_percent}%")
+                last_progress_percent = progress_percent
+
+        stop = min(start + batch_frames, nframes)
+        rng = _paulstretch_batch_rng(seed, batch) if seed is not None else None
+        yield start, _paulstretch_render(spectra, rows[start:stop], ticks[start:stop], window, hinv_buf, scratch, rng)
+
+def _paulstretch_render_batches(spectra, rows, ticks, window, hinv_buf, output_array, start_batch, stop_batch,
+                                batch_frames=PAULSTRETCH_BATCH_FRAMES, seed=None, report_progress=False):
+    """Render output batches [start_batch, stop_batch) of a plan into output_array (channels, samples)"""
+    half_windowsize = len(window) // 2
+    for start, output in _paulstretch_iter_batches(spectra, rows, ticks, window, hinv_buf, start_batch, stop_batch,
+                                                   batch_frames, seed, report_progress):
+        stop = start + len(output)
+        for channel in range(output.shape[1]):
+            output_array[channel, start * half_windowsize:stop * half_windowsize].reshape(stop - start, -1)[...] = \
+                output[:, channel]
+
+def paulstretch_batched(samplerate, smp, stretch, windowsize_seconds=0.25, onset_level=10.0,
+                        batch_frames=PAULSTRETCH_BATCH_FRAMES, seed=None, analysis=None):
+    """
+    Frame-batched PaulStretch engine, statistically equivalent to paulstretch().
+
+    All input frames are windowed and transformed in one go, the frame schedule
+    (including onset handling) is planned up front, and output frames are then
+    rendered batch_frames at a time with 2-D NumPy operations.
+
+    Parameters:
+    - samplerate: sample rate of the audio
+    - smp: audio samples (numpy array)
+    - stretch: stretch factor
+    - windowsize_seconds: window size in seconds
+    - onset_level: onset sensitivity (0.0=max, 1.0=min)
+    - batch_frames: number of output frames rendered per batch (bounds scratch memory)
+    - seed: optional phase seed; seeded renders are reproducible and match paulstretch_parallel()
+    - analysis: optional paulstretch_analyze() result for smp at this sample rate and window
+      size; smp itself is then not used (and may be None)
+
+    Returns:
+    - stretched float32 audio, in the same layout paulstretch() returns
+    """
+    plan = _paulstretch_setup(samplerate, smp, stretch, windowsize_seconds, onset_level, analysis)
+    spectra, rows = plan['spectra'], plan['rows']
+    window, hinv_buf = _paulstretch_windows(plan['windowsize'])
+
+    output_array = np.zeros((spectra.shape[1], plan['output_length']), dtype=np.float32)
+    nbatches = -(-len(rows) // batch_frames)
+    _paulstretch_render_batches(spectra, rows, plan['ticks'], window, hinv_buf, output_array, 0, nbatches,
+                                batch_frames, seed, report_progress=True)
+    return _paulstretch_output(output_array, plan['input_is_mono'])
+
+def paulstretch_stream(samplerate, smp, stretch, windowsize_seconds=0.25, onset_level=10.0,
+                       batch_frames=PAULSTRETCH_BATCH_FRAMES, seed=None, analysis=None):
+    """
+    Streaming variant of paulstretch_batched(): the same render, produced batch by batch.
+
+    Only the input spectra and the frame schedule (both proportional to the input, not
+    the output) are held in memory; the output is never materialized as a whole.
+
+    Returns:
+    - (shape, blocks): the shape paulstretch_batched() would return, and a generator of
+      consecutive float32 blocks in that layout that together make up the output
+    """
+    plan = _paulstretch_setup(samplerate, smp, stretch, windowsize_seconds, onset_level, analysis)
+    spectra, rows = plan['spectra'], plan['rows']
+    nchannels, output_length = spectra.shape[1], plan['output_length']
+    window, hinv_buf = _paulstretch_windows(plan['windowsize'])
+    nbatches = -(-len(rows) // batch_frames)
+    if plan['input_is_mono']:
+        shape = (output_length,)
+    else:
+        shape = (output_length, nchannels) if nchannels <= 2 else (nchannels, output_length)
+
+    def blocks():
+        rendered = 0
+        for _, output in _paulstretch_iter_batches(spectra, rows, plan['ticks'], window, hinv_buf, 0, nbatches,
+                                                   batch_frames, seed, report_progress=True):
+            block = output.transpose(1, 0, 2).reshape(nchannels, -1)
+            rendered += block.shape[1]
+            yield _paulstretch_output(block, plan['input_is_mono']).copy()
+        # Samples after the last full frame stay silent, as in paulstretch_batched()
+        if rendered < output_length:
+            yield _paulstretch_output(np.zeros((nchannels, output_length - rendered), dtype=np.float32),
+                                      plan['input_is_mono'])
+
+    return shape, blocks()
+
+def _paulstretch_render_shared(spectra_name, spectra_shape, spectra_dtype, rows, ticks, windowsize,
+                               output_name, output_shape, start_batch, stop_batch, batch_frames, seed):
+    """
+    Worker side of paulstretch_parallel(): render one segment straight into the shared output.
+    spectra_name is a shared memory block, or the path of a .npy file (a background index
+    entry) that every worker maps instead.
+    """
+    spectra_block = None if spectra_name.endswith(".npy") else shared_memory.SharedMemory(name=spectra_name)
+    output_block = shared_memory.SharedMemory(name=output_name)
+    spectra = output_array = None
+    try:
+        if spectra_block is None:
+            spectra = np.load(spectra_name, mmap_mode="r")
+        else:
+            spectra = np.ndarray(spectra_shape, dtype=spectra_dtype, buffer=spectra_block.buf)
+        output_array = np.ndarray(output_shape, dtype=np.float32, buffer=output_block.buf)
+        window, hinv_buf = _paulstretch_windows(windowsize)
+        _paulstretch_render_batches(spectra, rows, ticks, window, hinv_buf, output_array,
+                                    start_batch, stop_batch, batch_frames, seed)
+    finally:
+        spectra = output_array = None
+        if spectra_block is not None:
+            spectra_block.close()
+        output_block.close()
+
+def paulstretch_parallel(samplerate, smp, stretch, windowsize_seconds=0.25, onset_level=10.0,
+                         batch_frames=PAULSTRETCH_BATCH_FRAMES, executor=None, segments=None, seed=None,
+                         analysis=None):
+    """
+    Multi-process PaulStretch: the batched engine with its output timeline split into
+    segments that separate worker processes render at the same time.
+
+    Planning (input spectra, onsets and the frame schedule) is sequential and cheap, and
+    fixes every segment's start position and onset state. Segments start on batch
+    boundaries, each batch draws its phases from a generator seeded with (seed, batch),
+    and each segment re-renders the batch before its start as an overlap margin, so the
+    segments overlap-add at their seams exactly as in a single render: the result equals
+    paulstretch_batched() with the same seed. Input spectra and the output are shared with
+    the workers through shared memory; spectra memory-mapped from a background index
+    are mapped by the workers themselves.
+
+    Parameters:
+    - samplerate, smp, stretch, windowsize_seconds, onset_level, batch_frames, analysis:
+      as for paulstretch_batched()
+    - executor: process pool running the segments (a temporary pool with one worker per CPU if None)
+    - segments: number of segments (PAULSTRETCH_SEGMENTS_PER_WORKER per CPU if None)
+    - seed: phase seed (a random one if None)
+
+    Returns:
+    - stretched audio as float32, in the same layout paulstretch() returns
+    """
+    plan = _paulstretch_setup(samplerate, smp, stretch, windowsize_seconds, onset_level, analysis)
+    spectra, rows = plan['spectra'], plan['rows']
+    output_shape = (spectra.shape[1], plan['output_length'])
+    nbatches = -(-len(rows) // batch_frames)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if segments is None:
+        segments = (os.cpu_count() or 1) * PAULSTRETCH_SEGMENTS_PER_WORKER
+    bounds = np.linspace(0, nbatches, max(1, min(segments, nbatches)) + 1).round().astype(int)
+
+    own_executor = executor is None
+    if own_executor:
+        from dsp_pool import new_process_pool
+        executor = new_process_pool(os.cpu_count() or 1)
+
+    mapped_file = isinstance(spectra, np.memmap) and isinstance(spectra.base, mmap.mmap)
+    spectra_block = None if mapped_file else shared_memory.SharedMemory(create=True, size=max(1, spectra.nbytes))
+    # New shared memory is zero-filled, so samples past the last frame stay silent
+    output_block = shared_memory.SharedMemory(create=True, size=max(1, output_shape[0] * output_shape[1] * 4))
+    futures = []
+    try:
+        if mapped_file:
+            spectra_name = spectra.filename
+        else:
+            np.ndarray(spectra.shape, dtype=spectra.dtype, buffer=spectra_block.buf)[...] = spectra
+            spectra_name = spectra_block.name
+        for start_batch, stop_batch in zip(bounds[:-1], bounds[1:]):
+            if stop_batch > start_batch:
+                futures.append(executor.submit(
+                    _paulstretch_render_shared, spectra_name, spectra.shape, spectra.dtype.str,
+                    rows, plan['ticks'], plan['windowsize'], output_block.name, output_shape,
+                    int(start_batch), int(stop_batch), batch_frames, seed))
+        print(f"PaulStretch: rendering {nbatches} batches in {len(futures)} parallel segments")
+
+        last_progress_percent = -1
+        for done, future in enumerate(futures):
+            future.result()
+            progress_percent = int(100.0 * (done + 1) / len(futures)) // 10 * 10
+            if progress_percent != last_progress_percent:
+                print(f"PaulStretch progress: {progress_percent}%")
+                last_progress_percent = progress_percent
+
+        view = np.ndarray(output_shape, dtype=np.float32, buffer=output_block.buf)
+        output_array = view.copy()
+        del view
+    finally:
+        for future in futures:
+            future.cancel()
+        if spectra_block is not None:
+            spectra_block.close()
+            spectra_block.unlink()
+        output_block.close()
+        output_block.unlink()
+        if own_executor:
+            executor.shutdown()
+
+    return _paulstretch_output(output_array, plan['input_is_mono'])
+
+# Selectable PaulStretch implementations for process_audio
+PAULSTRETCH_ENGINES = {
+    "classic": paulstretch,
+    "batched": paulstretch_batched,
+    "parallel": paulstretch_parallel,
+}
+
+def _load_background(background_path, sr):
+    """Load an ambient background as mono and resample it to sr"""
+    print(f"Loading ambient background audio: {background_path}")
+    bg_audio, bg_sr = librosa.load(background_path, sr=None)
+    
+    # Resample background if needed
+    if bg_sr != sr:
+        print(f"Resampling background from {bg_sr}Hz to {sr}Hz")
+        bg_audio = librosa.resample(bg_audio, orig_sr=bg_sr, target_sr=sr)
+    return bg_audio
+
+def _stretch_background(background_path, sr, target_length, time_resolution=0.25, stretch_engine="batched",
+                        bg_index=None):
+    """
+    Load an ambient background, resample it to sr and PaulStretch it to roughly target_length samples.
+
+    stretch_engine is a PAULSTRETCH_ENGINES name or an engine callable with the same signature.
+    With a bg_index.BackgroundIndex, every engine but "classic" renders from the background's
+    stored analysis instead (engine callables must then accept analysis=).
+    """
+    if bg_index is not None and stretch_engine != "classic":
+        analysis = bg_index.get(background_path, sr, time_resolution)
+        bg_audio, nsamples = None, analysis['nsamples']
+    else:
+        bg_audio = _load_background(background_path, sr)
+        analysis, nsamples = None, len(bg_audio)
+    
+    # Calculate stretch factor to match the target length
+    stretch_factor = target_length / nsamples
+    print(f"Stretching background by factor: {stretch_factor}")
+    
+    # Apply paulstretch to the background
+    print("Applying PaulStretch algorithm to create immersive background (this may take a while)...")
+    engine = PAULSTRETCH_ENGINES[stretch_engine] if isinstance(stretch_engine, str) else stretch_engine
+    if analysis is not None:
+        stretched_bg = engine(sr, bg_audio, stretch_factor, time_resolution, analysis=analysis)
+    else:
+        stretched_bg = engine(sr, bg_audio, stretch_factor, time_resolution)
+    print("PaulStretch complete!")
+    return stretched_bg
+
+def _stretch_background_stream(background_path, sr, target_length, time_resolution=0.25, bg_index=None):
+    """
+    Streaming variant of _stretch_background() with the batched engine.
+
+    Returns:
+    - (shape, blocks) as from paulstretch_stream()
+    """
+    if bg_index is not None:
+        analysis = bg_index.get(background_path, sr, time_resolution)
+        bg_audio, nsamples = None, analysis['nsamples']
+    else:
+        bg_audio = _load_background(background_path, sr)
+        analysis, nsamples = None, len(bg_audio)
+    stretch_factor = target_length / nsamples
+    print(f"Stretching background by factor: {stretch_factor} (streaming)")
+    return paulstretch_stream(sr, bg_audio, stretch_factor, time_resolution, analysis=analysis)
+
+def load_voice(path):
+    """
+    Read a voice track as mono float32, like librosa.load(path, sr=None).
+
+    Reading straight into float32 with soundfile avoids librosa's intermediate
+    copies (about three times the track's size at peak); anything soundfile
+    cannot decode still goes through librosa.
+    """
+    try:
+        audio, sr = sf.read(path, dtype="float32")
+    except (OSError, RuntimeError):
+        return librosa.load(path, sr=None)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1, dtype=np.float32)
+    return audio, sr
+
+# Long pauses cut from synthesized speech, as f5_tts's remove_silence_for_generated_wav()
+# does with pydub: stretches of at least SILENCE_MIN_MS quieter than SILENCE_THRESHOLD_DB
+# (RMS, checked every SILENCE_SEEK_STEP_MS) are cut down to SILENCE_KEEP_MS on either side
+SILENCE_MIN_MS = 1000
+SILENCE_THRESHOLD_DB = -50
+SILENCE_KEEP_MS = 500
+SILENCE_SEEK_STEP_MS = 10
+
+def remove_long_silences(wave, sr, min_silence_ms=SILENCE_MIN_MS, silence_thresh_db=SILENCE_THRESHOLD_DB,
+                         keep_silence_ms=SILENCE_KEEP_MS, seek_step_ms=SILENCE_SEEK_STEP_MS):
+    """
+    Remove long silences from a mono waveform in memory.
+
+    Makes the same cuts as remove_silence_for_generated_wav() (pydub's split_on_silence()
+    on the millisecond grid, joined back to back) without writing and re-reading a WAV
+    file. Window energies come from one cumulative sum instead of a slice per step.
+
+    Returns:
+    - the float32 waveform with the silences shortened; a wave shorter than
+      min_silence_ms comes back unchanged and one that is silent throughout comes
+      back empty (process_audio_array() rejects an empty voice)
+    """
+    wave = np.asarray(wave, dtype=np.float32)
+    # pydub works in whole milliseconds, rounding the length and padding the last one with silence
+    length_ms = round(1000 * len(wave) / sr)
+    nframes = int(length_ms * (sr / 1000.0))
+    if nframes > len(wave):
+        wave = np.concatenate((wave, np.zeros(nframes - len(wave), dtype=np.float32)))
+    if length_ms < min_silence_ms:
+        return wave[:nframes]
+
+    def frame(ms):
+        # pydub's millisecond to frame conversion for slicing
+        return (np.minimum(ms, length_ms) * (sr / 1000.0)).astype(np.int64)
+
+    last_start = length_ms - min_silence_ms
+    starts = np.arange(0, last_start + 1, seek_step_ms)
+    if last_start % seek_step_ms:
+        starts = np.append(starts, last_start)
+    first, stop = frame(starts), frame(starts + min_silence_ms)
+    energy = np.concatenate(([0.0], np.cumsum(np.square(wave, dtype=np.float64))))
+    # RMS as pydub measures it on the 16-bit samples it reads back
+    rms = np.floor(np.sqrt((energy[stop] - energy[first]) / np.maximum(stop - first, 1)) * 32768)
+    silence_starts = starts[rms <= 10 ** (silence_thresh_db / 20) * 32768]
+    if len(silence_starts) == 0:
+        return wave[:nframes]
+
+    # Join silent windows into ranges unless separated by a gap longer than a window
+    gaps = np.flatnonzero((np.diff(silence_starts) != seek_step_ms) &
+                          (silence_starts[1:] > silence_starts[:-1] + min_silence_ms))
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[gaps + 1]))
+    range_ends = np.concatenate((silence_starts[gaps], [silence_starts[-1]])) + min_silence_ms
+    if range_starts[0] == 0 and range_ends[0] == length_ms:
+        return wave[:0]
+
+    kept = []
+    previous_end = 0
+    for start, end in zip(range_starts, range_ends):
+        kept.append([previous_end, int(start)])
+        previous_end = int(end)
+    if previous_end != length_ms:
+        kept.append([previous_end, length_ms])
+    if kept[0] == [0, 0]:
+        kept.pop(0)
+
+    kept = [[start - keep_silence_ms, end + keep_silence_ms] for start, end in kept]
+    for current, following in zip(kept, kept[1:]):
+        if following[0] < current[1]:
+            current[1] = (current[1] + following[0]) // 2
+            following[0] = current[1]
+    return np.concatenate([wave[frame(max(start, 0)):frame(min(end, length_ms))] for start, end in kept])
+
+# Frames mixed per block, bounding the scratch memory of mix_background
+MIX_BLOCK_FRAMES = 65536
+
+def _add_background(mixed_audio, stretched_bg, gain_factor):
+    """
+    Add stretched_bg * gain_factor to mixed_audio in place, block by block, matching
+    the background's channels to the voice (averaging or duplicating them). Stereo
+    backgrounds under a mono voice must have gain_factor already divided by the
+    number of channels. Only the overlapping length is mixed.
+    """
+    input_is_mono = len(mixed_audio.shape) == 1
+    bg_is_mono = len(stretched_bg.shape) == 1
+    length = min(len(mixed_audio), len(stretched_bg))
+    scratch = np.empty((min(MIX_BLOCK_FRAMES, length),) + stretched_bg.shape[1:], dtype=np.float32)
+    for start in range(0, length, MIX_BLOCK_FRAMES):
+        stop = min(start + MIX_BLOCK_FRAMES, length)
+        block = np.multiply(stretched_bg[start:stop], gain_factor, out=scratch[:stop - start], casting='unsafe')
+        if input_is_mono and not bg_is_mono:
+            # Convert stereo to mono by averaging channels
+            block = block.sum(axis=1)
+        elif not input_is_mono and bg_is_mono:
+            # Convert mono to stereo by duplicating the channel
+            block = block[:, np.newaxis]
+        mixed_audio[start:stop] += block
+
+def mix_background(input_audio, stretched_bg, bg_gain_db=20, in_place=False):
+    """
+    Mix a stretched ambient background under the meditation voice.
+
+    The background is raised by bg_gain_db, matched to the voice's channel layout and
+    added over the voice's length (a shorter background leaves the rest of the voice
+    alone, as if padded with silence); the mix is normalized if it clips. The work is
+    done in float32, block by block into a single output array, so the only full-length
+    allocation is the output itself (none with in_place) and a memory-mapped
+    background is read a block at a time.
+
+    Parameters:
+    - input_audio: voice samples (mono, or stereo as (samples, channels))
+    - stretched_bg: stretched background, at least roughly as long as the voice
+    - bg_gain_db: background gain in dB
+    - in_place: mix into input_audio itself if it is a writable float32 array
+
+    Returns:
+    - the mixed float32 audio, in the layout of input_audio
+    """
+    input_is_mono = len(input_audio.shape) == 1
+    bg_is_mono = len(stretched_bg.shape) == 1
+    if in_place and input_audio.dtype == np.float32 and input_audio.flags.writeable:
+        mixed_audio = input_audio
+    else:
+        mixed_audio = np.array(input_audio, dtype=np.float32)
+
+    # Adjust background volume (+20dB)
+    gain_factor = 10 ** (bg_gain_db / 20)
+    print(f"Adjusting ambient background volume: +{bg_gain_db}dB (factor: {gain_factor})")
+    
+    # Print shape information for debugging
+    print(f"Meditation audio shape: {input_audio.shape}")
+    print(f"Stretched background shape: {stretched_bg.shape}")
+    
+    # Make sure both audio signals have the same number of channels
+    if input_is_mono and not bg_is_mono:
+        print("Converting stretched background to mono to match meditation audio")
+        # Averaging the channels: scale each by 1/channels here, sum them per block below
+        gain_factor /= stretched_bg.shape[1]
+    elif not input_is_mono and bg_is_mono:
+        print("Converting stretched background to stereo to match meditation audio")
+    
+    # Mix audio files (ensuring no clipping)
+    print("Creating meditation audio by mixing voice with ambient background...")
+    if len(stretched_bg) < len(mixed_audio):
+        print(f"Stretched background is {len(mixed_audio) - len(stretched_bg)} samples short, padding with silence")
+    _add_background(mixed_audio, stretched_bg, gain_factor)
+    
+    # Normalize if needed to prevent clipping
+    max_amplitude = max(float(mixed_audio.max(initial=0.0)), -float(mixed_audio.min(initial=0.0)))
+    if max_amplitude > 1.0:
+        print(f"Normalizing output (max amplitude was {max_amplitude})")
+        mixed_audio /= max_amplitude
+    
+    return mixed_audio
+
+# Ambient beds: crossfade length at loop seams, analysis frame size, and how much of the
+# bed's start and end loop points are chosen from
+BED_CROSSFADE_SECONDS = 3.0
+BED_ANALYSIS_FRAME = 2048
+BED_ANALYSIS_BANDS = 32
+BED_LOOP_REGION = 0.25
+BED_LOOP_CANDIDATES = 32
+
+def _bed_band_energies(bed, frame=BED_ANALYSIS_FRAME, bands=BED_ANALYSIS_BANDS, chunk_frames=1024):
+    """Band magnitudes of consecutive (non-overlapping) frames of a bed, computed in chunks"""
+    nframes = len(bed) // frame
+    edges = np.unique(np.geomspace(1, frame // 2 + 1, bands + 1).astype(int))[:-1]
+    window = np.hanning(frame).astype(np.float32)
+    energies = np.empty((nframes, len(edges)), dtype=np.float32)
+    for start in range(0, nframes, chunk_frames):
+        stop = min(start + chunk_frames, nframes)
+        block = np.asarray(bed[start * frame:stop * frame], dtype=np.float32)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        magnitudes = np.abs(scipy.fft.rfft(block.reshape(stop - start, frame) * window, axis=1))
+        energies[start:stop] = np.add.reduceat(magnitudes, edges, axis=1)
+    return energies
+
+def bed_loop_points(bed, sr, crossfade_seconds=BED_CROSSFADE_SECONDS):
+    """
+    Choose where an ambient bed is looped for lengths beyond its own.
+
+    The loop plays bed[loop_start:loop_end] over and over, crossfading the crossfade
+    length before loop_end into the same length from loop_start. Both crossfade regions
+    are taken from the steadiest (lowest spectral flux) stretches near the start and end
+    of the bed, and of those the pair closest to each other and to the bed's typical
+    spectrum is used, so the seam neither lands on a swell or a lull nor jumps in timbre.
+    Spectra are compared as log band energies, so flux is relative to the level.
+
+    Returns:
+    - (loop_start, loop_end) in samples
+    """
+    frame = BED_ANALYSIS_FRAME
+    crossfade_frames = max(1, int(crossfade_seconds * sr) // frame)
+    energies = _bed_band_energies(bed)
+    energies = np.log(energies + 1e-3 * max(float(np.median(energies)), 1e-12))
+    nframes = len(energies)
+    # Keep clear of PaulStretch's fade-in and silent tail
+    margin = max(1, int(sr * 1.0) // frame)
+    region = int(nframes * BED_LOOP_REGION)
+    if region - margin < crossfade_frames + 1:
+        raise ValueError(f"Ambient bed of {len(bed)} samples is too short to loop")
+
+    flux = np.concatenate(([0.0], np.sqrt(np.square(np.diff(energies, axis=0)).sum(axis=1))))
+    kernel = np.ones(crossfade_frames) / crossfade_frames
+    # Mean flux and mean spectrum of the crossfade region starting at each frame
+    region_flux = np.convolve(flux, kernel, mode="valid")
+    region_spectra = scipy.ndimage.uniform_filter1d(energies, crossfade_frames, axis=0,
+                                                    origin=-(crossfade_frames // 2))[:len(region_flux)]
+
+    starts = np.arange(margin, region)
+    ends = np.arange(nframes - region, nframes - margin - crossfade_frames)
+    starts = starts[np.argsort(region_flux[starts])[:BED_LOOP_CANDIDATES]]
+    ends = ends[np.argsort(region_flux[ends])[:BED_LOOP_CANDIDATES]]
+    typical = np.median(energies, axis=0)
+    deviation = np.sqrt(np.square(region_spectra - typical).sum(axis=1))
+    distance = np.sqrt(np.square(region_spectra[starts][:, np.newaxis] - region_spectra[ends][np.newaxis]).sum(axis=2))
+    cost = (distance + (region_flux + deviation)[starts][:, np.newaxis] + (region_flux + deviation)[ends][np.newaxis])
+    best_start, best_end = np.unravel_index(np.argmin(cost), cost.shape)
+    loop_start = int(starts[best_start]) * frame
+    loop_end = (int(ends[best_end]) + crossfade_frames) * frame
+    return loop_start, loop_end
+
+def loop_bed(bed, loop_start, loop_end, length, sr, crossfade_seconds=BED_CROSSFADE_SECONDS):
+    """
+    Produce length samples of ambient bed by slicing it and, beyond its own length,
+    crossfade-looping bed[loop_start:loop_end] (see bed_loop_points()). Only copies
+    and one precomputed equal-power crossfade are involved.
+
+    Returns:
+    - (shape, blocks): the output shape and a generator of consecutive blocks
+    """
+    shape = (length,) + bed.shape[1:]
+    crossfade = min(int(crossfade_seconds * sr), (loop_end - loop_start) // 2)
+
+    def blocks():
+        remaining = length
+        if length <= len(bed):
+            for start in range(0, length, MIX_BLOCK_FRAMES):
+                yield np.asarray(bed[start:min(start + MIX_BLOCK_FRAMES, length)], dtype=np.float32)
+            return
+        curve = np.linspace(0, math.pi / 2, crossfade, dtype=np.float32).reshape((-1,) + (1,) * (bed.ndim - 1))
+        seam = (np.asarray(bed[loop_end - crossfade:loop_end], dtype=np.float32) * np.cos(curve) +
+                np.asarray(bed[loop_start:loop_start + crossfade], dtype=np.float32) * np.sin(curve))
+        # Everything up to the first seam, then (seam, loop body) until the length is reached
+        pieces = [(0, loop_end - crossfade)]
+        while remaining > 0:
+            for start, stop in pieces:
+                for block_start in range(start, stop, MIX_BLOCK_FRAMES):
+                    block = np.asarray(bed[block_start:min(block_start + MIX_BLOCK_FRAMES, stop, block_start + remaining)],
+                                       dtype=np.float32)
+                    remaining -= len(block)
+                    yield block
+                    if remaining == 0:
+                        return
+            block = seam[:remaining]
+            remaining -= len(block)
+            yield block
+            pieces = [(loop_start + crossfade, loop_end - crossfade)]
+
+    return shape, blocks()
+
+def _collect_blocks(shape, blocks):
+    """Assemble consecutive blocks into one float32 array of the given shape"""
+    output = np.empty(shape, dtype=np.float32)
+    position = 0
+    for block in blocks:
+        output[position:position + len(block)] = block
+        position += len(block)
+    return output
+
+# Peak limiter used instead of normalization by the streaming mode
+LIMITER_CEILING = 1.0
+LIMITER_LOOKAHEAD_SECONDS = 0.01  # Gain ramps down over this before a peak
+LIMITER_HOLD_SECONDS = 0.05  # and stays down this long after it before ramping back up
+
+class LookaheadLimiter:
+    """
+    Streaming look-ahead peak limiter.
+
+    Each sample gets the gain that brings it under the ceiling; the gain actually
+    applied is the minimum of those over the look-ahead and hold windows, smoothed
+    by a moving average as long as the look-ahead, so it ramps down before a peak
+    instead of clipping it and never exceeds the gain any sample in reach needs.
+    The output lags the input by the look-ahead; flush() returns the rest.
+
+    Parameters:
+    - sr: sample rate
+    - ceiling: peak level the output stays within
+    - lookahead_seconds: attack time (and latency)
+    - hold_seconds: time the gain is held after a peak
+    """
+
+    def __init__(self, sr, ceiling=LIMITER_CEILING, lookahead_seconds=LIMITER_LOOKAHEAD_SECONDS,
+                 hold_seconds=LIMITER_HOLD_SECONDS):
+        self.ceiling = ceiling
+        self.lookahead = max(1, int(lookahead_seconds * sr))
+        self.hold = max(0, int(hold_seconds * sr))
+        # Required gains of the last hold + look-ahead samples, minimum gains of the last
+        # look-ahead samples, and the input not yet output
+        self._gains = np.ones(self.hold + self.lookahead - 1, dtype=np.float32)
+        self._minimum = np.ones(self.lookahead - 1, dtype=np.float32)
+        self._pending = None
+        self._skip = self.lookahead - 1
+        self.min_gain = 1.0
+
+    def process(self, block):
+        """Limit the next block of float32 samples, returning the output that is ready (possibly empty)"""
+        block = np.asarray(block, dtype=np.float32)
+        if self._pending is None:
+            self._pending = np.zeros((self.lookahead - 1,) + block.shape[1:], dtype=np.float32)
+        n = len(block)
+        if n == 0:
+            return block
+
+        peak = np.abs(block)
+        if peak.ndim > 1:
+            peak = peak.max(axis=1)
+        required = self.ceiling / np.maximum(peak, self.ceiling)
+
+        gains = np.concatenate([self._gains, required])
+        width = self.hold + self.lookahead
+        minimum = scipy.ndimage.minimum_filter1d(gains, width, origin=-(width // 2))[:n]
+        self._gains = gains[len(gains) - (width - 1):]
+
+        minimum = np.concatenate([self._minimum, minimum])
+        gain = scipy.ndimage.uniform_filter1d(minimum, self.lookahead, origin=(self.lookahead - 1) // 2)
+        gain = gain[self.lookahead - 1:]
+        self._minimum = minimum[len(minimum) - (self.lookahead - 1):]
+        self.min_gain = min(self.min_gain, float(gain.min()))
+
+        delayed = np.concatenate([self._pending, block])
+        self._pending = delayed[n:]
+        output = delayed[:n]
+        output *= gain if output.ndim == 1 else gain[:, np.newaxis]
+        # Guard against rounding in the smoothed gain
+        np.clip(output, -self.ceiling, self.ceiling, out=output)
+        if self._skip:
+            skipped = min(self._skip, n)
+            self._skip -= skipped
+            output = output[skipped:]
+        return output
+
+    def flush(self):
+        """Return the samples still held back for the look-ahead"""
+        if self._pending is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.process(np.zeros_like(self._pending))
+
+# Frames read, mixed and written per block in streaming mode
+STREAM_BLOCK_FRAMES = 65536
+
+class _BlockReader:
+    """Re-blocks a sequence of arrays into reads of any size, padding with silence at the end"""
+
+    def __init__(self, blocks, trailing_shape=()):
+        self._blocks = iter(blocks)
+        self._current = np.zeros((0,) + tuple(trailing_shape), dtype=np.float32)
+        self._position = 0
+
+    def read(self, frames):
+        parts = []
+        while frames > 0:
+            if self._position == len(self._current):
+                block = next(self._blocks, None)
+                if block is None:
+                    parts.append(np.zeros((frames,) + self._current.shape[1:], dtype=np.float32))
+                    break
+                self._current, self._position = block, 0
+                continue
+            part = self._current[self._position:self._position + frames]
+            self._position += len(part)
+            frames -= len(part)
+            parts.append(part)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+def _array_blocks(array, block_frames=STREAM_BLOCK_FRAMES):
+    """
+    Yield an array block by block. A memory-mapped .npy (as from np.load(mmap_mode='r'))
+    is read with plain file reads instead, so the pages already mixed do not stay
+    resident and memory use stays flat however long the array is.
+    """
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.flags.c_contiguous:
+        frame_items = int(np.prod(array.shape[1:], dtype=np.int64))
+        with open(array.filename, "rb") as f:
+            f.seek(array.offset)
+            for start in range(0, len(array), block_frames):
+                frames = min(block_frames, len(array) - start)
+                block = np.fromfile(f, dtype=array.dtype, count=frames * frame_items)
+                yield block.reshape((frames,) + array.shape[1:])
+        return
+    for start in range(0, len(array), block_frames):
+        yield array[start:start + block_frames]
+
+def _mono_blocks(blocks, copy):
+    """Voice blocks as writable mono float32, copied only where the mix would modify the caller's audio"""
+    for block in blocks:
+        if block.ndim > 1:
+            yield block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else np.array(block[:, 0], dtype=np.float32)
+        elif copy or block.dtype != np.float32 or not block.flags.writeable:
+            yield np.array(block, dtype=np.float32)
+        else:
+            yield block
+
+def _process_audio_streaming(voice_blocks, length, sr, background_path, output_path, time_resolution, bg_gain_db,
+                             stretch_engine, bg_cache, dsp_pool, bg_index, bed_library):
+    """
+    process_audio_array() in bounded memory: the voice is mixed with the background,
+    limited and written one block at a time, and the batched engine's PaulStretch output
+    is consumed as it is rendered (or streamed into the background cache and read back
+    from disk), so memory use does not grow with the length of the meditation.
+    voice_blocks yields length samples of mono float32 voice that may be mixed into.
+    """
+    if stretch_engine == "batched":
+        render = lambda n: _stretch_background_stream(background_path, sr, n, time_resolution, bg_index)
+    else:
+        # Other engines render the whole background; the mix itself still streams
+        print(f"The {stretch_engine} engine cannot stream, rendering the whole background")
+        stretch = dsp_pool.stretch_background if dsp_pool is not None else _stretch_background
+        render = lambda n: stretch(background_path, sr, n, time_resolution, stretch_engine, bg_index)
+    if bed_library is not None:
+        bg_shape, bg_blocks = bed_library.background(background_path, sr, time_resolution, length, render)
+    elif bg_cache is not None:
+        stretched_bg = bg_cache.get_or_render(background_path, sr, time_resolution, length, render)
+        bg_shape, bg_blocks = stretched_bg.shape, _array_blocks(stretched_bg)
+    else:
+        rendered = render(length)
+        if isinstance(rendered, tuple):
+            bg_shape, bg_blocks = rendered
+        else:
+            bg_shape, bg_blocks = rendered.shape, _array_blocks(rendered)
+
+    gain_factor = 10 ** (bg_gain_db / 20)
+    print(f"Adjusting ambient background volume: +{bg_gain_db}dB (factor: {gain_factor})")
+    if len(bg_shape) > 1:
+        # Averaging the background's channels to match the mono voice
+        gain_factor /= bg_shape[1]
+    if bg_shape[0] < length:
+        print(f"Stretched background is {length - bg_shape[0]} samples short, padding with silence")
+    background = _BlockReader(bg_blocks, bg_shape[1:])
+    limiter = LookaheadLimiter(sr)
+
+    print(f"Mixing and saving meditation to: {output_path}")
+    # Time spent rendering (or reading) the background, mixing and writing, summed over the blocks
+    step_seconds = {'paulstretch': 0.0, 'mix': 0.0, 'write': 0.0}
+    with sf.SoundFile(output_path, "w", sr, 1) as output:
+        for voice in voice_blocks:
+            t0 = time.perf_counter()
+            bg_block = background.read(len(voice))
+            t1 = time.perf_counter()
+            _add_background(voice, bg_block, gain_factor)
+            limited = limiter.process(voice)
+            t2 = time.perf_counter()
+            output.write(limited)
+            step_seconds['paulstretch'] += t1 - t0
+            step_seconds['mix'] += t2 - t1
+            step_seconds['write'] += time.perf_counter() - t2
+        output.write(limiter.flush())
+    for step, seconds in step_seconds.items():
+        DSP_STEP_SECONDS.observe(seconds, step=step)
+    if limiter.min_gain < 1.0:
+        print(f"Limited output peaks (max gain reduction {-20 * math.log10(limiter.min_gain):.1f}dB)")
+    print("Meditation generation complete!")
+
+def process_audio_array(input_audio, sr, background_path, output_path, time_resolution=0.25, bg_gain_db=20,
+                        stretch_engine="batched", bg_cache=None, dsp_pool=None, streaming=False, bg_index=None,
+                        bed_library=None, in_place=False):
+    """
+    Post-process a meditation voice held in memory (as returned by generate_tts()):
+    stretch the ambient background to its length, mix it under the voice and save
+    the result to output_path. Options are as for process_audio().
+
+    Parameters:
+    - input_audio: voice samples (mono, or stereo as (samples, channels))
+    - sr: sample rate of input_audio
+    - in_place: mix into input_audio itself (if it is a writable float32 array) instead
+      of a copy; the caller's audio is then overwritten with the mix
+    """
+    # remove_long_silences() returns an empty voice when the speech was all silence
+    if len(input_audio) == 0:
+        raise ValueError("The voice track is empty (the generated speech was silent)")
+
+    if streaming:
+        voice_blocks = _mono_blocks(_array_blocks(input_audio), copy=not in_place)
+        _process_audio_streaming(voice_blocks, len(input_audio), sr, background_path, output_path,
+                                 time_resolution, bg_gain_db, stretch_engine, bg_cache, dsp_pool,
+                                 bg_index, bed_library)
+        return
+
+    # Check if input is mono or stereo
+    input_is_mono = len(input_audio.shape) == 1
+    print(f"Input audio format: {'mono' if input_is_mono else 'stereo'}")
+    
+    stretch = dsp_pool.stretch_background if dsp_pool is not None else _stretch_background
+    # The paulstretch step includes serving the background from the cache or a bed
+    with DSP_STEP_SECONDS.time(step='paulstretch'):
+        if bed_library is not None:
+            stretched_bg = _collect_blocks(*bed_library.background(
+                background_path, sr, time_resolution, len(input_audio),
+                lambda length: stretch(background_path, sr, length, time_resolution, stretch_engine, bg_index)
+            ))
+        elif bg_cache is not None:
+            stretched_bg = bg_cache.get_or_render(
+                background_path, sr, time_resolution, len(input_audio),
+                lambda length: stretch(background_path, sr, length, time_resolution, stretch_engine, bg_index)
+            )
+        else:
+            stretched_bg = stretch(background_path, sr, len(input_audio), time_resolution, stretch_engine, bg_index)
+    
+    with DSP_STEP_SECONDS.time(step='mix'):
+        mixed_audio = mix_background(input_audio, stretched_bg, bg_gain_db, in_place=in_place)
+    
+    # Save output
+    print(f"Saving meditation to: {output_path}")
+    with DSP_STEP_SECONDS.time(step='write'):
+        sf.write(output_path, mixed_audio, sr)
+    print("Meditation generation complete!")
+
+def process_audio(input_path, background_path, output_path, time_resolution=0.25, bg_gain_db=20,
+                  stretch_engine="batched", bg_cache=None, dsp_pool=None, streaming=False, bg_index=None,
+                  bed_library=None):
+    """
+    Process audio for meditation by:
+    1. Loading the input audio and ambient background
+    2. Stretching the background to match input length
+    3. Adjusting background volume
+    4. Merging the two audio files to create a meditative atmosphere
+    5. Saving the result
+
+    The voice is read from input_path and handed to process_audio_array(); callers
+    that already hold the voice in memory should call that directly.
+
+    stretch_engine selects the PaulStretch implementation from PAULSTRETCH_ENGINES
+    ("batched" by default, "classic" for the original frame-by-frame loop).
+
+    bg_cache is an optional bg_cache.StretchedBackgroundCache. When given, the stretched
+    background is served from (or rendered into) the cache and trimmed to length.
+
+    dsp_pool is an optional dsp_pool.DSPPool. When given, the background is loaded and
+    stretched in one of its worker processes instead of the calling thread.
+
+    streaming processes the meditation block by block in memory that does not grow
+    with its length. Peaks are then held under full scale by a LookaheadLimiter instead
+    of normalizing the whole mix, and the batched engine renders in the calling thread
+    (dsp_pool is only used for engines that cannot stream).
+
+    bg_index is an optional bg_index.BackgroundIndex. When given, the background's
+    precomputed analysis is rendered from instead of loading and analyzing it again.
+
+    bed_library is an optional bg_bed.AmbientBedLibrary. When given, the background is
+    sliced and crossfade-looped from a pre-rendered bed instead of being rendered for this
+    length (bg_cache is then not used); the engine only renders the bed if it is missing.
+    """
+    if streaming:
+        info = sf.info(input_path)
+        print(f"Streaming meditation voice audio: {input_path} ({info.frames} samples at {info.samplerate}Hz)")
+        voice_blocks = _mono_blocks(
+            sf.blocks(input_path, blocksize=STREAM_BLOCK_FRAMES, dtype="float32", always_2d=True), copy=False)
+        _process_audio_streaming(voice_blocks, info.frames, info.samplerate, background_path, output_path,
+                                 time_resolution, bg_gain_db, stretch_engine, bg_cache, dsp_pool,
+                                 bg_index, bed_library)
+        return
+
+    print(f"Loading meditation voice audio: {input_path}")
+    input_audio, sr = load_voice(input_path)
+    process_audio_array(input_audio, sr, background_path, output_path, time_resolution, bg_gain_db,
+                        stretch_engine, bg_cache, dsp_pool, bg_index=bg_index, bed_library=bed_library,
+                        in_place=True)
@@ -0,0 +1,207 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Worker processes rendering ambient backgrounds
+DEFAULT_DSP_PROCESSES = 2
+# Shortest output (seconds) whose batched render is split into segments across the workers;
+# shorter renders run whole in one worker, where the split's overhead is not worth it
+DSP_SPLIT_MIN_SECONDS = 120
+
+def _pool_context():
+    """
+    Start workers from a fork server that has already imported the DSP stack, so each
+    worker starts in milliseconds with everything imported, and is never forked from
+    the multi-threaded server process itself. Only dsp and librosa are preloaded: the
+    server's main module would re-run its body (job store, caches) in the fork server.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['dsp', 'librosa'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def _init_worker():
+    import librosa
+
+    import dsp  # noqa: F401
+
+    # librosa imports its resampler lazily; do it now rather than in the first job
+    librosa.resample(np.zeros(1024, dtype=np.float32), orig_sr=2, target_sr=1)
+    print(f"DSP worker {os.getpid()} ready")
+
+def new_process_pool(processes):
+    """ProcessPoolExecutor with pre-imported DSP workers"""
+    return ProcessPoolExecutor(max_workers=processes, mp_context=_pool_context(), initializer=_init_worker)
+
+def _ping():
+    return os.getpid()
+
+# BackgroundIndex per index directory, opened once per worker
+_worker_indexes = {}
+
+def _worker_index(index_dir):
+    if index_dir is None:
+        return None
+    if index_dir not in _worker_indexes:
+        from bg_index import BackgroundIndex
+        _worker_indexes[index_dir] = BackgroundIndex(index_dir)
+    return _worker_indexes[index_dir]
+
+def _index_background(index_dir, background_path, sr, time_resolution):
+    """Analyze a background into a background index in a worker"""
+    _worker_index(index_dir).get(background_path, sr, time_resolution)
+
+def _stretch_to_shared_memory(background_path, sr, target_length, time_resolution, stretch_engine,
+                              index_dir=None):
+    """
+    Stretch a background in a worker and leave the result in a new shared memory block.
+    With index_dir, the background's analysis is read from (or stored in) that background index.
+
+    Returns:
+    - (block name, shape, dtype) for the parent to attach to; the parent unlinks the block
+    """
+    from dsp import _stretch_background
+
+    stretched = np.asarray(
+        _stretch_background(background_path, sr, target_length, time_resolution, stretch_engine,
+                            _worker_index(index_dir)),
+        dtype=np.float32)
+    block = shared_memory.SharedMemory(create=True, size=max(1, stretched.nbytes))
+    try:
+        np.ndarray(stretched.shape, dtype=stretched.dtype, buffer=block.buf)[...] = stretched
+    finally:
+        block.close()
+    return block.name, stretched.shape, stretched.dtype.str
+
+class DSPPool:
+    """
+    Runs background stretching (librosa load/resample and PaulStretch) in worker processes.
+
+    PaulStretch is CPU-bound Python; in a thread it competes for the GIL with request
+    handling and TTS inference, and several jobs post-processing at once still share one
+    core. Workers get only paths and parameters and hand the stretched background back
+    through shared memory instead of pickling it through a pipe. Mixing and writing the
+    result stay in the job thread, where NumPy and libsndfile release the GIL anyway.
+
+    Renders run whole in one worker, loading and analyzing the background there (or
+    reading its analysis from the background index). Long batched renders (at least
+    DSP_SPLIT_MIN_SECONDS) with a background index are instead split into segments with
+    dsp.paulstretch_parallel() across all workers, so a single long job uses every
+    process; the analysis is then computed by a worker if it is not indexed yet, and
+    only planning, which is cheap, happens in the calling thread. Renders are never
+    split on a single CPU, where segments would only add overhead.
+
+    Parameters:
+    - processes: number of worker processes
+    """
+
+    def __init__(self, processes=DEFAULT_DSP_PROCESSES):
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+
+    def _new_executor(self):
+        return new_process_pool(self.processes)
+
+    def start(self):
+        """Start every worker now instead of on the first job"""
+        with self._lock:
+            executor = self._executor
+        for _ in range(self.processes):
+            executor.submit(_ping)
+
+    def stretch_background(self, background_path, sr, target_length, time_resolution=0.25, stretch_engine="batched",
+                           bg_index=None):
+        """
+        Same as dsp._stretch_background, rendered in the worker processes. The classic
+        engine does not use bg_index.
+
+        Returns:
+        - the stretched background as a float32 array
+        """
+        with self._lock:
+            executor = self._executor
+            self.active += 1
+        start = time.time()
+        try:
+            batched = stretch_engine in ('batched', 'parallel')
+            if batched and self._split(sr, target_length, bg_index):
+                from dsp import PAULSTRETCH_SEGMENTS_PER_WORKER, _stretch_background, paulstretch_parallel
+                if not bg_index.contains(background_path, sr, time_resolution):
+                    # Analyze in a worker; the calling thread then only maps the stored analysis
+                    executor.submit(_index_background, bg_index.index_dir, background_path, sr,
+                                    time_resolution).result()
+                engine = functools.partial(paulstretch_parallel, executor=executor,
+                                           segments=self.processes * PAULSTRETCH_SEGMENTS_PER_WORKER)
+                stretched = _stretch_background(background_path, sr, target_length, time_resolution, engine,
+                                                bg_index)
+                self._finish(start, failed=False)
+                return stretched
+
+            index_dir = bg_index.index_dir if bg_index is not None and stretch_engine != "classic" else None
+            future = executor.submit(_stretch_to_shared_memory, background_path, sr, target_length,
+                                     time_resolution, "batched" if batched else stretch_engine, index_dir)
+            name, shape, dtype = future.result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool so later jobs still run
+            with self._lock:
+                if self._executor is executor:
+                    print("DSP worker pool broke, starting a new one")
+                    self._executor = self._new_executor()
+            self._finish(start, failed=True)
+            raise
+        except BaseException:
+            self._finish(start, failed=True)
+            raise
+
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            stretched = view.copy()
+            del view
+        finally:
+            block.close()
+            block.unlink()
+        self._finish(start, failed=False)
+        return stretched
+
+    def _split(self, sr, target_length, bg_index):
+        """Whether a batched render is worth splitting into segments across the workers"""
+        return (bg_index is not None and self.processes > 1 and (os.cpu_count() or 1) > 1
+                and target_length >= DSP_SPLIT_MIN_SECONDS * sr)
+
+    def _finish(self, start, failed):
+        with self._lock:
+            self.active -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+                self.render_seconds += time.time() - start
+
+    def stats(self):
+        with self._lock:
+            return {
+                'processes': self.processes,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'render_seconds': round(self.render_seconds, 1),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,159 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Functions listed in a profile's JSON summary, by cumulative time
+PROFILE_TOP_FUNCTIONS = 40
+
+# cProfile needs the job thread to itself and tracemalloc traces the whole process,
+# so one job is profiled at a time; others requesting it run unprofiled meanwhile
+_profile_lock = threading.Lock()
+
+def profile_paths(directory, job_id):
+    """(pstats dump, JSON summary) of a job's profile, next to its audio"""
+    return (os.path.join(directory, f"{job_id}.profile.prof"),
+            os.path.join(directory, f"{job_id}.profile.json"))
+
+class JobProfiler:
+    """
+    Profile a single job's execution.
+
+    Used as a context manager around the job: the job thread runs under cProfile
+    (deterministic, so every call is counted; a profile of a slow job shows where its
+    time went), and stage(name) measures each pipeline stage's wall time, CPU time
+    of the thread running it, and peak memory traced by tracemalloc (Python and NumPy
+    allocations) while it was held. On exit the profile is written next to the job's
+    audio as <job_id>.profile.prof (load it with pstats or snakeviz) plus a JSON
+    summary with the stages and the top functions, so the job GC removes both with
+    the job.
+
+    Only the job thread is profiled: the pipelined mode's script producer thread shows
+    up in the stage timings but not in the call profile, and DSP worker processes in
+    neither CPU time nor memory. tracemalloc slows allocation-heavy code, and it sees
+    every thread, so stage peaks include anything else running at the same time.
+
+    Parameters:
+    - job_id: the job being profiled
+    - directory: where the artifacts are written (the job's artifact directory)
+    """
+
+    def __init__(self, job_id, directory):
+        self.job_id = job_id
+        self.directory = directory
+        self.active = False
+        self.summary = None
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._open_stages = []
+        self._peak = 0
+
+    def __enter__(self):
+        if not _profile_lock.acquire(blocking=False):
+            print(f"Another job is being profiled, running job {self.job_id} without profiling")
+            return self
+        self.active = True
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        print(f"Profiling job {self.job_id}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.active:
+            return False
+        self._profile.disable()
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.thread_time() - self._cpu_start
+        try:
+            with self._lock:
+                self._fold_peak()
+            if self._started_tracing:
+                tracemalloc.stop()
+            self._write(wall, cpu, None if exc is None else repr(exc))
+        finally:
+            self.active = False
+            _profile_lock.release()
+        return False
+
+    def _fold_peak(self):
+        """Credit the traced peak since the last stage boundary to the job and every open stage"""
+        peak = tracemalloc.get_traced_memory()[1]
+        self._peak = max(self._peak, peak)
+        for record in self._open_stages:
+            record['peak_traced_bytes'] = max(record['peak_traced_bytes'], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, hold=None):
+        """
+        Measure the block as stage name. hold is the scheduler's stage(name) to enter
+        first, so time spent waiting for a free slot is not counted.
+        """
+        with hold(name) if hold is not None else nullcontext():
+            if not self.active:
+                yield
+                return
+            record = {'peak_traced_bytes': 0}
+            with self._lock:
+                self._fold_peak()
+                self._open_stages.append(record)
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                yield
+            finally:
+                wall = time.perf_counter() - wall_start
+                cpu = time.thread_time() - cpu_start
+                with self._lock:
+                    self._fold_peak()
+                    self._open_stages.remove(record)
+                    totals = self._stages.setdefault(name, {'count': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                             'peak_traced_bytes': 0})
+                    totals['count'] += 1
+                    totals['wall_seconds'] += wall
+                    totals['cpu_seconds'] += cpu
+                    totals['peak_traced_bytes'] = max(totals['peak_traced_bytes'], record['peak_traced_bytes'])
+
+    def _top_functions(self):
+        stats = pstats.Stats(self._profile)
+        rows = []
+        for (filename, line, function), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+            rows.append({
+                'function': f"{function} ({os.path.basename(filename)}:{line})" if line else function,
+                'calls': calls,
+                'self_seconds': round(total_time, 4),
+                'cumulative_seconds': round(cumulative_time, 4),
+            })
+        rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+        return rows[:PROFILE_TOP_FUNCTIONS]
+
+    def _write(self, wall, cpu, error):
+        prof_path, summary_path = profile_paths(self.directory, self.job_id)
+        self._profile.dump_stats(prof_path)
+        self.summary = {
+            'job_id': self.job_id,
+            'wall_seconds': round(wall, 3),
+            'cpu_seconds': round(cpu, 3),
+            'peak_traced_bytes': self._peak,
+            'error': error,
+            'stages': {
+                name: dict(totals, wall_seconds=round(totals['wall_seconds'], 3),
+                           cpu_seconds=round(totals['cpu_seconds'], 3))
+                for name, totals in self._stages.items()
+            },
+            'top_functions': self._top_functions(),
+        }
+        with open(summary_path, "w") as f:
+            json.dump(self.summary, f, indent=2)
+        print(f"Profile of job {self.job_id} saved to {prof_path} ({wall:.1f}s wall, {cpu:.1f}s CPU, "
+              f"peak {self._peak / 1024 / 1024:.0f} MB traced)")
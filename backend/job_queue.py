@@ -0,0 +1,181 @@
+import collections
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from metrics import JOB_QUEUE_WAIT_SECONDS, JOB_SECONDS, STAGE_SECONDS, STAGE_WAIT_SECONDS
+
+# Jobs running at once; each holds a worker thread for its whole lifetime
+DEFAULT_JOB_WORKERS = 2
+# Jobs that may wait for a worker before new submissions are refused
+DEFAULT_MAX_QUEUED_JOBS = 16
+# Concurrent holders of each pipeline stage (Ollama, F5-TTS inference, background DSP)
+DEFAULT_STAGE_LIMITS = {'llm': 1, 'tts': 1, 'dsp': 1}
+# Retry-After suggested before any job has finished (seconds)
+DEFAULT_RETRY_AFTER = 60
+
+class QueueFull(Exception):
+    """Raised by JobScheduler.submit when the admission queue is full"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class JobScheduler:
+    """
+    Bounded admission queue in front of a fixed pool of job worker threads.
+
+    Submitted jobs wait in FIFO order until a worker is free; once max_queued jobs
+    are waiting, submit() raises QueueFull instead of piling up more work. Inside a
+    job, the expensive stages are additionally limited with stage(name), so e.g. two
+    running jobs can overlap script generation for one with synthesis for the other
+    without ever running two F5 inferences or two PaulStretch renders at once.
+
+    Stages must be acquired in the order llm -> tts -> dsp (a job may hold an
+    earlier stage while waiting for a later one, never the other way round).
+
+    Parameters:
+    - workers: number of jobs that run concurrently
+    - max_queued: number of jobs that may wait for a worker
+    - stage_limits: dict of stage name -> concurrent holders
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, max_queued=DEFAULT_MAX_QUEUED_JOBS, stage_limits=None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self._stages = {name: threading.BoundedSemaphore(limit) for name, limit in self.stage_limits.items()}
+        self._stage_waiting = collections.Counter()
+        self._stage_active = collections.Counter()
+        self._condition = threading.Condition()
+        self._queue = collections.deque()
+        self._running = 0
+        self._durations = collections.deque(maxlen=20)
+        self._threads = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Start the worker threads (idempotent, also done by the first submit)"""
+        with self._condition:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}")
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_id, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) to run on a worker.
+
+        Returns:
+        - 1-based position in the queue
+
+        Raises:
+        - QueueFull when max_queued jobs are already waiting
+        """
+        self.start()
+        with self._condition:
+            if len(self._queue) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(self._retry_after_locked())
+            self._queue.append((job_id, func, args, kwargs, time.time()))
+            self._condition.notify()
+            return len(self._queue)
+
+    def position(self, job_id):
+        """1-based queue position of a waiting job, or None once it has started"""
+        with self._condition:
+            for index, (queued_id, _, _, _, _) in enumerate(self._queue):
+                if queued_id == job_id:
+                    return index + 1
+        return None
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before resubmitting"""
+        with self._condition:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self):
+        if not self._durations:
+            return DEFAULT_RETRY_AFTER
+        # Roughly the time until one queued job has started
+        average = sum(self._durations) / len(self._durations)
+        return max(1, int(average * max(1, len(self._queue)) / max(1, self.workers)))
+
+    @contextmanager
+    def stage(self, name):
+        """Hold one slot of a pipeline stage ('llm', 'tts' or 'dsp') for the block"""
+        semaphore = self._stages[name]
+        with self._condition:
+            self._stage_waiting[name] += 1
+        wait_start = time.time()
+        try:
+            semaphore.acquire()
+        finally:
+            with self._condition:
+                self._stage_waiting[name] -= 1
+        start = time.time()
+        STAGE_WAIT_SECONDS.observe(start - wait_start, stage=name)
+        with self._condition:
+            self._stage_active[name] += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._stage_active[name] -= 1
+            semaphore.release()
+            STAGE_SECONDS.observe(time.time() - start, stage=name)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                job_id, func, args, kwargs, queued_at = self._queue.popleft()
+                self._running += 1
+
+            start = time.time()
+            JOB_QUEUE_WAIT_SECONDS.observe(start - queued_at)
+            try:
+                func(*args, **kwargs)
+                failed = False
+            except Exception as e:
+                # Jobs record their own errors; this only guards the worker thread
+                print(f"Unhandled error in job {job_id}: {str(e)}")
+                print(traceback.format_exc())
+                failed = True
+
+            JOB_SECONDS.observe(time.time() - start)
+            with self._condition:
+                self._running -= 1
+                self._durations.append(time.time() - start)
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    def stats(self):
+        """Queue depth, running jobs and per-stage occupancy"""
+        with self._condition:
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'queued': len(self._queue),
+                'max_queued': self.max_queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'stages': {
+                    name: {
+                        'limit': limit,
+                        'active': self._stage_active[name],
+                        'waiting': self._stage_waiting[name],
+                    }
+                    for name, limit in self.stage_limits.items()
+                },
+            }
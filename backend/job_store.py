@@ -0,0 +1,432 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Default SQLite database for job records
+JOB_DB_PATH = "cache/jobs.db"
+# Finished jobs (and their audio) are deleted this long after their last update (seconds)
+DEFAULT_JOB_TTL = 24 * 60 * 60
+# Generated audio kept on disk before the oldest finished jobs are evicted early
+DEFAULT_ARTIFACT_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+# Seconds between garbage collection passes
+DEFAULT_GC_INTERVAL = 10 * 60
+
+# Jobs in these states no longer have a worker writing to them
+FINISHED_STATUSES = ('completed', 'error')
+
+class JobStore(ABC):
+    """
+    Storage for meditation job records.
+
+    A job is a flat dict of JSON-serializable fields; 'status' is always present,
+    and 'version' counts the writes to the job so clients can tell whether it
+    changed. Implementations must be safe to use from the request threads and job
+    workers at the same time, and call _notify() after every write so
+    wait_for_change() can wake up waiters in this process.
+    """
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._generation = 0
+
+    def _notify(self):
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def generation(self):
+        """Counter bumped by every write to any job; pass it to wait_for_change()"""
+        with self._changed:
+            return self._generation
+
+    def wait_for_change(self, generation, timeout):
+        """
+        Block until some job is written after generation was read, or timeout seconds pass.
+
+        Returns:
+        - True if something changed, False on timeout
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self._generation != generation, timeout)
+
+    @abstractmethod
+    def create(self, job_id, **fields):
+        """Insert a new job record"""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return a copy of the job's fields, or None if it does not exist"""
+
+    def get_many(self, job_ids):
+        """Return {job_id: fields} for those of job_ids that exist"""
+        jobs = {}
+        for job_id in job_ids:
+            job = self.get(job_id)
+            if job is not None:
+                jobs[job_id] = job
+        return jobs
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """Merge fields into an existing job record (no-op if it was deleted)"""
+
+    @abstractmethod
+    def delete(self, job_id):
+        """Remove a job record (no-op if it does not exist)"""
+
+    @abstractmethod
+    def expire(self, before, statuses=FINISHED_STATUSES):
+        """
+        Delete jobs in one of statuses whose last update is older than before.
+
+        Returns:
+        - ids of the deleted jobs
+        """
+
+    @abstractmethod
+    def fail_unfinished(self, error):
+        """
+        Mark every job that is not finished as failed (after a restart nobody will finish it).
+
+        Returns:
+        - number of jobs marked
+        """
+
+    @abstractmethod
+    def counts(self):
+        """Number of jobs per status"""
+
+    def __contains__(self, job_id):
+        return self.get(job_id) is not None
+
+class MemoryJobStore(JobStore):
+    """Job records in a dict; lost on restart"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = dict(fields, created_at=now, updated_at=now, version=1)
+        self._notify()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time(), version=job['version'] + 1)
+        self._notify()
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        self._notify()
+
+    def expire(self, before, statuses=FINISHED_STATUSES):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('status') in statuses and job['updated_at'] < before]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired:
+            self._notify()
+        return expired
+
+    def fail_unfinished(self, error):
+        with self._lock:
+            unfinished = [job for job in self._jobs.values() if job.get('status') not in FINISHED_STATUSES]
+            for job in unfinished:
+                job.update(status='error', error=error, updated_at=time.time(), version=job['version'] + 1)
+        self._notify()
+        return len(unfinished)
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.get('status')] = counts.get(job.get('status'), 0) + 1
+            return counts
+
+class SQLiteJobStore(JobStore):
+    """
+    Job records in a SQLite database, surviving restarts.
+
+    The database runs in WAL mode so status polls never wait for a job worker's
+    write. status and updated_at are real columns (indexed together for
+    expiry and per-status lookups); every other field lives in a JSON column.
+    Each thread uses its own connection. The version lives in the JSON column.
+
+    wait_for_change() only sees writes made through this instance, so a database
+    should be written by a single server process.
+
+    Parameters:
+    - path: database file, created along with its directory if missing
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status_updated ON jobs (status, updated_at)")
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # Autocommit mode; multi-statement updates use explicit transactions
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _row_to_job(self, row):
+        status, created_at, updated_at, data = row
+        return dict(json.loads(data), status=status, created_at=created_at, updated_at=updated_at)
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        status = fields.pop('status', 'pending')
+        self._db().execute(
+            "INSERT INTO jobs (job_id, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+            (job_id, status, now, now, json.dumps(dict(fields, version=1)))
+        )
+        self._notify()
+
+    def get(self, job_id):
+        row = self._db().execute(
+            "SELECT status, created_at, updated_at, data FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get_many(self, job_ids):
+        db = self._db()
+        job_ids = list(dict.fromkeys(job_ids))
+        jobs = {}
+        # Stay well below SQLite's limit on bound parameters per statement
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            for row in db.execute(
+                f"SELECT job_id, status, created_at, updated_at, data FROM jobs WHERE job_id IN ({placeholders})", chunk
+            ):
+                jobs[row[0]] = self._row_to_job(row[1:])
+        return jobs
+
+    def update(self, job_id, **fields):
+        db = self._db()
+        # Read-modify-write under a write lock so concurrent updates do not lose fields
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT status, data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is not None:
+                status, data = row
+                data = json.loads(data)
+                status = fields.pop('status', status)
+                fields.pop('created_at', None)
+                fields.pop('updated_at', None)
+                data.update(fields, version=data.get('version', 0) + 1)
+                db.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE job_id = ?",
+                    (status, time.time(), json.dumps(data), job_id)
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._notify()
+
+    def delete(self, job_id):
+        self._db().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        self._notify()
+
+    def expire(self, before, statuses=FINISHED_STATUSES):
+        db = self._db()
+        placeholders = ", ".join("?" for _ in statuses)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            expired = [row[0] for row in db.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*statuses, before)
+            )]
+            db.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in expired])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if expired:
+            self._notify()
+        return expired
+
+    def fail_unfinished(self, error):
+        db = self._db()
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                f"SELECT job_id, data FROM jobs WHERE status NOT IN ({placeholders})", FINISHED_STATUSES
+            ).fetchall()
+            now = time.time()
+            for job_id, data in rows:
+                data = json.loads(data)
+                data.update(error=error, version=data.get('version', 0) + 1)
+                db.execute(
+                    "UPDATE jobs SET status = 'error', updated_at = ?, data = ? WHERE job_id = ?",
+                    (now, json.dumps(data), job_id)
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._notify()
+        return len(rows)
+
+    def counts(self):
+        return dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+class JobGarbageCollector:
+    """
+    Background thread deleting expired job records and their audio files.
+
+    Every pass removes finished jobs older than ttl together with every
+    artifact named <job_id>.* in artifact_dir, deletes artifacts that belong to
+    no known job, and then, if artifact_dir still holds more than max_bytes,
+    evicts the oldest finished jobs early. Files of unfinished jobs are never
+    touched.
+
+    Parameters:
+    - store: JobStore holding the job records
+    - artifact_dir: directory of generated audio (UPLOAD_FOLDER)
+    - ttl: seconds a finished job is kept (0 keeps jobs until the disk limit is hit)
+    - max_bytes: disk usage limit for artifact_dir (0 for no limit)
+    - interval: seconds between passes
+    """
+
+    def __init__(self, store, artifact_dir, ttl=DEFAULT_JOB_TTL, max_bytes=DEFAULT_ARTIFACT_MAX_BYTES,
+                 interval=DEFAULT_GC_INTERVAL):
+        self.store = store
+        self.artifact_dir = artifact_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _artifacts(self):
+        """(path, job_id, size, mtime) for every file in artifact_dir, oldest first"""
+        result = []
+        for name in os.listdir(self.artifact_dir):
+            path = os.path.join(self.artifact_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if os.path.isfile(path):
+                result.append((path, name.split('.', 1)[0], st.st_size, st.st_mtime))
+        return sorted(result, key=lambda artifact: artifact[3])
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def collect(self):
+        """
+        Run one garbage collection pass.
+
+        Returns:
+        - (jobs deleted, files deleted, bytes freed)
+        """
+        now = time.time()
+        expired = set(self.store.expire(now - self.ttl)) if self.ttl and self.ttl > 0 else set()
+
+        removed_files = 0
+        freed = 0
+        remaining = []
+        for artifact in self._artifacts():
+            path, job_id, size, mtime = artifact
+            if job_id in expired:
+                delete = True
+            else:
+                # Leftovers of jobs that no longer exist (e.g. records lost with the memory store),
+                # given a grace period so a job being created right now is not raced
+                delete = now - mtime > max(self.ttl or 0, self.interval) and job_id not in self.store
+            if delete:
+                if self._remove(path):
+                    removed_files += 1
+                    freed += size
+            else:
+                remaining.append(artifact)
+
+        # Over the disk limit: evict whole finished jobs, oldest audio first
+        total = sum(artifact[2] for artifact in remaining)
+        if self.max_bytes and total > self.max_bytes:
+            by_job = {}
+            for path, job_id, size, mtime in remaining:
+                by_job.setdefault(job_id, []).append((path, size))
+            for path, job_id, size, mtime in remaining:
+                if total <= self.max_bytes:
+                    break
+                if job_id in expired:
+                    continue
+                job = self.store.get(job_id)
+                if job is not None and job.get('status') not in FINISHED_STATUSES:
+                    continue
+                self.store.delete(job_id)
+                expired.add(job_id)
+                for job_path, job_size in by_job[job_id]:
+                    if self._remove(job_path):
+                        removed_files += 1
+                        freed += job_size
+                        total -= job_size
+
+        if expired or removed_files:
+            print(f"Job GC: deleted {len(expired)} jobs and {removed_files} files ({freed / 1024 / 1024:.1f} MB)")
+        return len(expired), removed_files, freed
+
+    def start(self):
+        """Start the collector thread (runs a pass immediately, then every interval)"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.collect()
+                except Exception as e:
+                    print(f"Error collecting expired jobs: {str(e)}")
+                if self._stop.wait(self.interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name="job-gc")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
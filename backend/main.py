@@ -1,327 +1,409 @@
 import argparse
+import inspect
 import numpy as np
-import librosa
 import soundfile as sf
-from scipy import signal
 import sys
-import math
 import os
-import tempfile
+import time
 import json
+import random
+import re
 import requests
+from functools import lru_cache
 
-# Import F5-TTS API
-from f5_tts.api import F5TTS
+from bg_cache import StretchedBackgroundCache
+from bg_index import BackgroundIndex
+from bg_bed import AmbientBedLibrary
+from dsp import (
+    PAULSTRETCH_ENGINES,
+    process_audio,
+    process_audio_array,
+    remove_long_silences,
+)
+from metrics import LLM_TOKENS, LLM_TOKENS_PER_SECOND, TTS_AUDIO_SECONDS, TTS_REALTIME_FACTOR
+from segment_cache import TTSSegmentCache, normalize_sentence, segment_key
+from tts_registry import TTSModelRegistry
+from voice_profiles import VoiceProfileStore
 
 # Custom F5-TTS model paths
 CUSTOM_F5TTS_CHECKPOINT = "./models/experimental.pt"  # Path to custom model checkpoint file
 CUSTOM_F5TTS_VOCAB = "./models/main.txt"       # Path to custom vocabulary file
 
+# F5-TTS (and torch under it) takes seconds to import, so it is imported where it is first
+# used rather than with this module; import_tts() does it ahead of time (the server's warmup)
+def import_tts():
+    """Import the F5-TTS stack now instead of in the first job"""
+    import torchaudio  # noqa: F401
+    import f5_tts.api  # noqa: F401
+    import f5_tts.infer.utils_infer  # noqa: F401
+    import f5_tts.model.utils  # noqa: F401
+
+def load_f5tts(**kwargs):
+    """Construct an F5TTS instance (the model registry's factory)"""
+    from f5_tts.api import F5TTS
+    return F5TTS(**kwargs)
+
+def load_reference_audio(path):
+    """torchaudio.load(), the loader voice profiles read reference clips with"""
+    import torchaudio
+    return torchaudio.load(path)
+
+def preprocess_reference(ref_audio, ref_text):
+    from f5_tts.infer.utils_infer import preprocess_ref_audio_text
+    return preprocess_ref_audio_text(ref_audio, ref_text)
+
+def transcribe_reference(ref_audio):
+    from f5_tts.infer.utils_infer import transcribe
+    return transcribe(ref_audio)
+
+# Process-wide F5-TTS instances, loaded once per configuration and shared by all jobs
+tts_models = TTSModelRegistry(load_f5tts)
+
+# Default voice used when no reference audio is given
+DEFAULT_REF_AUDIO = "samples/ref.wav"
+DEFAULT_REF_TEXT_FILE = "samples/ref.reference.txt"
+
+# Transcriptions and preprocessed reference clips, keyed by reference audio hash
+voice_profiles = VoiceProfileStore(
+    preprocess=preprocess_reference,
+    transcribe=transcribe_reference,
+    duration=lambda path: sf.info(path).duration,
+)
+
 # Local Ollama settings
 OLLAMA_MODEL = "phi4"
 OLLAMA_LOCAL_URL = "http://localhost:11434/api/generate"
 
-def paulstretch(samplerate, smp, stretch, windowsize_seconds=0.25, onset_level=10.0):
+# Where streamed scripts may be cut for pipelined synthesis: a paragraph break, or
+# sentence-ending punctuation (plus closing quotes/brackets) followed by whitespace
+SCRIPT_SEGMENT_BOUNDARY = re.compile(r"\n\s*\n|[.!?]['\")\]]*\s")
+
+# Cross-fade between sentences synthesized separately for the segment cache (F5-TTS's own default)
+TTS_SENTENCE_CROSS_FADE = 0.15
+
+
+@lru_cache(maxsize=None)
+def default_ref_text():
+    """Transcription of the default reference voice, read once from samples/ref.reference.txt"""
+    try:
+        with open(DEFAULT_REF_TEXT_FILE, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        # Fallback if file is missing
+        return "some call me nature, others call me mother nature."
+
+def register_voice_profile(ref_audio=None, ref_text=None):
     """
-    Paul's Extreme Sound Stretch (Paulstretch) algorithm
-    Based on the implementation by Nasca Octavian Paul
-    https://github.com/paulnasca/paulstretch_python
-    
-    Parameters:
-    - samplerate: sample rate of the audio
-    - smp: audio samples (numpy array)
-    - stretch: stretch factor
-    - windowsize_seconds: window size in seconds
-    - onset_level: onset sensitivity (0.0=max, 1.0=min)
-    
+    Create (or load) the voice profile for a reference clip and decode its audio,
+    so the first job with this voice skips transcription and preprocessing.
+
+    A transcription is taken from ref_text, then from a "<name>.reference.txt" file
+    next to the clip, and otherwise produced by ASR.
+    """
+    if not ref_audio:
+        ref_audio = DEFAULT_REF_AUDIO
+        ref_text = ref_text or default_ref_text()
+    elif not ref_text:
+        text_file = os.path.splitext(ref_audio)[0] + ".reference.txt"
+        if os.path.exists(text_file):
+            with open(text_file, "r") as f:
+                ref_text = f.read().strip()
+    return voice_profiles.register(ref_audio, ref_text, loader=load_reference_audio)
+
+def acquire_tts_model(model_type="F5-TTS", vocoder_name="vocos", device=None, use_ema=True):
+    """
+    Context manager yielding the shared F5-TTS instance (custom checkpoint and vocab)
+    for exclusive use; see tts_registry.TTSModelRegistry.acquire.
+    """
+    return tts_models.acquire(
+        model_type=model_type,
+        vocoder_name=vocoder_name,
+        device=device,
+        use_ema=use_ema,
+        ckpt_file=CUSTOM_F5TTS_CHECKPOINT,
+        vocab_file=CUSTOM_F5TTS_VOCAB,
+    )
+
+def resolve_voice_profile(ref_audio=None, ref_text=None):
+    """
+    Voice profile for a reference clip, falling back to the default voice when none is given.
+    Transcription and reference preprocessing happen once per voice.
+    """
+    if not ref_audio:
+        print(f"Using reference audio from {DEFAULT_REF_AUDIO} with accompanying text")
+        return voice_profiles.get(DEFAULT_REF_AUDIO, default_ref_text())
+    return voice_profiles.get(ref_audio, ref_text)
+
+def tts_batch_chars(profile):
+    """
+    Largest batch F5-TTS synthesizes at once for this voice, in UTF-8 bytes.
+
+    The formula is copied from f5_tts.infer.utils_infer.infer_process as of f5-tts 0.6.2
+    (the version pinned in requirements.txt): the text rate of the reference clip times
+    what is left of a 25 second window after it. Other F5-TTS releases may size their
+    batches differently; batches here then no longer match F5's own chunking, but are
+    still sized to fit the model's window.
+    """
+    audio, sr = profile.features(load_reference_audio)
+    ref_seconds = audio.shape[-1] / sr
+    return int(len(profile.ref_text.encode("utf-8")) / ref_seconds * (25 - ref_seconds))
+
+def infer_tts_batch(reference, ref_text, batch, tts, **infer_kwargs):
+    """
+    Synthesize one text batch with f5_tts.infer.utils_infer.infer_batch_process.
+
+    infer_batch_process is not part of F5-TTS's public API: the pinned f5-tts 0.6.2 makes
+    it a generator yielding (wave, sr, spectrogram), earlier releases return that tuple.
+    Both shapes are accepted (progress is left at its tqdm default, which both take).
+
     Returns:
-    - stretched audio (numpy array)
+    - (wave, sample rate)
     """
-    # Check if input is mono
-    input_is_mono = len(smp.shape) == 1
-    
-    # If input is mono, convert to stereo format expected by the algorithm
-    if input_is_mono:
-        smp = np.tile(smp, (2, 1))
-    elif len(smp.shape) == 2 and smp.shape[0] > 2:  # Channels in rows format
-        smp = smp.T
-    
-    nchannels = smp.shape[0]
-    
-    # Make sure that windowsize is even and larger than 16
-    windowsize = int(windowsize_seconds * samplerate)
-    if windowsize < 16:
-        windowsize = 16
-    windowsize = int(windowsize / 2) * 2
-    half_windowsize = int(windowsize / 2)
-    
-    # Correct the end of the smp
-    nsamples = smp.shape[1]
-    end_size = int(samplerate * 0.05)
-    if end_size < 16:
-        end_size = 16
-    
-    # Apply fade out at the end
-    if nsamples > end_size:
-        smp[:, nsamples-end_size:nsamples] *= np.linspace(1, 0, end_size)
-    
-    # Create Hann window
-    window = 0.5 - np.cos(np.arange(windowsize, dtype='float') * 2.0 * math.pi / (windowsize - 1)) * 0.5
-    
-    # Initialize processing variables
-    old_windowed_buf = np.zeros((nchannels, windowsize))
-    hinv_sqrt2 = (1 + np.sqrt(0.5)) * 0.5
-    hinv_buf = 2.0 * (hinv_sqrt2 - (1.0 - hinv_sqrt2) * np.cos(np.arange(half_windowsize, dtype='float') * 2.0 * math.pi / half_windowsize)) / hinv_sqrt2
-    
-    freqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
-    old_freqs = freqs
-    
-    # For onset detection
-    num_bins_scaled_freq = 32
-    freqs_scaled = np.zeros(num_bins_scaled_freq)
-    old_freqs_scaled = freqs_scaled
-    
-    # Processing variables
-    start_pos = 0.0
-    displace_pos = windowsize * 0.5
-    
-    displace_tick = 0.0
-    displace_tick_increase = 1.0 / stretch
-    if displace_tick_increase > 1.0:
-        displace_tick_increase = 1.0
-    
-    extra_onset_time_credit = 0.0
-    get_next_buf = True
-    
-    # Output array
-    output_length = int(nsamples * stretch)
-    output_array = np.zeros((nchannels, output_length))
-    output_index = 0
-    
-    # For progress reporting
-    total_progress_steps = int((nsamples - windowsize) / displace_pos)
-    progress_counter = 0
-    last_progress_percent = -1
-    
-    # Main processing loop
-    while start_pos < nsamples - windowsize:
-        # Show progress updates
-        progress_percent = int(100.0 * start_pos / nsamples)
-        if progress_percent != last_progress_percent and progress_percent % 10 == 0:
-            print(f"PaulStretch progress: {progress_percent}%")
-            last_progress_percent = progress_percent
-            
-        if get_next_buf:
-            old_freqs = freqs.copy()
-            old_freqs_scaled = freqs_scaled.copy()
-            
-            # Get the windowed buffer
-            istart_pos = int(start_pos)
-            buf = smp[:, istart_pos:istart_pos+windowsize]
-            
-            # Apply window
-            buf = buf * window
-            
-            # FFT
-            freqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
-            for channel in range(nchannels):
-                freqs[channel, :] = np.fft.rfft(buf[channel, :])
-            
-            # Calculate the magnitudes of the frequencies
-            freqs_mag = np.abs(freqs)
-            
-            # Calculate scaled frequencies for onset detection
-            if num_bins_scaled_freq > 0:
-                freqs_scaled = np.zeros(num_bins_scaled_freq)
-                for i in range(num_bins_scaled_freq):
-                    si = i * half_windowsize // num_bins_scaled_freq
-                    ei = ((i + 1) * half_windowsize // num_bins_scaled_freq) - 1
-                    if ei < 0:
-                        ei = 0
-                    if si > half_windowsize:
-                        si = half_windowsize
-                    
-                    # Calculate the average magnitude for this bin
-                    bin_sum = 0
-                    for channel in range(nchannels):
-                        bin_sum += np.sum(freqs_mag[channel, si:ei+1])
-                    bin_sum /= (ei - si + 1) * nchannels
-                    freqs_scaled[i] = bin_sum
-            
-            # Onset detection
-            onset = 0.0
-            if num_bins_scaled_freq > 0:
-                # Calculate onset detection function
-                sum1 = sum2 = 0.0
-                for i in range(num_bins_scaled_freq):
-                    sum1 += abs(freqs_scaled[i])
-                    sum2 += abs(old_freqs_scaled[i])
-                
-                if sum2 > 1e-10:
-                    onset = sum1 / sum2
-                else:
-                    onset = 1.0
-                
-                if onset > onset_level:
-                    displace_tick = 1.0
-                    extra_onset_time_credit += 1.0
-        
-        # Interpolate between the old and new frequencies
-        cfreqs = np.zeros((nchannels, half_windowsize + 1), dtype=complex)
-        for channel in range(nchannels):
-            cfreqs[channel, :] = (freqs[channel, :] * displace_tick) + (old_freqs[channel, :] * (1.0 - displace_tick))
-        
-        # Randomize the phases by multiplication with a random complex number with modulus=1
-        ph = np.random.uniform(0, 2 * math.pi, (nchannels, half_windowsize + 1)) * 1j
-        cfreqs = cfreqs * np.exp(ph)
-        
-        # Do the inverse FFT for each channel
-        buf = np.zeros((nchannels, windowsize))
-        for channel in range(nchannels):
-            buf[channel, :] = np.fft.irfft(cfreqs[channel, :])
-        
-        # Window again the output buffer
-        buf = buf * window
-        
-        # Overlap-add the output
-        output = np.zeros((nchannels, half_windowsize))
-        for channel in range(nchannels):
-            output[channel, :] = buf[channel, :half_windowsize] + old_windowed_buf[channel, half_windowsize:]
-        old_windowed_buf = buf
-        
-        # Remove the resulted amplitude modulation
-        output = output * hinv_buf
-        
-        # Clamp the values to -1..1
-        output = np.clip(output, -1.0, 1.0)
-        
-        # Store the output
-        if output_index + half_windowsize <= output_length:
-            output_array[:, output_index:output_index + half_windowsize] = output
-            output_index += half_windowsize
-        
-        if get_next_buf:
-            start_pos += displace_pos
-            get_next_buf = False
-        
-        # Advance the displacement tick and handle onsets
-        if extra_onset_time_credit <= 0.0:
-            displace_tick += displace_tick_increase
+    from f5_tts.infer.utils_infer import infer_batch_process
+    result = infer_batch_process(
+        reference,
+        ref_text,
+        [batch],
+        tts.ema_model,
+        tts.vocoder,
+        mel_spec_type=tts.mel_spec_type,
+        device=tts.device,
+        **infer_kwargs
+    )
+    if inspect.isgenerator(result):
+        result = next(result)
+    wave, sr, _ = result
+    if wave is None:
+        # F5-TTS yields no wave for a batch that generated nothing
+        wave = np.zeros(0, dtype=np.float32)
+    return wave, sr
+
+def split_tts_batches(profile, text):
+    """
+    Split text into the batches F5-TTS would synthesize for this voice (with the chunking
+    and tts_batch_chars() sizing of the pinned f5-tts 0.6.2).
+    """
+    from f5_tts.infer.utils_infer import chunk_text
+    return chunk_text(text, max_chars=tts_batch_chars(profile))
+
+def split_tts_sentences(profile, text):
+    """
+    Split text into sentences (the units of the TTS segment cache). Sentences longer
+    than one F5-TTS batch are chunked further.
+    """
+    from f5_tts.infer.utils_infer import chunk_text
+    max_chars = tts_batch_chars(profile)
+    pieces = []
+    start = 0
+    for match in SCRIPT_SEGMENT_BOUNDARY.finditer(text):
+        pieces.append(text[start:match.end()])
+        start = match.end()
+    pieces.append(text[start:])
+
+    sentences = []
+    for piece in pieces:
+        piece = normalize_sentence(piece)
+        if not piece:
+            continue
+        if len(piece.encode("utf-8")) > max_chars:
+            sentences.extend(chunk_text(piece, max_chars=max_chars))
         else:
-            credit_get = 0.5 * displace_tick_increase
-            extra_onset_time_credit -= credit_get
-            if extra_onset_time_credit < 0:
-                extra_onset_time_credit = 0
-            displace_tick += displace_tick_increase - credit_get
-        
-        if displace_tick >= 1.0:
-            displace_tick = displace_tick % 1.0
-            get_next_buf = True
-    
-    # Return the same format (mono/stereo) as the input
-    if input_is_mono:
-        return output_array[0]  # Return only first channel if input was mono
-    else:
-        return output_array.T if output_array.shape[0] <= 2 else output_array
-
-def process_audio(input_path, background_path, output_path, time_resolution=0.25, bg_gain_db=20):
-    """
-    Process audio for meditation by:
-    1. Loading the input audio and ambient background
-    2. Stretching the background to match input length
-    3. Adjusting background volume
-    4. Merging the two audio files to create a meditative atmosphere
-    5. Saving the result
-    """
-    print(f"Loading meditation voice audio: {input_path}")
-    input_audio, sr = librosa.load(input_path, sr=None)
-    
-    print(f"Loading ambient background audio: {background_path}")
-    bg_audio, bg_sr = librosa.load(background_path, sr=None)
-    
-    # Check if input is mono or stereo
-    input_is_mono = len(input_audio.shape) == 1
-    print(f"Input audio format: {'mono' if input_is_mono else 'stereo'}")
-    
-    # Resample background if needed
-    if bg_sr != sr:
-        print(f"Resampling background from {bg_sr}Hz to {sr}Hz")
-        bg_audio = librosa.resample(bg_audio, orig_sr=bg_sr, target_sr=sr)
-    
-    # Calculate stretch factor to match input length
-    stretch_factor = len(input_audio) / len(bg_audio)
-    print(f"Stretching background by factor: {stretch_factor}")
-    
-    # Apply paulstretch to the background
-    print("Applying PaulStretch algorithm to create immersive background (this may take a while)...")
-    stretched_bg = paulstretch(sr, bg_audio, stretch_factor, time_resolution)
-    print("PaulStretch complete!")
-    
-    # Trim or pad to exact length
-    print("Adjusting stretched background to match meditation audio length...")
-    if len(stretched_bg) > len(input_audio):
-        if len(stretched_bg.shape) > 1:  # If stereo
-            stretched_bg = stretched_bg[:len(input_audio), :]
-        else:  # If mono
-            stretched_bg = stretched_bg[:len(input_audio)]
-    elif len(stretched_bg) < len(input_audio):
-        if len(stretched_bg.shape) > 1:  # If stereo
-            pad_width = ((0, len(input_audio) - len(stretched_bg)), (0, 0))
-            stretched_bg = np.pad(stretched_bg, pad_width)
-        else:  # If mono
-            stretched_bg = np.pad(stretched_bg, (0, len(input_audio) - len(stretched_bg)))
-    
-    # Adjust background volume (+20dB)
-    gain_factor = 10 ** (bg_gain_db / 20)
-    print(f"Adjusting ambient background volume: +{bg_gain_db}dB (factor: {gain_factor})")
-    stretched_bg = stretched_bg * gain_factor
-    
-    # Print shape information for debugging
-    print(f"Meditation audio shape: {input_audio.shape}")
-    print(f"Stretched background shape: {stretched_bg.shape}")
-    
-    # Make sure both audio signals have the same number of channels
-    if input_is_mono and len(stretched_bg.shape) > 1:
-        print("Converting stretched background to mono to match meditation audio")
-        # Convert stereo to mono by averaging channels
-        stretched_bg = np.mean(stretched_bg, axis=1)
-    elif not input_is_mono and len(stretched_bg.shape) == 1:
-        print("Converting stretched background to stereo to match meditation audio")
-        # Convert mono to stereo by duplicating the channel
-        stretched_bg = np.column_stack((stretched_bg, stretched_bg))
-    
-    print(f"Final shapes - Meditation: {input_audio.shape}, Background: {stretched_bg.shape}")
-    
-    # Mix audio files (ensuring no clipping)
-    print("Creating meditation audio by mixing voice with ambient background...")
-    mixed_audio = input_audio + stretched_bg
-    
-    # Normalize if needed to prevent clipping
-    max_amplitude = np.max(np.abs(mixed_audio))
-    if max_amplitude > 1.0:
-        print(f"Normalizing output (max amplitude was {max_amplitude})")
-        mixed_audio = mixed_audio / max_amplitude
-    
-    # Save output
-    print(f"Saving meditation to: {output_path}")
-    sf.write(output_path, mixed_audio, sr)
-    print("Meditation generation complete!")
+            sentences.append(piece)
+    return sentences
+
+def tts_model_id(model_type="F5-TTS", vocoder_name="vocos", use_ema=True):
+    """Identifies the model configuration in TTS segment cache keys"""
+    return f"{model_type}/{vocoder_name}/{os.path.basename(CUSTOM_F5TTS_CHECKPOINT)}/ema={bool(use_ema)}"
+
+def cross_fade_waves(waves, sr, cross_fade_duration):
+    """
+    Join batch waveforms with linear cross-fades, as infer_batch_process in the pinned
+    f5-tts 0.6.2 joins its batches.
+    """
+    if not waves:
+        return np.zeros(0, dtype=np.float32)
+    if cross_fade_duration <= 0:
+        return np.concatenate(waves)
+
+    final_wave = waves[0]
+    for next_wave in waves[1:]:
+        # Cross-fade samples, never exceeding either wave's length
+        cross_fade_samples = min(int(cross_fade_duration * sr), len(final_wave), len(next_wave))
+        if cross_fade_samples <= 0:
+            final_wave = np.concatenate([final_wave, next_wave])
+            continue
+
+        fade_out = np.linspace(1, 0, cross_fade_samples)
+        fade_in = np.linspace(0, 1, cross_fade_samples)
+        cross_faded_overlap = final_wave[-cross_fade_samples:] * fade_out + next_wave[:cross_fade_samples] * fade_in
+        final_wave = np.concatenate(
+            [final_wave[:-cross_fade_samples], cross_faded_overlap, next_wave[cross_fade_samples:]]
+        )
+    return final_wave
+
+def synthesize_tts_batches(tts, profile, batches, seed=-1, progress_callback=None, seed_per_batch=False,
+                           **infer_kwargs):
+    """
+    Synthesize text batches one at a time with a voice profile, reporting real progress.
+
+    With seed_per_batch the random state is reset to seed before every batch, so each
+    batch's audio depends only on its own text (as the TTS segment cache requires).
+
+    After every batch, progress_callback('processing', done, total, stats) is called with
+    measured throughput: stats holds audio_seconds, elapsed_seconds, realtime_factor
+    (audio seconds per wall second), chars_per_second and eta_seconds.
+
+    Returns:
+    - (list of waveforms, sample rate)
+    """
+    from f5_tts.model.utils import seed_everything
+
+    if seed == -1:
+        seed = random.randint(0, sys.maxsize)
+    seed_everything(seed)
+    tts.seed = seed
+
+    reference = profile.features(load_reference_audio)
+    total_chars = sum(len(batch) for batch in batches)
+    done_chars = 0
+    audio_seconds = 0.0
+    waves = []
+    sr = None
+    start = time.time()
+
+    for index, batch in enumerate(batches):
+        batch_start = time.time()
+        if seed_per_batch:
+            seed_everything(seed)
+        wave, sr = infer_tts_batch(reference, profile.ref_text, batch, tts, **infer_kwargs)
+        waves.append(wave)
+
+        batch_seconds = time.time() - batch_start
+        elapsed = time.time() - start
+        done_chars += len(batch)
+        audio_seconds += len(wave) / sr
+        TTS_AUDIO_SECONDS.inc(len(wave) / sr)
+        if batch_seconds > 0:
+            TTS_REALTIME_FACTOR.observe(len(wave) / sr / batch_seconds)
+        chars_per_second = done_chars / elapsed if elapsed > 0 else 0.0
+        stats = {
+            'audio_seconds': round(audio_seconds, 2),
+            'elapsed_seconds': round(elapsed, 2),
+            'realtime_factor': round(audio_seconds / elapsed, 3) if elapsed > 0 else None,
+            'chars_per_second': round(chars_per_second, 2),
+            'eta_seconds': round((total_chars - done_chars) / chars_per_second, 1) if chars_per_second > 0 else None,
+        }
+        print(f"TTS batch {index + 1}/{len(batches)}: {len(batch)} chars -> {len(wave) / sr:.1f}s audio "
+              f"in {batch_seconds:.1f}s (overall {stats['realtime_factor']}x realtime)")
+        if progress_callback:
+            progress_callback('processing', index + 1, len(batches), stats)
+
+    return waves, sr
+
+def synthesize_tts_sentences(profile, sentences, segment_cache, acquire_model, model_id, seed=-1,
+                             progress_callback=None, **infer_kwargs):
+    """
+    Synthesize sentences through a TTSSegmentCache.
+
+    Sentences already in the cache are loaded from disk; only the misses are sent to
+    F5-TTS (acquire_model() is entered only if there are any) and then stored. Every
+    sentence is seeded on its own, so cached audio is exactly what synthesizing it now
+    would produce. With seed=-1 the cached rendering is reused by every unseeded run.
+
+    Parameters:
+    - profile: VoiceProfile of the voice
+    - sentences: output of split_tts_sentences
+    - segment_cache: TTSSegmentCache
+    - acquire_model: callable returning a context manager that yields the F5-TTS model
+    - model_id: tts_model_id() of that model
+    - progress_callback: called as progress_callback('processing', done, len(sentences), stats)
+    - infer_kwargs: generation parameters passed to F5-TTS (and included in the cache key)
+
+    Returns:
+    - (list of waveforms, sample rate)
+    """
+    key_params = {k: v for k, v in infer_kwargs.items() if k not in ('nfe_step', 'cfg_strength', 'speed')}
+    keys = [
+        segment_key(sentence, profile.audio_hash, model_id, infer_kwargs.get('nfe_step'),
+                    infer_kwargs.get('cfg_strength'), infer_kwargs.get('speed'), seed, **key_params)
+        for sentence in sentences
+    ]
 
-def generate_tts(text, output_path, ref_audio=None, ref_text=None, 
+    waves = [None] * len(sentences)
+    sr = None
+    for index, key in enumerate(keys):
+        cached = segment_cache.get(key)
+        if cached is not None:
+            waves[index], sr = cached
+    # Sentences repeated within the text are synthesized once
+    missing = {}
+    for index, wave in enumerate(waves):
+        if wave is None:
+            missing.setdefault(keys[index], []).append(index)
+    cached_count = len(sentences) - sum(len(indices) for indices in missing.values())
+    print(f"TTS segment cache: {cached_count}/{len(sentences)} sentences cached, {len(missing)} to synthesize "
+          f"({segment_cache.format_stats()})")
+
+    if progress_callback and cached_count:
+        progress_callback('processing', cached_count, len(sentences), None)
+
+    if missing:
+        missing_keys = list(missing)
+        done_indices = [cached_count]
+
+        def report(stage, done=0, total=0, stats=None):
+            # Count every occurrence of a synthesized sentence as done
+            done_indices[0] += len(missing[missing_keys[done - 1]])
+            progress_callback(stage, done_indices[0], len(sentences), stats)
+
+        with acquire_model() as tts:
+            new_waves, sr = synthesize_tts_batches(
+                tts,
+                profile,
+                [sentences[missing[key][0]] for key in missing_keys],
+                seed=seed,
+                progress_callback=report if progress_callback else None,
+                seed_per_batch=True,
+                **infer_kwargs
+            )
+        for key, wave in zip(missing_keys, new_waves):
+            segment_cache.put(key, wave, sr)
+            for index in missing[key]:
+                waves[index] = wave
+
+    return waves, sr
+
+def generate_tts(text, output_path=None, ref_audio=None, ref_text=None, 
                  model_type="F5-TTS", vocoder_name="vocos", device=None,
                  cfg_strength=2, nfe_step=64, speed=1.0, seed=-1,
                  sway_sampling_coef=-1, target_rms=0.1, cross_fade_duration=1,
-                 fix_duration=None, remove_silence=True, use_ema=True):
+                 fix_duration=None, remove_silence=True, use_ema=True, progress_callback=None,
+                 segment_cache=None):
     """
     Generate meditation voice from text using F5-TTS.
     
     Parameters:
     - text: Meditation text to convert to speech
-    - output_path: Where to save the generated audio
+    - output_path: Optional path to also save the generated audio to
     - ref_audio: Optional reference audio file for voice cloning (if None, uses default voice)
     - ref_text: Optional transcription of reference audio (if None and ref_audio provided, will attempt auto-transcription)
     
-    F5-TTS Model Initialization Parameters:
+    The transcription and preprocessed reference clip are kept in voice_profiles, keyed by
+    the reference audio's content hash, so they are only computed for the first job with a voice.
+    
+    The text is split into the batches F5-TTS 0.6.2 uses internally and synthesized batch by batch.
+    With a segment_cache (TTSSegmentCache) it is split into sentences instead, and only
+    sentences not synthesized before with the same voice and parameters go to F5-TTS
+    (see synthesize_tts_sentences). Each sentence is then conditioned on the reference
+    clip on its own, which costs more TTS compute on a miss and cuts prosody between
+    sentences, so it only pays off for scripts that repeat sentences; fix_duration is
+    ignored in this mode. If progress_callback is given it is called as:
+    - progress_callback('initializing') while the model and voice are prepared
+    - progress_callback('chunking', 0, total_batches) once the batches are known
+    - progress_callback('processing', done, total_batches, stats) after every batch
+      (see synthesize_tts_batches for the throughput stats)
+    
+    F5-TTS Model Parameters (each combination is loaded once and kept in tts_models):
     - model_type: Model architecture to use. Options:
         - "F5-TTS" (Default): DiT architecture with ConvNeXt V2, faster trained and inference
         - "E2-TTS": Flat-UNet Transformer, reproduction from paper
@@ -363,61 +445,105 @@ def generate_tts(text, output_path, ref_audio=None, ref_text=None,
     - remove_silence: Whether to remove silence from generated audio (default=True)
     
     Returns:
-    - Path to the generated meditation voice audio file
+    - (wave, sr): the generated meditation voice as mono float32 samples and its sample rate
     """
-    print(f"Initializing F5-TTS model for meditation voice...")
-    tts = F5TTS(
-        model_type=model_type,
-        vocoder_name=vocoder_name,
-        device=device,
-        use_ema=use_ema,
-        ckpt_file=CUSTOM_F5TTS_CHECKPOINT,
-        vocab_file=CUSTOM_F5TTS_VOCAB,
-    )
-    
-    # Determine reference audio and text
-    if ref_audio and not ref_text:
-        print(f"Transcribing reference audio...")
-        ref_text = tts.transcribe(ref_audio)
-        print(f"Transcription: {ref_text}")
+    if progress_callback:
+        progress_callback('initializing')
+    
+    if segment_cache is not None:
+        if fix_duration is not None:
+            # fix_duration is the length of the whole clip, which no single sentence should take
+            print("fix_duration is ignored when synthesizing sentence by sentence for the segment cache")
+        profile = resolve_voice_profile(ref_audio, ref_text)
+        
+        print(f"Generating meditation voice from text: '{text}'")
+        sentences = split_tts_sentences(profile, text)
+        print(f"Generating audio for {len(sentences)} sentences...")
+        if progress_callback:
+            progress_callback('chunking', 0, len(sentences))
+        
+        waves, sr = synthesize_tts_sentences(
+            profile,
+            sentences,
+            segment_cache,
+            lambda: acquire_tts_model(model_type, vocoder_name, device, use_ema),
+            tts_model_id(model_type, vocoder_name, use_ema),
+            seed=seed,
+            progress_callback=progress_callback,
+            cfg_strength=cfg_strength,
+            nfe_step=nfe_step,
+            speed=0.8,                          # Same hardcoded speed as the uncached path
+            sway_sampling_coef=sway_sampling_coef,
+            target_rms=target_rms,
+        )
+        
+        # Sentences are much shorter than batches, so they get a short cross-fade
+        wav = remove_long_silences(cross_fade_waves(waves, sr, cross_fade_duration=TTS_SENTENCE_CROSS_FADE), sr)
+        if output_path:
+            sf.write(output_path, wav, sr)
+            print(f"Generated meditation voice saved to: {output_path}")
+        return wav, sr
+    
+    print(f"Acquiring F5-TTS model for meditation voice...")
+    with acquire_tts_model(model_type, vocoder_name, device, use_ema) as tts:
+        profile = resolve_voice_profile(ref_audio, ref_text)
+        
+        print(f"Generating meditation voice from text: '{text}'")
+        batches = split_tts_batches(profile, text)
+        print(f"Generating audio in {len(batches)} batches...")
+        if progress_callback:
+            progress_callback('chunking', 0, len(batches))
+        
+        waves, sr = synthesize_tts_batches(
+            tts,
+            profile,
+            batches,
+            seed=seed,                          # Random seed for reproducibility
+            progress_callback=progress_callback,
+            cfg_strength=cfg_strength,          # Controls text fidelity vs voice similarity
+            nfe_step=nfe_step,                  # Number of flow matching steps
+            speed=0.8,                          # Speech speed multiplier hardcoded to 0.7
+            sway_sampling_coef=sway_sampling_coef,  # Sway sampling for improved quality
+            target_rms=target_rms,              # Target RMS amplitude
+            fix_duration=fix_duration,          # Fixed duration (if specified)
+        )
     
-    # Use default example if no reference provided
-    if not ref_audio:
-        # Use the reference files from samples directory
-        ref_audio = "samples/ref.wav"
-        # Read reference text from file
-        try:
-            with open("samples/ref.reference.txt", "r") as f:
-                ref_text = f.read().strip()
-        except FileNotFoundError:
-            # Fallback if file is missing
-            ref_text = "some call me nature, others call me mother nature."
-        print(f"Using reference audio from samples/ref.wav with accompanying text")
+    # Cross-fade duration for chunks hardcoded to 1 second
+    wav = cross_fade_waves(waves, sr, cross_fade_duration=1)
+    # Always remove silence regardless of input parameter
+    wav = remove_long_silences(wav, sr)
     
-    print(f"Generating meditation voice from text: '{text}'")
-    wav, sr, _ = tts.infer(
-        ref_file=ref_audio,
-        ref_text=ref_text,
-        gen_text=text,
-        file_wave=output_path,
-        cfg_strength=cfg_strength,          # Controls text fidelity vs voice similarity
-        nfe_step=nfe_step,                  # Number of flow matching steps
-        speed=0.8,                          # Speech speed multiplier hardcoded to 0.7
-        seed=seed,                          # Random seed for reproducibility
-        sway_sampling_coef=sway_sampling_coef,  # Sway sampling for improved quality
-        target_rms=target_rms,              # Target RMS amplitude
-        cross_fade_duration=1,  # Cross-fade duration for chunks hardcoded to 1 second
-        fix_duration=fix_duration,          # Fixed duration (if specified)
-        remove_silence=True,                # Always remove silence regardless of input parameter
+    if output_path:
+        sf.write(output_path, wav, sr)
+        print(f"Generated meditation voice saved to: {output_path}")
+    return wav, sr
+
+def warmup_tts(model_type="F5-TTS", vocoder_name="vocos", device=None, use_ema=True):
+    """
+    Load the F5-TTS model (custom checkpoint and vocab) into tts_models ahead of the first job.
+    """
+    with acquire_tts_model(model_type, vocoder_name, device, use_ema):
+        pass
+
+def warmup_ollama(timeout=180):
+    """
+    Load the Ollama model into memory ahead of the first script (a generate request
+    without a prompt only loads the model). Raises a requests exception if Ollama is
+    unreachable or does not have the model.
+    """
+    response = requests.post(
+        OLLAMA_LOCAL_URL,
+        json={"model": OLLAMA_MODEL, "stream": False},
+        timeout=timeout  # Loading a large model from disk can take a while
     )
-    
-    print(f"Generated meditation voice saved to: {output_path}")
-    return output_path
+    response.raise_for_status()
 
 def generate_meditation_from_text(text, background_path, output_path, ref_audio=None, ref_text=None, 
                            time_resolution=0.25, bg_gain_db=20, model_type="F5-TTS", 
                            vocoder_name="vocos", cfg_strength=2, nfe_step=64, speed=1.0, 
-                           seed=-1, sway_sampling_coef=-1, use_ema=True):
+                           seed=-1, sway_sampling_coef=-1, use_ema=True, stretch_engine="batched",
+                           bg_cache=None, segment_cache=None, streaming=False, bg_index=None,
+                           bed_library=None):
     """
     Generate a complete meditation by:
     1. Converting meditation text to speech using F5-TTS
@@ -441,46 +567,38 @@ def generate_meditation_from_text(text, background_path, output_path, ref_audio=
     - seed: Random seed for reproducibility (default=-1)
     - sway_sampling_coef: Sway sampling coefficient (default=-1, disabled)
     - use_ema: Whether to use EMA weights (default=True)
+    - stretch_engine: PaulStretch implementation ("batched" or "classic")
+    - bg_cache: Optional StretchedBackgroundCache for reusing stretched backgrounds
+    - segment_cache: Optional TTSSegmentCache for reusing synthesized sentences
+    - streaming: Mix the background in bounded memory (see process_audio)
+    - bg_index: Optional BackgroundIndex with precomputed background analyses
+    - bed_library: Optional AmbientBedLibrary to loop the background from instead of rendering it
     """
-    # Create a temporary file for the TTS output
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-        tts_output_path = temp_file.name
+    # Generate TTS audio for meditation voice
+    wav, sr = generate_tts(
+        text, 
+        None, 
+        ref_audio, 
+        ref_text,
+        model_type=model_type,
+        vocoder_name=vocoder_name,
+        cfg_strength=cfg_strength,
+        nfe_step=nfe_step,
+        speed=speed,
+        seed=seed,
+        sway_sampling_coef=sway_sampling_coef,
+        use_ema=use_ema,
+        segment_cache=segment_cache
+    )
     
-    try:
-        # Generate TTS audio for meditation voice
-        generate_tts(
-            text, 
-            tts_output_path, 
-            ref_audio, 
-            ref_text,
-            model_type=model_type,
-            vocoder_name=vocoder_name,
-            cfg_strength=cfg_strength,
-            nfe_step=nfe_step,
-            speed=speed,
-            seed=seed,
-            sway_sampling_coef=sway_sampling_coef,
-            use_ema=use_ema
-        )
-        
-        # Process the generated voice with ambient background
-        process_audio(tts_output_path, background_path, output_path, time_resolution, bg_gain_db)
-        
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(tts_output_path):
-            os.remove(tts_output_path)
+    # Process the generated voice with ambient background, mixing into the voice in place
+    process_audio_array(wav, sr, background_path, output_path, time_resolution, bg_gain_db,
+                        stretch_engine=stretch_engine, bg_cache=bg_cache, streaming=streaming, bg_index=bg_index,
+                        bed_library=bed_library, in_place=True)
 
-def generate_meditation_script(user_worry):
+def build_meditation_prompt(user_worry):
     """
-    Generate a guided meditation script based on the user's worry using local Ollama instance.
-    Streams the output in real-time to show progress.
-    
-    Parameters:
-    - user_worry: String containing what the user is worried about
-    
-    Returns:
-    - A guided meditation script
+    Build the Ollama prompt asking for a guided meditation script about user_worry.
     """
     prompt = f"""
     You are a professional meditation guide. Create a detailed, comprehensive guided meditation script (approximately 1200 words) that helps with the following concern:
@@ -498,38 +616,92 @@ def generate_meditation_script(user_worry):
 
     Write ONLY the meditation script without any additional explanations or headers, and do not greet the user or use words like Namaste.
     """
+    return prompt
+
+def stream_meditation_script(user_worry):
+    """
+    Stream a guided meditation script from the local Ollama instance.
     
-    print(f"Generating comprehensive personalized meditation script using local {OLLAMA_MODEL} model...")
-    print("Streaming output as it's generated:\n" + "-" * 50)
+    Yields text chunks as Ollama produces them. Connection problems are raised
+    as requests exceptions so callers running in worker threads can handle them.
+    Closing the generator before the script is complete closes the stream.
+    """
+    response = requests.post(
+        OLLAMA_LOCAL_URL,
+        json={
+            "model": OLLAMA_MODEL,
+            "prompt": build_meditation_prompt(user_worry),
+            "stream": True
+        },
+        stream=True,
+        timeout=180  # Increase timeout for longer generation
+    )
     
-    # Connect to local Ollama instance with streaming enabled
+    # Process the stream
     try:
-        full_response = ""
-        response = requests.post(
-            OLLAMA_LOCAL_URL,
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": True
-            },
-            stream=True,
-            timeout=180  # Increase timeout for longer generation
-        )
-        
-        # Process the stream
         for line in response.iter_lines():
             if line:
                 # Parse the JSON from each line
                 chunk = json.loads(line.decode('utf-8'))
                 if 'response' in chunk:
-                    text_chunk = chunk['response']
-                    full_response += text_chunk
-                    # Print the chunk without a newline to create a continuous stream effect
-                    print(text_chunk, end='', flush=True)
+                    yield chunk['response']
                 
                 # Check if we're done
                 if chunk.get('done', False):
+                    # The final chunk reports the generated token count and time (in nanoseconds)
+                    if chunk.get('eval_count'):
+                        LLM_TOKENS.inc(chunk['eval_count'])
+                        if chunk.get('eval_duration'):
+                            LLM_TOKENS_PER_SECOND.observe(chunk['eval_count'] / (chunk['eval_duration'] / 1e9))
                     break
+    finally:
+        # Closing the generator early drops the connection, which stops Ollama generating
+        response.close()
+
+def iter_script_segments(chunks, min_chars=300):
+    """
+    Regroup streamed text chunks into complete segments for speech synthesis.
+    
+    A segment is emitted at the first paragraph break or sentence end once at
+    least min_chars characters have accumulated, so no sentence is ever split;
+    whatever remains when the stream ends is emitted last.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= min_chars:
+            boundary = SCRIPT_SEGMENT_BOUNDARY.search(buffer, min_chars - 1)
+            if boundary is None:
+                break
+            segment, buffer = buffer[:boundary.end()].strip(), buffer[boundary.end():]
+            if segment:
+                yield segment
+    
+    segment = buffer.strip()
+    if segment:
+        yield segment
+
+def generate_meditation_script(user_worry):
+    """
+    Generate a guided meditation script based on the user's worry using local Ollama instance.
+    Streams the output in real-time to show progress.
+    
+    Parameters:
+    - user_worry: String containing what the user is worried about
+    
+    Returns:
+    - A guided meditation script
+    """
+    print(f"Generating comprehensive personalized meditation script using local {OLLAMA_MODEL} model...")
+    print("Streaming output as it's generated:\n" + "-" * 50)
+    
+    # Connect to local Ollama instance with streaming enabled
+    try:
+        full_response = ""
+        for text_chunk in stream_meditation_script(user_worry):
+            full_response += text_chunk
+            # Print the chunk without a newline to create a continuous stream effect
+            print(text_chunk, end='', flush=True)
         
         print("\n" + "-" * 50)
         word_count = len(full_response.split())
@@ -563,6 +735,11 @@ def main():
     audio_parser.add_argument("--background", "-b", default="samples/breakfill.wav", help="Ambient background WAV file")
     audio_parser.add_argument("--time-resolution", "-t", type=float, default=0.25, help="Time resolution for ambient background stretching in seconds")
     audio_parser.add_argument("--bg-gain", "-g", type=float, default=20, help="Background gain in dB")
+    audio_parser.add_argument("--stretch-engine", default="batched", choices=sorted(PAULSTRETCH_ENGINES), help="PaulStretch implementation for the ambient background")
+    audio_parser.add_argument("--bg-cache-dir", default=None, help="Cache stretched backgrounds in this directory and reuse them across runs")
+    audio_parser.add_argument("--bg-index-dir", default=None, help="Keep precomputed background analyses in this directory and reuse them across runs")
+    audio_parser.add_argument("--bed-dir", default=None, help="Loop a pre-rendered ambient bed kept in this directory instead of rendering the background for this length")
+    audio_parser.add_argument("--streaming", action="store_true", help="Mix block by block in constant memory, with a peak limiter instead of normalization")
     
     # Parser for text-to-speech mode
     text_parser = subparsers.add_parser("text", help="Create meditation from text")
@@ -573,6 +750,12 @@ def main():
     text_parser.add_argument("--ref-text", default=None, help="Reference text transcription (default: read from samples/ref.reference.txt)")
     text_parser.add_argument("--time-resolution", "-t", type=float, default=0.25, help="Time resolution for ambient background stretching in seconds")
     text_parser.add_argument("--bg-gain", "-g", type=float, default=20, help="Background gain in dB")
+    text_parser.add_argument("--stretch-engine", default="batched", choices=sorted(PAULSTRETCH_ENGINES), help="PaulStretch implementation for the ambient background")
+    text_parser.add_argument("--bg-cache-dir", default=None, help="Cache stretched backgrounds in this directory and reuse them across runs")
+    text_parser.add_argument("--bg-index-dir", default=None, help="Keep precomputed background analyses in this directory and reuse them across runs")
+    text_parser.add_argument("--bed-dir", default=None, help="Loop a pre-rendered ambient bed kept in this directory instead of rendering the background for this length")
+    text_parser.add_argument("--streaming", action="store_true", help="Mix block by block in constant memory, with a peak limiter instead of normalization")
+    text_parser.add_argument("--segment-cache-dir", default=None, help="Cache synthesized sentences in this directory and reuse them across runs")
     text_parser.add_argument("--model-type", default="F5-TTS", choices=["F5-TTS", "E2-TTS"], help="TTS model architecture")
     text_parser.add_argument("--vocoder", default="vocos", choices=["vocos", "bigvgan"], help="Vocoder to use")
     text_parser.add_argument("--cfg-strength", type=float, default=2.0, help="Classifier-free guidance strength (higher = more text faithful)")
@@ -591,6 +774,12 @@ def main():
     personalized_parser.add_argument("--ref-text", default=None, help="Reference text transcription")
     personalized_parser.add_argument("--time-resolution", "-t", type=float, default=0.25, help="Time resolution for ambient background stretching in seconds")
     personalized_parser.add_argument("--bg-gain", "-g", type=float, default=20, help="Background gain in dB")
+    personalized_parser.add_argument("--stretch-engine", default="batched", choices=sorted(PAULSTRETCH_ENGINES), help="PaulStretch implementation for the ambient background")
+    personalized_parser.add_argument("--bg-cache-dir", default=None, help="Cache stretched backgrounds in this directory and reuse them across runs")
+    personalized_parser.add_argument("--bg-index-dir", default=None, help="Keep precomputed background analyses in this directory and reuse them across runs")
+    personalized_parser.add_argument("--bed-dir", default=None, help="Loop a pre-rendered ambient bed kept in this directory instead of rendering the background for this length")
+    personalized_parser.add_argument("--streaming", action="store_true", help="Mix block by block in constant memory, with a peak limiter instead of normalization")
+    personalized_parser.add_argument("--segment-cache-dir", default=None, help="Cache synthesized sentences in this directory and reuse them across runs")
     personalized_parser.add_argument("--model-type", default="F5-TTS", choices=["F5-TTS", "E2-TTS"], help="TTS model architecture")
     personalized_parser.add_argument("--vocoder", default="vocos", choices=["vocos", "bigvgan"], help="Vocoder to use")
     personalized_parser.add_argument("--cfg-strength", type=float, default=2.0, help="Classifier-free guidance strength")
@@ -602,13 +791,31 @@ def main():
     
     args = parser.parse_args()
     
+    bg_cache = None
+    if getattr(args, "bg_cache_dir", None):
+        bg_cache = StretchedBackgroundCache(args.bg_cache_dir)
+    bg_index = None
+    if getattr(args, "bg_index_dir", None):
+        bg_index = BackgroundIndex(args.bg_index_dir)
+    bed_library = None
+    if getattr(args, "bed_dir", None):
+        bed_library = AmbientBedLibrary(args.bed_dir)
+    segment_cache = None
+    if getattr(args, "segment_cache_dir", None):
+        segment_cache = TTSSegmentCache(args.segment_cache_dir)
+    
     if args.mode == "audio" or args.mode is None:  # Default to audio mode for backwards compatibility
         process_audio(
             args.input_file, 
             args.background, 
             args.output, 
             args.time_resolution,
-            args.bg_gain
+            args.bg_gain,
+            stretch_engine=args.stretch_engine,
+            bg_cache=bg_cache,
+            streaming=args.streaming,
+            bg_index=bg_index,
+            bed_library=bed_library
         )
     elif args.mode == "text":
         generate_meditation_from_text(
@@ -626,7 +833,13 @@ def main():
             args.speed,
             args.seed,
             args.sway_sampling,
-            args.use_ema
+            args.use_ema,
+            args.stretch_engine,
+            bg_cache,
+            segment_cache,
+            args.streaming,
+            bg_index,
+            bed_library
         )
     elif args.mode == "personalized":
         # Use the command line argument directly
@@ -651,7 +864,13 @@ def main():
             args.speed,
             args.seed,
             args.sway_sampling,
-            args.use_ema
+            args.use_ema,
+            args.stretch_engine,
+            bg_cache,
+            segment_cache,
+            args.streaming,
+            bg_index,
+            bed_library
         )
         
         print(f"\nYour personalized meditation has been created: {args.output}")
@@ -0,0 +1,205 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets (seconds) for stage latencies, from a cache hit to a long render
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Buckets for throughput ratios (TTS real-time factor)
+RATIO_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+# Buckets for LLM generation speed (tokens per second)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape_help(text):
+    return str(text).replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape(value):
+    return _escape_help(value).replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class _Metric:
+    """A named metric with a fixed set of label names and one value per label combination"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def samples(self):
+        """List of (name suffix, labels, value) for the exposition"""
+        with self._lock:
+            return [("", key, value) for key, value in sorted(self._values.items())]
+
+class Counter(_Metric):
+    """Monotonically increasing count (e.g. bytes served)"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Value that goes up and down (e.g. jobs running)"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets, with their sum and count,
+    as Prometheus histograms (quantiles are computed by the server from the buckets).
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block (also when it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                result.append(("_bucket", key + (("le", _format_value(float(bound))),), count))
+            result.append(("_sum", key, total))
+            result.append(("_count", key, counts[-1]))
+        return result
+
+class MetricsRegistry:
+    """
+    In-process metrics, rendered in the Prometheus text exposition format.
+
+    Metrics updated where things happen (counters, gauges, histograms) are created
+    through counter(), gauge() and histogram(). Values that other objects already
+    keep (queue depth, cache hit counters) are read when the metrics are rendered,
+    by collectors: callables returning (name, kind, documentation, [(labels, value)]).
+    Nothing is sent anywhere; a scraper polls render() through the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collect):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        """All metrics as Prometheus text format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families = [(m.name, m.kind, m.documentation, m.samples()) for m in metrics]
+        for collect in collectors:
+            try:
+                for name, kind, documentation, values in collect():
+                    samples = [("", tuple(sorted(labels.items())), value) for labels, value in values]
+                    families.append((name, kind, documentation, samples))
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+        lines = []
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {_escape_help(documentation)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                if value is None:
+                    continue
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry exposed by the server at /metrics
+registry = MetricsRegistry()
+
+# Pipeline stages as held through JobScheduler.stage(): llm, tts, dsp
+STAGE_SECONDS = registry.histogram(
+    "oneiro_stage_seconds", "Time jobs spent in each pipeline stage", ["stage"])
+STAGE_WAIT_SECONDS = registry.histogram(
+    "oneiro_stage_wait_seconds", "Time jobs waited for a free slot of each pipeline stage", ["stage"])
+# Steps of post-processing inside the dsp stage: paulstretch, mix, write
+DSP_STEP_SECONDS = registry.histogram(
+    "oneiro_dsp_step_seconds", "Time spent stretching, mixing and writing meditation audio", ["step"])
+JOB_SECONDS = registry.histogram(
+    "oneiro_job_seconds", "Wall time of meditation jobs on a worker")
+JOB_QUEUE_WAIT_SECONDS = registry.histogram(
+    "oneiro_job_queue_wait_seconds", "Time jobs waited in the admission queue for a worker")
+LLM_TOKENS = registry.counter(
+    "oneiro_llm_tokens_total", "Tokens generated by Ollama")
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "oneiro_llm_tokens_per_second", "Ollama generation speed per script", buckets=TOKEN_RATE_BUCKETS)
+TTS_AUDIO_SECONDS = registry.counter(
+    "oneiro_tts_audio_seconds_total", "Seconds of speech synthesized by F5-TTS")
+TTS_REALTIME_FACTOR = registry.histogram(
+    "oneiro_tts_realtime_factor", "Seconds of speech synthesized per second of F5-TTS inference, per batch",
+    buckets=RATIO_BUCKETS)
+BYTES_SERVED = registry.counter(
+    "oneiro_audio_bytes_served_total", "Meditation audio bytes sent to clients", ["format"])
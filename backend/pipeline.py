@@ -0,0 +1,216 @@
+import queue
+import threading
+import time
+from contextlib import closing, contextmanager, nullcontext
+
+from main import (
+    stream_meditation_script,
+    iter_script_segments,
+    acquire_tts_model,
+    resolve_voice_profile,
+    split_tts_batches,
+    split_tts_sentences,
+    synthesize_tts_batches,
+    synthesize_tts_sentences,
+    tts_model_id,
+    cross_fade_waves,
+    TTS_SENTENCE_CROSS_FADE,
+    process_audio_array,
+    remove_long_silences,
+)
+
+# Script segments that may wait for the TTS worker before the LLM stream is paused
+PIPELINE_QUEUE_SIZE = 4
+# Minimum characters per segment handed from the LLM stream to TTS
+PIPELINE_MIN_SEGMENT_CHARS = 300
+# Expected script length (the prompt asks for ~1200 words of ~6 characters), used to
+# estimate the total batch count while the script is still streaming
+PIPELINE_EXPECTED_SCRIPT_CHARS = 1200 * 6
+# Seconds a failed job waits for the script producer to stop before raising its error
+# (it stops at Ollama's next token; this only matters while Ollama sends nothing)
+PIPELINE_CANCEL_TIMEOUT = 5
+
+_END_OF_SCRIPT = object()
+
+def generate_meditation_pipelined(user_worry, background_path, output_path, progress_callback=None,
+                                  ref_audio=None, ref_text=None, model_type="F5-TTS", vocoder_name="vocos",
+                                  device=None, use_ema=True, cfg_strength=2, nfe_step=64, seed=-1,
+                                  sway_sampling_coef=-1, target_rms=0.1, time_resolution=0.25, bg_gain_db=20,
+                                  bg_cache=None, queue_size=PIPELINE_QUEUE_SIZE,
+                                  min_segment_chars=PIPELINE_MIN_SEGMENT_CHARS, stage=None, segment_cache=None,
+                                  dsp_pool=None, streaming=False, bg_index=None, bed_library=None):
+    """
+    Generate a meditation with script generation and speech synthesis overlapped.
+
+    A producer thread streams the script from Ollama and puts complete segments
+    (whole sentences or paragraphs) on a bounded queue, while this thread
+    synthesizes them as they arrive. The batch waveforms are cross-faded together
+    at the end, exactly as generate_tts joins its batches, and mixed with the
+    ambient background by process_audio_array, all in memory.
+
+    Parameters:
+    - user_worry: What the user is worried about
+    - background_path: Ambient background audio file
+    - output_path: Where to save the final meditation
+    - progress_callback: Called as progress_callback('processing', done, total, stats) after every
+      TTS batch, and progress_callback('post_processing') before mixing. While the script is
+      still streaming, total is estimated from PIPELINE_EXPECTED_SCRIPT_CHARS
+    - queue_size: Segments that may be buffered before the LLM stream is paused
+    - min_segment_chars: Minimum segment size handed to TTS
+    - stage: Optional callable(name) returning a context manager that limits concurrent use of the
+      'llm', 'tts' and 'dsp' stages (see job_queue.JobScheduler.stage). The LLM slot is held for the
+      whole stream, the TTS slot per segment and the DSP slot while mixing
+    - segment_cache: Optional TTSSegmentCache; segments are then synthesized sentence by sentence
+      and only uncached sentences take the TTS slot (see main.synthesize_tts_sentences)
+    - dsp_pool: Optional DSPPool stretching the background in a worker process
+    - streaming: Mix the background in bounded memory (see dsp.process_audio)
+    - bg_index: Optional BackgroundIndex with the background's precomputed analysis
+    - bed_library: Optional AmbientBedLibrary to loop the background from instead of rendering it
+
+    The TTS parameters match generate_tts (speed and cross-fade are fixed the same way).
+
+    Returns:
+    - The full meditation script
+    """
+    if stage is None:
+        stage = lambda name: nullcontext()
+
+    @contextmanager
+    def tts_model():
+        with stage('tts'), acquire_tts_model(model_type, vocoder_name, device, use_ema) as tts:
+            yield tts
+
+    tts_params = dict(
+        cfg_strength=cfg_strength,
+        nfe_step=nfe_step,
+        speed=0.8,                      # Same fixed speech speed as generate_tts
+        sway_sampling_coef=sway_sampling_coef,
+        target_rms=target_rms,
+    )
+
+    segments = queue.Queue(maxsize=queue_size)
+    script_chunks = []
+    producer_error = []
+    streaming_done = threading.Event()
+    cancelled = threading.Event()
+
+    def put(item):
+        # Give up instead of blocking forever if the TTS side has failed
+        while not cancelled.is_set():
+            try:
+                segments.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def record(chunks):
+        for chunk in chunks:
+            # Stop at the next token rather than the next segment, so a failed job
+            # gives up its LLM slot right away
+            if cancelled.is_set():
+                return
+            script_chunks.append(chunk)
+            yield chunk
+
+    def produce():
+        try:
+            with stage('llm'), closing(stream_meditation_script(user_worry)) as chunks:
+                print("Streaming meditation script into the TTS pipeline...")
+                count = 0
+                for segment in iter_script_segments(record(chunks), min_segment_chars):
+                    if cancelled.is_set():
+                        break
+                    count += 1
+                    print(f"Script segment {count} ready ({len(segment)} chars)")
+                    put(segment)
+        except BaseException as e:
+            producer_error.append(e)
+        finally:
+            streaming_done.set()
+            put(_END_OF_SCRIPT)
+
+    producer = threading.Thread(target=produce, name="script-producer")
+    producer.daemon = True
+    producer.start()
+
+    if progress_callback:
+        progress_callback('initializing')
+
+    waves = []
+    sr = None
+    done_batches = 0
+    done_chars = 0
+    audio_seconds = 0.0
+    tts_seconds = 0.0
+    start = time.time()
+
+    try:
+        profile = resolve_voice_profile(ref_audio, ref_text)
+
+        while True:
+            segment = segments.get()
+            if segment is _END_OF_SCRIPT:
+                break
+
+            # Hold the shared model only while this segment is being synthesized
+            segment_start = time.time()
+            if segment_cache is not None:
+                batches = split_tts_sentences(profile, segment)
+                segment_waves, sr = synthesize_tts_sentences(profile, batches, segment_cache, tts_model,
+                                                             tts_model_id(model_type, vocoder_name, use_ema),
+                                                             seed=seed, **tts_params)
+            else:
+                with tts_model() as tts:
+                    batches = split_tts_batches(profile, segment)
+                    segment_waves, sr = synthesize_tts_batches(tts, profile, batches, seed=seed, **tts_params)
+            tts_seconds += time.time() - segment_start
+
+            waves.extend(segment_waves)
+            done_batches += len(batches)
+            done_chars += len(segment)
+            audio_seconds += sum(len(wave) for wave in segment_waves) / sr
+
+            if progress_callback:
+                # The batch count is only known once the script has finished streaming;
+                # until then extrapolate from the batches per character seen so far
+                total = done_batches + segments.qsize()
+                if not streaming_done.is_set():
+                    expected = int(done_batches * PIPELINE_EXPECTED_SCRIPT_CHARS / done_chars)
+                    total = max(total + 1, expected)
+                elapsed = time.time() - start
+                stats = {
+                    'audio_seconds': round(audio_seconds, 2),
+                    'elapsed_seconds': round(elapsed, 2),
+                    'realtime_factor': round(audio_seconds / tts_seconds, 3) if tts_seconds > 0 else None,
+                    'eta_seconds': None,
+                }
+                progress_callback('processing', done_batches, total, stats)
+    except BaseException:
+        cancelled.set()
+        # The producer closes the Ollama stream and releases its slot at the next token
+        producer.join(PIPELINE_CANCEL_TIMEOUT)
+        raise
+    producer.join()
+
+    if producer_error:
+        raise producer_error[0]
+    if not waves:
+        raise RuntimeError("Ollama returned an empty meditation script")
+
+    script = "".join(script_chunks)
+    print(f"Pipelined synthesis finished: {len(script.split())} words, {audio_seconds:.1f}s of speech "
+          f"in {time.time() - start:.1f}s")
+
+    # Stitch the batches in memory, then hand over to the usual post-processing
+    # Cross-fade durations as in generate_tts (1 second between batches, short between sentences)
+    cross_fade_duration = TTS_SENTENCE_CROSS_FADE if segment_cache is not None else 1
+    wav = remove_long_silences(cross_fade_waves(waves, sr, cross_fade_duration=cross_fade_duration), sr)
+
+    if progress_callback:
+        progress_callback('post_processing')
+    with stage('dsp'):
+        process_audio_array(wav, sr, background_path, output_path, time_resolution, bg_gain_db,
+                            bg_cache=bg_cache, dsp_pool=dsp_pool, streaming=streaming, bg_index=bg_index,
+                            bed_library=bed_library, in_place=True)
+
+    return script
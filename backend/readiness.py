@@ -0,0 +1,92 @@
+import threading
+import time
+
+# Seconds between attempts of a warmup step that may succeed later (e.g. Ollama starting up)
+DEFAULT_RETRY_INTERVAL = 10
+
+class Readiness:
+    """
+    Warmup of the server's heavy components, tracked for a readiness probe.
+
+    The server answers health checks as soon as it is listening; loading the TTS model,
+    indexing backgrounds and loading the Ollama model happen here, on one background
+    thread, one step after another. Each step is a named component that is 'pending',
+    'warming', 'ready' or 'error'; the server is ready once every component is. A step
+    added with retry=True is attempted again every retry_interval seconds until it
+    succeeds (services it depends on may come up after the server), so such steps
+    should go last.
+
+    Jobs submitted before the server is ready still run: they load what they need
+    themselves, just more slowly.
+
+    Parameters:
+    - retry_interval: seconds between attempts of retried steps
+    """
+
+    def __init__(self, retry_interval=DEFAULT_RETRY_INTERVAL):
+        self.retry_interval = retry_interval
+        self.started_at = time.time()
+        self.ready_at = None
+        self._lock = threading.Lock()
+        self._steps = []
+        self._components = {}
+        self._thread = None
+
+    def add(self, name, warm, retry=False):
+        """Add a warmup step: warm() is called on the warmup thread and raises on failure"""
+        with self._lock:
+            self._steps.append((name, warm, retry))
+            self._components[name] = {'status': 'pending', 'seconds': None, 'attempts': 0, 'error': None}
+
+    def start(self):
+        """Run the warmup steps on a background thread"""
+        with self._lock:
+            if not self._steps:
+                self.ready_at = time.time()
+                return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._components[name].update(fields)
+            if self.ready_at is None and all(c['status'] == 'ready' for c in self._components.values()):
+                self.ready_at = time.time()
+
+    def _run(self):
+        for name, warm, retry in self._steps:
+            attempts = 0
+            while True:
+                attempts += 1
+                self._update(name, status='warming', attempts=attempts)
+                start = time.time()
+                try:
+                    warm()
+                except Exception as e:
+                    self._update(name, status='error', error=str(e))
+                    if not retry:
+                        print(f"Warmup of {name} failed: {e}")
+                        break
+                    print(f"Warmup of {name} failed, retrying in {self.retry_interval}s: {e}")
+                    time.sleep(self.retry_interval)
+                    continue
+                seconds = time.time() - start
+                self._update(name, status='ready', seconds=round(seconds, 3), error=None)
+                print(f"Warmed up {name} in {seconds:.1f}s")
+                break
+        if self.ready_at is not None:
+            print(f"Server ready {self.ready_at - self.started_at:.1f}s after startup")
+
+    def is_ready(self):
+        with self._lock:
+            return self.ready_at is not None
+
+    def status(self):
+        """Readiness, per-component warmup state and time since startup"""
+        with self._lock:
+            return {
+                'ready': self.ready_at is not None,
+                'components': {name: dict(component) for name, component in self._components.items()},
+                'uptime_seconds': round(time.time() - self.started_at, 3),
+                'ready_after_seconds': round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            }
@@ -0,0 +1,98 @@
+import collections
+import hashlib
+import json
+import re
+import threading
+import time
+
+# Identical requests reuse an earlier job's result for this long (seconds)
+DEFAULT_RESULT_TTL = 6 * 60 * 60
+# Most distinct requests remembered before the least recently used is dropped
+DEFAULT_RESULT_CACHE_SIZE = 1000
+
+def normalize_worry(worry):
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivially different worries match"""
+    worry = re.sub(r"\s+", " ", worry.casefold()).strip()
+    return worry.rstrip(".!?,;: ")
+
+def result_key(worry, **params):
+    """Cache key for a generation request: normalized worry plus every parameter affecting the result"""
+    payload = json.dumps({'worry': normalize_worry(worry), 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Maps generation requests to the job that produced (or is producing) their result.
+
+    A request whose key is already mapped to a usable job is answered with that job
+    instead of starting a new one: a running job is shared by every identical request
+    (in-flight coalescing), a completed one is returned as is. The job records and
+    audio themselves stay in the job store; this only remembers which job to reuse.
+
+    Parameters:
+    - ttl: seconds an entry stays reusable after it was created
+    - max_entries: least recently used entries are dropped beyond this
+    """
+
+    def __init__(self, ttl=DEFAULT_RESULT_TTL, max_entries=DEFAULT_RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def claim(self, key, job_id, usable, fresh=False):
+        """
+        Return the job that should serve key, registering job_id for it unless an
+        existing one can be reused.
+
+        Parameters:
+        - key: result_key() of the request
+        - job_id: id of the new job the caller will start if it gets its own id back
+        - usable: callable(job_id) -> None if the job can no longer be reused, otherwise
+          'running' or 'completed'
+        - fresh: skip reuse and make job_id the result for key from now on
+
+        Returns:
+        - (job_id to use, 'running' | 'completed' if reused else None)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not fresh and self.ttl > 0 and now - entry[1] < self.ttl:
+                state = usable(entry[0])
+                if state is not None:
+                    self._entries.move_to_end(key)
+                    if state == 'running':
+                        self.coalesced += 1
+                    else:
+                        self.hits += 1
+                    return entry[0], state
+
+            self.misses += 1
+            if self.ttl > 0 and self.max_entries > 0:
+                self._entries[key] = (job_id, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return job_id, None
+
+    def release(self, key, job_id):
+        """Forget key if it still points at job_id (e.g. the job could not be started)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == job_id:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,161 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+import soundfile as sf
+
+# Default location and size limit for synthesized sentence audio
+SEGMENT_CACHE_DIR = "cache/segments"
+SEGMENT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+def normalize_sentence(sentence):
+    """Collapse whitespace; case and punctuation are kept since they change the delivery"""
+    return re.sub(r"\s+", " ", sentence).strip()
+
+def segment_key(sentence, voice_hash, model_id, nfe_step, cfg_strength, speed, seed, **params):
+    """
+    Content address of one synthesized sentence.
+
+    Parameters:
+    - sentence: text of the sentence (normalized here)
+    - voice_hash: VoiceProfile.audio_hash of the reference voice
+    - model_id: identifies the model, vocoder and checkpoint
+    - nfe_step, cfg_strength, speed, seed: F5-TTS generation parameters
+    - params: any further parameter that changes the audio (sway sampling, target RMS, ...)
+    """
+    payload = json.dumps({
+        'text': normalize_sentence(sentence),
+        'voice': voice_hash,
+        'model': model_id,
+        'nfe_step': nfe_step,
+        'cfg_strength': cfg_strength,
+        'speed': speed,
+        'seed': seed,
+        'params': params,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class TTSSegmentCache:
+    """
+    Disk-backed, content-addressed cache of synthesized sentences.
+
+    Each entry is a float WAV (so the sample rate travels with the samples) stored
+    under a two-character shard directory. Least recently used entries are evicted
+    once the cache exceeds max_bytes; file modification times serve as the LRU clock.
+    The entry count and size are counted once at startup and then kept up to date in
+    memory, so only eviction walks the cache directory.
+
+    Parameters:
+    - cache_dir: directory holding the entries
+    - max_bytes: total size cap for all entries
+    """
+
+    def __init__(self, cache_dir=SEGMENT_CACHE_DIR, max_bytes=SEGMENT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        entries = self.entries()
+        self._entries = len(entries)
+        self._bytes = sum(size for _, size, _ in entries)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def get(self, key):
+        """
+        Cached (waveform, sample rate) for key, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            wave, sr = sf.read(path, dtype="float32")
+            os.utime(path)  # Mark as recently used
+        except (OSError, RuntimeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return wave, sr
+
+    def put(self, key, wave, sr):
+        """Store a synthesized sentence, evicting old entries if the cache is over its limit"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            sf.write(tmp_path, wave, sr, format="WAV", subtype="FLOAT")
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                # Replacing an entry (e.g. two jobs synthesizing the same sentence) only changes its size
+                try:
+                    replaced = os.path.getsize(path)
+                except FileNotFoundError:
+                    replaced = None
+                os.replace(tmp_path, path)
+                if replaced is None:
+                    self._entries += 1
+                self._bytes += size - (replaced or 0)
+                over = self._bytes > self.max_bytes
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if over:
+            self.evict()
+
+    def entries(self):
+        """List (path, size, mtime) for every cached sentence, oldest first"""
+        result = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*", "*.wav")):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((path, st.st_size, st.st_mtime))
+        return sorted(result, key=lambda entry: entry[2])
+
+    def evict(self):
+        """Delete least recently used sentences until the cache fits in max_bytes"""
+        entries = self.entries()
+        count = len(entries)
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                count -= 1
+                total -= size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            # Resynchronize with the directory, which was just listed anyway
+            self._entries = count
+            self._bytes = total
+
+    def stats(self):
+        """Hit/miss counters and current disk usage"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries, total = self._entries, self._bytes
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': total,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"hits={stats['hits']}, misses={stats['misses']}, hit_rate={stats['hit_rate']:.0%}, "
+                f"entries={stats['entries']}")
@@ -1,13 +1,27 @@
-from flask import Flask, request, jsonify, send_file, redirect
+from flask import Flask, Response, request, jsonify, send_file, redirect
 from flask_cors import CORS
 import os
-import tempfile
 import uuid
-import threading
 import json
+import math
 import traceback
 import sys
-from main import generate_meditation_script, generate_meditation_from_text, generate_tts, process_audio
+from main import (generate_meditation_script, generate_meditation_from_text, generate_tts, process_audio_array,
+                  tts_models, import_tts, warmup_tts, warmup_ollama, voice_profiles, register_voice_profile)
+from bg_cache import StretchedBackgroundCache, BACKGROUND_CACHE_DIR
+from bg_index import BackgroundIndex, BACKGROUND_INDEX_DIR
+from bg_bed import AmbientBedLibrary, BED_DIR, BED_SECONDS
+from segment_cache import TTSSegmentCache, SEGMENT_CACHE_DIR
+from dsp_pool import DSPPool, DEFAULT_DSP_PROCESSES
+from pipeline import generate_meditation_pipelined
+from job_store import (SQLiteJobStore, MemoryJobStore, JobGarbageCollector, JOB_DB_PATH, DEFAULT_JOB_TTL,
+                       DEFAULT_ARTIFACT_MAX_BYTES, DEFAULT_GC_INTERVAL, FINISHED_STATUSES)
+from audio_formats import AUDIO_FORMATS, AudioEncoder, artifact_etag, audio_path, available_formats, parse_accept
+from result_cache import ResultCache, result_key, DEFAULT_RESULT_TTL, DEFAULT_RESULT_CACHE_SIZE
+from job_queue import JobScheduler, QueueFull, DEFAULT_JOB_WORKERS, DEFAULT_MAX_QUEUED_JOBS, DEFAULT_STAGE_LIMITS
+from readiness import Readiness, DEFAULT_RETRY_INTERVAL
+from metrics import registry as metrics_registry, BYTES_SERVED
+from job_profiler import JobProfiler, profile_paths
 import time
 import argparse
 import secrets
@@ -22,8 +36,65 @@ UPLOAD_FOLDER = 'generated_meditations'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-# In-memory job status tracking
-jobs = {}
+# Job status tracking; the server replaces it with a SQLite store unless --job-store memory is given
+job_store = MemoryJobStore()
+
+# Overlap script generation and speech synthesis unless a request says otherwise (--pipeline)
+PIPELINED_BY_DEFAULT = False
+
+# Bounded queue and worker pool running meditation jobs (sized with --job-workers etc.)
+job_scheduler = JobScheduler()
+
+# Format meditations are delivered in unless a request asks for another (--audio-format)
+DEFAULT_AUDIO_FORMAT = 'wav'
+# Seconds a client is told to wait while a compressed variant is being encoded
+ENCODE_RETRY_AFTER = 2
+# A finished variant (?format=) never changes, so clients may cache it for as long as they like
+AUDIO_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+# Without ?format= the variant served changes as encodes finish, so clients revalidate (ETag) every time
+NEGOTIATED_AUDIO_CACHE_CONTROL = 'private, no-cache'
+
+# Ambient background mixed under every meditation
+BACKGROUND_PATH = "samples/breakfill.wav"
+# Sample rate of synthesized speech (F5-TTS), which backgrounds are resampled to
+BACKGROUND_SAMPLE_RATE = 24000
+
+# Identical requests share one job instead of generating the same meditation again
+result_cache = ResultCache()
+
+# Thread pool encoding finished meditations into FLAC/Ogg variants
+audio_encoder = AudioEncoder(UPLOAD_FOLDER)
+
+# Longest a status long-poll (?wait=) may block, and the SSE keep-alive interval (seconds)
+MAX_STATUS_WAIT = 60
+EVENT_KEEPALIVE_INTERVAL = 15
+# Most jobs a single batch status request may ask about
+MAX_BATCH_STATUS_JOBS = 500
+
+# Shared cache of stretched ambient backgrounds (disabled with --no-bg-cache)
+background_cache = StretchedBackgroundCache()
+
+# Precomputed PaulStretch analysis of background assets (disabled with --no-bg-index)
+background_index = BackgroundIndex()
+
+# Pre-rendered ambient beds looped to each job's length (--bg-mode bed; None renders per job)
+ambient_beds = None
+
+# Sentence-level cache of synthesized speech, enabled with --segment-cache (None synthesizes in batches)
+tts_segment_cache = None
+
+# Worker processes stretching ambient backgrounds, started with --dsp-processes
+# (None renders them in the job thread)
+dsp_pool = None
+
+# Mix meditations block by block in bounded memory (--streaming-dsp)
+STREAMING_DSP = False
+
+# Warmup of the TTS model, backgrounds and Ollama, run on a background thread at startup
+readiness = Readiness()
+
+# Whether requests may ask for their job to be profiled (--allow-profiling)
+PROFILING_ALLOWED = False
 
 # API Security configuration
 API_KEY_FILE = os.path.join(os.path.dirname(__file__), 'api_key.txt')
@@ -98,35 +169,74 @@ def generate_meditation():
         print(f"Request data: {data}")
         
         user_worry = data.get('worry', '')
+        pipelined = bool(data.get('pipelined', PIPELINED_BY_DEFAULT))
+        audio_format = data.get('format', DEFAULT_AUDIO_FORMAT)
+        # Ask for a new variation instead of reusing an identical earlier request's result
+        fresh = bool(data.get('fresh', False))
+        # Profile this job (only honored with --allow-profiling); a profiled job always runs
+        profile = PROFILING_ALLOWED and (bool(data.get('profile', False))
+                                         or request.headers.get('X-Profile-Job', '').lower() in ('1', 'true'))
+        fresh = fresh or profile
         
         if not user_worry:
             print("Error: No worry description provided")
             return jsonify({'error': 'No worry description provided'}), 400
         
+        if audio_format not in AUDIO_FORMATS:
+            return jsonify({'error': f"Unsupported audio format: {audio_format}",
+                            'formats': list(AUDIO_FORMATS)}), 400
+        
         # Create a unique job ID
         job_id = str(uuid.uuid4())
         print(f"Created job ID: {job_id}")
         
         # Set initial job status
-        jobs[job_id] = {
-            'status': 'pending',
-            'progress': 0,
-            'meditation_script': '',
-            'audio_url': None
-        }
-        
-        # Run meditation generation in a background thread
-        thread = threading.Thread(
-            target=process_meditation_job,
-            args=(job_id, user_worry)
+        job_store.create(
+            job_id,
+            status='queued',
+            progress=0,
+            meditation_script='',
+            audio_url=None,
+            audio_format=audio_format
         )
-        thread.daemon = True
-        thread.start()
         
-        print(f"Started background job for {job_id}")
+        # Attach to a running or finished job for the same request if there is one
+        cache_key = result_key(user_worry, pipelined=pipelined, format=audio_format, background=BACKGROUND_PATH)
+        reused_id, reused_state = result_cache.claim(cache_key, job_id, reusable_job_state, fresh=fresh)
+        if reused_id != job_id:
+            job_store.delete(job_id)
+            print(f"Request matches job {reused_id} ({reused_state}), reusing it")
+            reused_job = job_store.get(reused_id) or {}
+            return jsonify({
+                'job_id': reused_id,
+                'status': reused_job.get('status', 'queued'),
+                'cached': reused_state == 'completed',
+                'coalesced': reused_state == 'running',
+                'message': 'Meditation already generated' if reused_state == 'completed'
+                           else 'Identical meditation already in progress'
+            })
+        
+        # Hand the job to the worker pool, refusing it if too many are already waiting
+        try:
+            queue_position = job_scheduler.submit(job_id, process_meditation_job, job_id, user_worry,
+                                                 pipelined, audio_format, profile)
+        except QueueFull as e:
+            job_store.delete(job_id)
+            result_cache.release(cache_key, job_id)
+            print(f"Rejected job {job_id}: {str(e)}")
+            response = jsonify({
+                'error': 'Server is busy, please try again later',
+                'retry_after': e.retry_after
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+        
+        print(f"Queued job {job_id} at position {queue_position}")
         return jsonify({
             'job_id': job_id,
-            'status': 'pending',
+            'status': 'queued',
+            'queue_position': queue_position,
+            'profile_requested': profile,
             'message': 'Meditation generation started'
         })
         
@@ -139,7 +249,20 @@ def generate_meditation():
             'details': error_details
         }), 500
 
-def generate_meditation_from_text_with_progress(text, background_path, output_path, progress_callback=None, **kwargs):
+def reusable_job_state(job_id):
+    """
+    Whether a job can serve an identical request: 'running' while it is queued or in
+    progress, 'completed' once its audio is on disk, None if it failed or is gone.
+    """
+    job = job_store.get(job_id)
+    if job is None or job.get('status') == 'error':
+        return None
+    if job.get('status') == 'completed':
+        return 'completed' if available_formats(UPLOAD_FOLDER, job_id) else None
+    return 'running'
+
+def generate_meditation_from_text_with_progress(text, background_path, output_path, progress_callback=None,
+                                                stage=None, **kwargs):
     """
     Wrapper for generate_meditation_from_text that adds progress reporting.
     
@@ -148,161 +271,141 @@ def generate_meditation_from_text_with_progress(text, background_path, output_pa
         background_path: Path to background audio file
         output_path: Where to save the output audio
         progress_callback: Function to call with progress updates
+        stage: Context manager factory holding a pipeline stage (job_scheduler.stage if None)
         **kwargs: Additional arguments to pass to generate_meditation_from_text
     """
-    # Start by estimating text chunks
-    # Average English word is about 5 characters
-    # F5 processes roughly about 25 words per chunk (estimate)
-    words = text.split()
-    total_words = len(words)
-    estimated_chunks = max(1, total_words // 25)
-    
-    # Report initial setup
-    if progress_callback:
-        progress_callback('initializing')
+    stage = stage or job_scheduler.stage
+    # Generate the TTS audio; generate_tts reports model setup, batch planning
+    # and real per-batch completion (with measured throughput) through the callback
+    # (one job at a time per TTS slot of the scheduler)
+    with stage('tts'):
+        wav, sr = generate_tts(
+            text, 
+            progress_callback=progress_callback,
+            segment_cache=tts_segment_cache,
+            # Pass through any relevant kwargs
+            **{k: v for k, v in kwargs.items() if k in [
+                'ref_audio', 'ref_text', 'model_type', 'vocoder_name',
+                'cfg_strength', 'nfe_step', 'speed', 'seed',
+                'sway_sampling_coef', 'use_ema'
+            ]}
+        )
     
-    # Report text chunking step
+    # Report post-processing stage
     if progress_callback:
-        progress_callback('chunking')
-    
-    # Create a temporary file for the TTS output
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-        tts_output_path = temp_file.name
-    
-    try:
-        # This is where the actual F5 TTS processing happens
-        # Since we can't directly hook into each batch processing,
-        # we'll simulate progress updates based on text length
-        
-        # Initialize F5-TTS and other setup
-        if progress_callback:
-            progress_callback('processing', 1, estimated_chunks)
-        
-        # Create a simulated chunk_monitor thread that updates progress
-        # while the TTS process is running
-        stop_monitor = False
-        
-        def chunk_monitor():
-            chunk = 1
-            while not stop_monitor and chunk < estimated_chunks:
-                time.sleep(max(0.5, 60 / estimated_chunks))  # Sleep time based on estimated chunks
-                if progress_callback:
-                    # Only update if we haven't reached the end
-                    if chunk < estimated_chunks:
-                        chunk += 1
-                        progress_callback('processing', chunk, estimated_chunks)
-        
-        # Start the monitor thread
-        if progress_callback:
-            monitor_thread = threading.Thread(target=chunk_monitor)
-            monitor_thread.daemon = True
-            monitor_thread.start()
+        progress_callback('post_processing')
         
-        try:
-            # Generate the TTS audio 
-            generate_tts(
-                text, 
-                tts_output_path, 
-                # Pass through any relevant kwargs
-                **{k: v for k, v in kwargs.items() if k in [
-                    'ref_audio', 'ref_text', 'model_type', 'vocoder_name',
-                    'cfg_strength', 'nfe_step', 'speed', 'seed',
-                    'sway_sampling_coef', 'use_ema'
-                ]}
-            )
-        finally:
-            # Signal the monitor thread to stop
-            stop_monitor = True
-            if progress_callback:
-                # Ensure we report completion of processing stage
-                progress_callback('processing', estimated_chunks, estimated_chunks)
-        
-        # Report post-processing stage
-        if progress_callback:
-            progress_callback('post_processing')
-            
-        # Process audio with background
-        process_audio(tts_output_path, background_path, output_path, 
-                     time_resolution=kwargs.get('time_resolution', 0.25),
-                     bg_gain_db=kwargs.get('bg_gain_db', 20))
-        
-        return output_path
-        
-    finally:
-        # Clean up temporary file
-        if os.path.exists(tts_output_path):
-            try:
-                os.remove(tts_output_path)
-            except:
-                pass
+    # Process audio with background; the voice is handed over in memory and mixed into in place
+    with stage('dsp'):
+        process_audio_array(wav, sr, background_path, output_path, 
+                            time_resolution=kwargs.get('time_resolution', 0.25),
+                            bg_gain_db=kwargs.get('bg_gain_db', 20),
+                            bg_cache=background_cache,
+                            bg_index=background_index,
+                            bed_library=ambient_beds,
+                            dsp_pool=dsp_pool,
+                            streaming=STREAMING_DSP,
+                            in_place=True)
+    
+    return output_path
 
-def process_meditation_job(job_id, user_worry):
+def process_meditation_job(job_id, user_worry, pipelined=False, audio_format='wav', profile=False):
     """
     Background process to generate meditation script and audio.
     Updates job status as it progresses.
+    
+    With pipelined=True the script is streamed straight into speech synthesis
+    (see pipeline.generate_meditation_pipelined) instead of being generated first.
+    The WAV master is always written; any other audio_format is encoded from it
+    before the job completes.
+    
+    With profile=True the job runs under a JobProfiler. The job's profiled field
+    tells whether it is actually profiled (only one job is at a time), and its
+    profile_url is set together with the final status, so clients that stop
+    watching at 'completed' or 'error' see it. Unprofiled jobs run exactly as before.
+    """
+    if not profile:
+        job_store.update(job_id, **run_meditation_job(job_id, user_worry, pipelined, audio_format,
+                                                      job_scheduler.stage))
+        return
+    
+    profiler = JobProfiler(job_id, UPLOAD_FOLDER)
+    with profiler:
+        job_store.update(job_id, profiled=profiler.active)
+        final = run_meditation_job(job_id, user_worry, pipelined, audio_format,
+                                   lambda name: profiler.stage(name, job_scheduler.stage))
+    if profiler.summary is not None:
+        final['profile_url'] = f"/api/meditation-profile/{job_id}"
+    job_store.update(job_id, **final)
+
+def run_meditation_job(job_id, user_worry, pipelined, audio_format, stage):
+    """
+    Generate one meditation for process_meditation_job, holding pipeline stages
+    through stage(name).
+    
+    Returns the job's final updates (status 'completed' or 'error'), which the
+    caller applies once the job is done with.
     """
     try:
         print(f"Processing job {job_id} with worry: {user_worry[:30]}...")
         
         # Step 1: Initialize job (5%)
-        jobs[job_id]['status'] = 'initializing'
-        jobs[job_id]['progress'] = 5
-        
-        # Step 2: Preparing to generate script (10%)
-        print(f"Preparing to generate meditation script for job {job_id}")
-        jobs[job_id]['status'] = 'generating_script'
-        jobs[job_id]['progress'] = 10
-        
-        # Step 3: Generating meditation script (15-35%)
-        # Start script generation
-        print(f"Generating meditation script for job {job_id}")
-        
-        # Update progress to 15% to indicate script generation started
-        jobs[job_id]['progress'] = 15
-        
-        # Generate script
-        meditation_script = generate_meditation_script(user_worry)
-        print(f"Script generated successfully (length: {len(meditation_script)})")
-        
-        # Store the script and update progress to 35%
-        jobs[job_id]['meditation_script'] = meditation_script
-        jobs[job_id]['progress'] = 35
-        
-        # Step 4: Preparing for audio generation (40%)
-        jobs[job_id]['status'] = 'preparing_audio'
-        jobs[job_id]['progress'] = 40
+        job_store.update(job_id, status='initializing', progress=5)
         
         # Create output file path
-        filename = f"{job_id}.wav"
-        output_path = os.path.join(UPLOAD_FOLDER, filename)
+        # Audio is rendered under a temporary name and renamed once complete, so a
+        # half-written file is never served (and the ETag never goes stale)
+        output_path = audio_path(UPLOAD_FOLDER, job_id, 'wav')
+        partial_path = os.path.join(UPLOAD_FOLDER, f"{job_id}.partial.wav")
         
         # Use sample background file path
-        background_path = "samples/breakfill.wav"
+        background_path = BACKGROUND_PATH
         
         # Check if background file exists
         if not os.path.exists(background_path):
             print(f"Error: Background file not found at {background_path}")
-            jobs[job_id]['status'] = 'error'
-            jobs[job_id]['error'] = f"Background file not found: {background_path}"
-            return
+            return {'status': 'error', 'error': f"Background file not found: {background_path}"}
+        
+        if not pipelined:
+            # Step 2: Preparing to generate script (10%)
+            print(f"Preparing to generate meditation script for job {job_id}")
+            job_store.update(job_id, status='generating_script', progress=10)
+            
+            # Step 3: Generating meditation script (15-35%)
+            # Start script generation
+            print(f"Generating meditation script for job {job_id}")
+            
+            # Update progress to 15% to indicate script generation started
+            job_store.update(job_id, progress=15)
+            
+            # Generate script (waiting for a free LLM slot if other jobs are using Ollama)
+            with stage('llm'):
+                meditation_script = generate_meditation_script(user_worry)
+            print(f"Script generated successfully (length: {len(meditation_script)})")
+            
+            # Store the script and update progress to 35%
+            job_store.update(job_id, meditation_script=meditation_script, progress=35)
+            
+            # Step 4: Preparing for audio generation (40%)
+            job_store.update(job_id, status='preparing_audio', progress=40)
         
         # Step 5: Starting audio generation (45%)
-        jobs[job_id]['status'] = 'generating_audio'
-        jobs[job_id]['progress'] = 45
+        job_store.update(job_id, status='generating_audio', progress=45)
         print(f"Starting audio generation for job {job_id}")
         
         # Step 5.1: Text to speech conversion setup (45-90%)
         # The audio generation in F5 happens in batches, so we need to track progress more precisely
         
         # Create a more granular progress callback function for F5 audio generation
-        def update_audio_progress(stage, current=0, total=100):
+        def update_audio_progress(stage, current=0, total=100, stats=None):
             """
             Update progress during audio generation
             
             Parameters:
             - stage: String describing the current stage ('initializing', 'chunking', 'processing', 'finalizing')
-            - current: Current chunk/batch being processed
-            - total: Total chunks/batches to process
+            - current: Number of TTS batches completed
+            - total: Total TTS batches to synthesize
+            - stats: Measured TTS throughput after the latest batch (realtime_factor, eta_seconds, ...)
             """
             # F5 audio generation happens between 45% and 90% of the overall process
             # Map the current/total within this range
@@ -338,7 +441,7 @@ def process_meditation_job(job_id, user_worry):
                     # For small batches, we'll do additional tracking in the meditation_status endpoint
                     # by storing additional tracking data in the job
                     batch_progress = (current - batch_index)
-                    jobs[job_id]['batch_progress'] = batch_progress
+                    job_store.update(job_id, batch_progress=batch_progress)
                 else:
                     # For larger batch counts, use the regular calculation
                     stage_progress = base_processing + (processing_range * (current / total))
@@ -352,74 +455,97 @@ def process_meditation_job(job_id, user_worry):
             # Calculate overall progress in the 45-90% range
             overall_progress = progress_base + (progress_range * stage_progress)
             
-            # Update job progress and substage information
-            jobs[job_id]['progress'] = min(progress_max, int(overall_progress))
-            jobs[job_id]['audio_substage'] = stage
+            # Update job progress and substage information (never moving backwards, since
+            # the pipelined mode only learns the total batch count as the script streams)
+            progress = max(job_store.get(job_id)['progress'], min(progress_max, int(overall_progress)))
+            updates = {'progress': progress, 'audio_substage': stage}
             
             # Store current and total for processing stage
             if stage == 'processing':
-                jobs[job_id]['audio_current'] = current
-                jobs[job_id]['audio_total'] = total
+                updates.update(audio_current=current, audio_total=total)
+                if stats:
+                    updates['audio_stats'] = stats
+            job_store.update(job_id, **updates)
                 
-            print(f"Audio generation progress: Stage={stage}, Progress={jobs[job_id]['progress']}%, Current={current}, Total={total}")
+            print(f"Audio generation progress: Stage={stage}, Progress={progress}%, Current={current}, Total={total}")
         
         # Generate the meditation audio with progress tracking
         print(f"Generating meditation audio for job {job_id}")
         
-        # Now use our new function with progress callback
-        generate_meditation_from_text_with_progress(
-            meditation_script,
-            background_path,
-            output_path,
-            progress_callback=update_audio_progress
-        )
+        if pipelined:
+            # Script generation and TTS run concurrently; the script is complete once audio is
+            meditation_script = generate_meditation_pipelined(
+                user_worry,
+                background_path,
+                partial_path,
+                progress_callback=update_audio_progress,
+                bg_cache=background_cache,
+                bg_index=background_index,
+                bed_library=ambient_beds,
+                stage=stage,
+                segment_cache=tts_segment_cache,
+                dsp_pool=dsp_pool,
+                streaming=STREAMING_DSP
+            )
+            job_store.update(job_id, meditation_script=meditation_script)
+        else:
+            # Now use our new function with progress callback
+            generate_meditation_from_text_with_progress(
+                meditation_script,
+                background_path,
+                partial_path,
+                progress_callback=update_audio_progress,
+                stage=stage
+            )
         
         # Check if audio was generated successfully
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            print(f"Error: Audio file was not generated at {output_path}")
-            jobs[job_id]['status'] = 'error'
-            jobs[job_id]['error'] = "Failed to generate audio file"
-            return
+        if not os.path.exists(partial_path) or os.path.getsize(partial_path) == 0:
+            print(f"Error: Audio file was not generated at {partial_path}")
+            return {'status': 'error', 'error': "Failed to generate audio file"}
             
+        os.replace(partial_path, output_path)
         print(f"Audio generated successfully and saved to {output_path}")
+        artifact_etag(output_path)  # Hash for the ETag now rather than on the first download
         
         # Step 6: Finalizing (95-100%)
-        jobs[job_id]['progress'] = 95
-        jobs[job_id]['status'] = 'finalizing'
+        job_store.update(job_id, progress=95, status='finalizing')
         
         # Set the audio URL for client-side retrieval
         audio_url = f"/api/meditation-audio/{job_id}"
-        jobs[job_id]['audio_url'] = audio_url
-        jobs[job_id]['progress'] = 100
-        jobs[job_id]['status'] = 'completed'
+        
+        if audio_format != 'wav':
+            try:
+                audio_encoder.submit(job_id, audio_format).result()
+                audio_url += f"?format={audio_format}"
+            except Exception as e:
+                # The WAV is still there; serve that rather than failing the job
+                print(f"Error encoding job {job_id} to {audio_format}: {str(e)}")
+        return {'audio_url': audio_url, 'progress': 100, 'status': 'completed'}
         
     except Exception as e:
         error_details = traceback.format_exc()
         print(f"Error in meditation job {job_id}: {str(e)}")
         print(f"Traceback: {error_details}")
-        jobs[job_id]['status'] = 'error'
-        jobs[job_id]['error'] = str(e)
+        return {'status': 'error', 'error': str(e)}
 
-@app.route('/api/meditation-status/<job_id>', methods=['GET'])
-@require_api_key
-def meditation_status(job_id):
-    """
-    Check the status of a meditation generation job.
+def build_job_status(job_id, job):
     """
-    if job_id not in jobs:
-        return jsonify({
-            'status': 'error',
-            'error': f'Job ID {job_id} not found'
-        }), 404
-    
-    job = jobs[job_id]
+    Client-facing view of a job record, shared by the status, long-poll and event endpoints.
     
+    'version' increases with every change to the job; clients pass it back to wait
+    for the next change.
+    """
     # Basic response with status and progress
     response = {
         'status': job.get('status', 'pending'),
-        'progress': job.get('progress', 0)
+        'progress': job.get('progress', 0),
+        'version': job.get('version', 0)
     }
     
+    # Jobs waiting for a worker report how many jobs are ahead of them (1 = next)
+    if job.get('status') == 'queued':
+        response['queue_position'] = job_scheduler.position(job_id)
+    
     # If the job is in the audio generation phase, include substage information
     if job.get('status') == 'generating_audio' and 'audio_substage' in job:
         response['substage'] = job.get('audio_substage')
@@ -429,6 +555,11 @@ def meditation_status(job_id):
             response['current'] = job.get('audio_current', 1)
             response['total'] = job.get('audio_total', 1)
             
+            # Measured TTS throughput and estimated time to finish synthesis
+            if 'audio_stats' in job:
+                response['eta_seconds'] = job['audio_stats'].get('eta_seconds')
+                response['realtime_factor'] = job['audio_stats'].get('realtime_factor')
+            
             # For small batch counts, provide more granular progress
             if job.get('audio_total', 1) <= 3:
                 # We may have additional intra-batch progress for small batches
@@ -449,30 +580,376 @@ def meditation_status(job_id):
     if job.get('status') == 'completed':
         response['meditation_script'] = job.get('meditation_script', '')
         response['audio_url'] = job.get('audio_url', '')
+        response['audio_format'] = job.get('audio_format', 'wav')
+        # Size in bytes of every variant on disk, so clients can pick before downloading
+        response['audio_sizes'] = available_formats(UPLOAD_FOLDER, job_id)
     
     # If there was an error, include the error message
     if job.get('status') == 'error':
         response['error'] = job.get('error', 'Unknown error')
     
-    return jsonify(response)
+    # Jobs that asked for profiling say whether they got it, and link the saved profile
+    if 'profiled' in job:
+        response['profiled'] = job['profiled']
+    if 'profile_url' in job:
+        response['profile_url'] = job['profile_url']
+    
+    return response
+
+def job_status_changed(status, version, seen=None):
+    """
+    Whether a client holding version has yet to see status. Queue positions change without
+    a new version, so while a request waits, status is also compared with the status seen
+    when it started (seen). Shared by the single-job and batch long-polls.
+    """
+    return status['version'] != version or (seen is not None and status != seen)
+
+def wait_for_job_status(job_id, version, timeout):
+    """
+    Wait until a job's status differs from what a client holding version has seen.
+    
+    Returns immediately if the job has already moved past version or is finished. Otherwise blocks for up to
+    timeout seconds until the job changes (its queue position included) and returns the new
+    status, or the unchanged one on timeout. Returns None if the job does not exist.
+    """
+    deadline = time.time() + timeout
+    generation = job_store.generation()
+    job = job_store.get(job_id)
+    if job is None:
+        return None
+    current = build_job_status(job_id, job)
+    if job_status_changed(current, version) or current['status'] in FINISHED_STATUSES:
+        return current
+    
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0 or not job_store.wait_for_change(generation, remaining):
+            return current
+        # Some job changed; check whether this one (or its place in the queue) did
+        generation = job_store.generation()
+        job = job_store.get(job_id)
+        if job is None:
+            return None
+        status = build_job_status(job_id, job)
+        if job_status_changed(status, version, current):
+            return status
+
+def job_not_found(job_id):
+    return jsonify({
+        'status': 'error',
+        'error': f'Job ID {job_id} not found'
+    }), 404
+
+def parse_status_wait(value):
+    """
+    Seconds a status long-poll asked to wait (value from the query string or JSON body),
+    clamped to 0..MAX_STATUS_WAIT. None if value is not a finite number: NaN would never
+    time out.
+    """
+    try:
+        wait = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(wait):
+        return None
+    return max(0.0, min(wait, MAX_STATUS_WAIT))
+
+@app.route('/api/meditation-status/<job_id>', methods=['GET'])
+@require_api_key
+def meditation_status(job_id):
+    """
+    Check the status of a meditation generation job.
+    
+    With ?version=<version from a previous response>&wait=<seconds> the request is a
+    long-poll: it returns as soon as the job changes, or after wait seconds (at most
+    MAX_STATUS_WAIT) with the unchanged status.
+    """
+    version = request.args.get('version', type=int)
+    wait = parse_status_wait(request.args.get('wait', 0))
+    if wait is None:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    
+    if version is not None and wait > 0:
+        status = wait_for_job_status(job_id, version, wait)
+    else:
+        job = job_store.get(job_id)
+        status = build_job_status(job_id, job) if job is not None else None
+    
+    if status is None:
+        return job_not_found(job_id)
+    return jsonify(status)
+
+def changed_job_statuses(versions, seen=None):
+    """
+    Statuses of the jobs in versions ({job_id: version or None}) that the client has yet
+    to see (see job_status_changed; seen maps job ids to the statuses at the start of the
+    wait), the ids that do not exist, and the current status of every existing job.
+    """
+    seen = seen or {}
+    jobs = job_store.get_many(list(versions))
+    statuses = {job_id: build_job_status(job_id, job) for job_id, job in jobs.items()}
+    changed = {job_id: status for job_id, status in statuses.items()
+               if job_status_changed(status, versions[job_id], seen.get(job_id))}
+    missing = [job_id for job_id in versions if job_id not in jobs]
+    return changed, missing, statuses
+
+@app.route('/api/meditation-status', methods=['POST'])
+@require_api_key
+def batch_meditation_status():
+    """
+    Status of many jobs in one request, returning only the jobs that changed.
+    
+    The body maps job ids to the version the client last saw (null if it has none):
+    {"jobs": {"<job_id>": 17, "<job_id>": null}, "wait": 30}
+    Jobs whose version still matches are left out of the response; ids that do not
+    exist (never created or expired) are listed under "missing". With "wait", the
+    request blocks until at least one job changes or the timeout passes.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Request must be JSON'}), 400
+    
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    versions = data.get('jobs')
+    if not isinstance(versions, dict):
+        return jsonify({'error': 'jobs must map job ids to versions'}), 400
+    if len(versions) > MAX_BATCH_STATUS_JOBS:
+        return jsonify({'error': f'At most {MAX_BATCH_STATUS_JOBS} jobs per request'}), 400
+    if any(v is not None and (not isinstance(v, int) or isinstance(v, bool)) for v in versions.values()):
+        return jsonify({'error': 'versions must be integers or null'}), 400
+    
+    wait = parse_status_wait(data.get('wait', 0))
+    if wait is None:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    
+    deadline = time.time() + wait
+    seen = None
+    while True:
+        generation = job_store.generation()
+        changed, missing, statuses = changed_job_statuses(versions, seen)
+        remaining = deadline - time.time()
+        if changed or missing or remaining <= 0 or not job_store.wait_for_change(generation, remaining):
+            break
+        # Changes while waiting (queue positions included) are relative to the statuses now
+        if seen is None:
+            seen = statuses
+    
+    return jsonify({
+        'jobs': changed,
+        'missing': missing,
+        'unchanged': len(versions) - len(changed) - len(missing)
+    })
+
+@app.route('/api/meditation-events/<job_id>', methods=['GET'])
+@require_api_key
+def meditation_events(job_id):
+    """
+    Server-Sent Events stream of a job's status.
+    
+    Sends a 'status' event (the same fields as meditation-status, with the version as
+    the event id) whenever the job changes, and closes once the job has completed or
+    failed. A reconnecting client's Last-Event-ID skips the event it already has.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return job_not_found(job_id)
+    
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    
+    def events():
+        last_sent = None
+        version = last_event_id
+        while True:
+            if version is None:
+                status = build_job_status(job_id, job_store.get(job_id) or {'status': 'error', 'error': 'Job expired'})
+            else:
+                status = wait_for_job_status(job_id, version, EVENT_KEEPALIVE_INTERVAL)
+                if status is None:
+                    status = {'status': 'error', 'error': 'Job expired'}
+            
+            if status == last_sent or (last_sent is None and status.get('version') == last_event_id):
+                # Nothing new within the interval; keep proxies from closing the connection
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {status.get('version', 0)}\nevent: status\ndata: {json.dumps(status)}\n\n"
+                last_sent = status
+            
+            if status.get('status') in FINISHED_STATUSES:
+                return
+            version = status.get('version', 0)
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'     # Disable response buffering in nginx
+    })
 
 @app.route('/api/meditation-audio/<job_id>', methods=['GET'])
 @require_api_key
 def get_meditation_audio(job_id):
     """
     API endpoint to retrieve the generated meditation audio file.
+    
+    ?format=wav|flac|ogg|opus selects a format, encoding it in the background if it is
+    not on disk yet (202 with Retry-After until it is ready). Without it, the Accept
+    header picks among the variants already encoded, falling back to the job's format.
+    
+    Supports Range requests (206) for seeking and resumed downloads, and If-None-Match
+    (304) against a strong ETag of the file contents.
     """
-    file_path = os.path.join(UPLOAD_FOLDER, f"{job_id}.wav")
+    requested = request.args.get('format')
+    if requested is not None and requested not in AUDIO_FORMATS:
+        return jsonify({'error': f"Unsupported audio format: {requested}", 'formats': list(AUDIO_FORMATS)}), 400
     
-    if not os.path.exists(file_path):
+    available = available_formats(UPLOAD_FOLDER, job_id)
+    if not available:
         return jsonify({'error': 'Audio file not found'}), 404
     
-    return send_file(
+    if requested is not None:
+        audio_format = requested
+    else:
+        job = job_store.get(job_id) or {}
+        audio_format = next((f for f in parse_accept(request.headers.get('Accept')) if f in available), None)
+        if audio_format is None:
+            audio_format = job.get('audio_format', 'wav')
+            if audio_format not in available:
+                audio_format = 'wav'
+    
+    if audio_format not in available:
+        if 'wav' not in available:
+            return jsonify({'error': 'Audio file not found'}), 404
+        audio_encoder.submit(job_id, audio_format)
+        response = jsonify({
+            'status': 'encoding',
+            'format': audio_format,
+            'retry_after': ENCODE_RETRY_AFTER
+        })
+        response.headers['Retry-After'] = str(ENCODE_RETRY_AFTER)
+        return response, 202
+    
+    file_path = audio_path(UPLOAD_FOLDER, job_id, audio_format)
+    response = send_file(
         file_path,
-        mimetype='audio/wav',
+        mimetype=AUDIO_FORMATS[audio_format]['mimetype'],
         as_attachment=True,
-        download_name='meditation.wav'
+        download_name=f"meditation.{AUDIO_FORMATS[audio_format]['extension']}",
+        conditional=True,
+        etag=artifact_etag(file_path)
     )
+    if requested is not None:
+        response.headers['Cache-Control'] = AUDIO_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = NEGOTIATED_AUDIO_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept'
+    if response.status_code in (200, 206) and response.content_length:
+        BYTES_SERVED.inc(response.content_length, format=audio_format)
+    return response
+
+@app.route('/api/meditation-profile/<job_id>', methods=['GET'])
+@require_api_key
+def get_meditation_profile(job_id):
+    """
+    Download the profile of a job generated with profiling enabled: the cProfile
+    dump (pstats format) by default, or with ?format=json the summary of per-stage
+    wall/CPU time and peak memory plus the top functions by cumulative time.
+    """
+    prof_path, summary_path = profile_paths(UPLOAD_FOLDER, job_id)
+    if request.args.get('format') == 'json':
+        if not os.path.exists(summary_path):
+            return jsonify({'error': 'Profile not found'}), 404
+        with open(summary_path) as f:
+            return jsonify(json.load(f))
+    if not os.path.exists(prof_path):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(prof_path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f"meditation-{job_id}.prof")
+
+@app.route('/api/models', methods=['GET'])
+@require_api_key
+def resident_models():
+    """
+    List the TTS model configurations currently loaded in this process.
+    """
+    return jsonify({
+        'models': tts_models.resident(),
+        'idle_timeout': tts_models.idle_timeout
+    })
+
+@app.route('/api/queue', methods=['GET'])
+@require_api_key
+def job_queue_status():
+    """
+    Report job queue depth, running jobs and per-stage (llm/tts/dsp) occupancy.
+    """
+    return jsonify(dict(
+        job_scheduler.stats(),
+        jobs=job_store.counts(),
+        result_cache=result_cache.stats(),
+        segment_cache=tts_segment_cache.stats() if tts_segment_cache is not None else None,
+        background_index=background_index.stats() if background_index is not None else None,
+        ambient_beds=ambient_beds.stats() if ambient_beds is not None else None,
+        dsp_pool=dsp_pool.stats() if dsp_pool is not None else None
+    ))
+
+def collect_server_metrics():
+    """
+    Metrics read from the scheduler, job store and caches when /metrics is scraped:
+    queue depth, active jobs and stage occupancy, job counts, and cache hits/misses.
+    """
+    queue = job_scheduler.stats()
+    yield ('oneiro_jobs_queued', 'gauge', 'Jobs waiting for a worker', [({}, queue['queued'])])
+    yield ('oneiro_jobs_running', 'gauge', 'Jobs running on a worker', [({}, queue['running'])])
+    yield ('oneiro_jobs_rejected_total', 'counter', 'Submissions refused because the queue was full',
+           [({}, queue['rejected'])])
+    yield ('oneiro_stage_active', 'gauge', 'Jobs holding a slot of each pipeline stage',
+           [({'stage': name}, stage['active']) for name, stage in queue['stages'].items()])
+    yield ('oneiro_stage_waiting', 'gauge', 'Jobs waiting for a slot of each pipeline stage',
+           [({'stage': name}, stage['waiting']) for name, stage in queue['stages'].items()])
+    yield ('oneiro_jobs', 'gauge', 'Job records by status',
+           [({'status': status}, count) for status, count in job_store.counts().items()])
+    
+    caches = {
+        'result': result_cache,
+        'tts_segment': tts_segment_cache,
+        'background': background_cache,
+        'background_index': background_index,
+        'ambient_bed': ambient_beds,
+    }
+    cache_stats = {name: cache.stats() for name, cache in caches.items() if cache is not None}
+    yield ('oneiro_cache_hits_total', 'counter', 'Cache lookups served from the cache',
+           [({'cache': name}, stats['hits']) for name, stats in cache_stats.items()])
+    yield ('oneiro_cache_misses_total', 'counter', 'Cache lookups that had to compute the value',
+           [({'cache': name}, stats['misses']) for name, stats in cache_stats.items()])
+    yield ('oneiro_cache_bytes', 'gauge', 'Disk usage of on-disk caches',
+           [({'cache': name}, stats['bytes']) for name, stats in cache_stats.items() if 'bytes' in stats])
+    
+    yield ('oneiro_tts_models_loaded', 'gauge', 'TTS model configurations resident in memory',
+           [({}, sum(1 for model in tts_models.resident() if model['loaded']))])
+    if dsp_pool is not None:
+        pool = dsp_pool.stats()
+        yield ('oneiro_dsp_pool_active', 'gauge', 'Background renders running in DSP worker processes',
+               [({}, pool['active'])])
+    yield ('oneiro_ready', 'gauge', 'Whether every component has warmed up (1) or not (0)',
+           [({}, 1 if readiness.is_ready() else 0)])
+
+metrics_registry.register_collector(collect_server_metrics)
+
+@app.route('/metrics', methods=['GET'])
+@require_api_key
+def metrics():
+    """
+    Metrics in the Prometheus text format: per-stage latency histograms, queue depth,
+    active jobs, LLM tokens/sec, TTS real-time factor, bytes served and cache hit counts.
+    """
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/voice-profiles', methods=['GET'])
+@require_api_key
+def list_voice_profiles():
+    """
+    List the voice profiles (reference transcription and preprocessed clip) held in memory.
+    """
+    return jsonify({'profiles': voice_profiles.profiles()})
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -481,6 +958,15 @@ def health_check():
     """
     return jsonify({'status': 'ok'})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe - 200 once the TTS model, backgrounds and Ollama are warm, 503 with
+    the per-component warmup state until then. No auth required, like the health check.
+    """
+    status = readiness.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 @app.route('/api/verify-key', methods=['GET'])
 def verify_key():
     """
@@ -509,9 +995,149 @@ if __name__ == '__main__':
                         help='Run in debug mode')
     parser.add_argument('--no-auth', action='store_true',
                         help='Disable API key authentication')
+    parser.add_argument('--no-warmup', action='store_true',
+                        help='Load the TTS model on the first job instead of warming it up after startup')
+    parser.add_argument('--no-ollama-warmup', action='store_true',
+                        help='Do not load the Ollama model at startup (nor wait for it before reporting ready)')
+    parser.add_argument('--warmup-retry-interval', type=float, default=DEFAULT_RETRY_INTERVAL,
+                        help='Seconds between attempts to reach Ollama while warming up')
+    parser.add_argument('--voice-profile', action='append', default=[], metavar='REF_AUDIO',
+                        help='Reference audio to register as a voice profile at startup (repeatable); '
+                             'the default voice is always registered unless --no-warmup is given')
+    parser.add_argument('--model-idle-timeout', type=int, default=tts_models.idle_timeout,
+                        help='Release TTS models unused for this many seconds (0 keeps them loaded)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Stream scripts into speech synthesis while they are generated (per-request "pipelined" overrides)')
+    parser.add_argument('--no-bg-cache', action='store_true',
+                        help='Render the ambient background from scratch for every job')
+    parser.add_argument('--bg-cache-dir', type=str, default=BACKGROUND_CACHE_DIR,
+                        help='Directory for cached stretched backgrounds')
+    parser.add_argument('--bg-cache-max-mb', type=int, default=1024,
+                        help='Maximum disk usage of the background cache in MB')
+    parser.add_argument('--no-bg-index', action='store_true',
+                        help='Analyze the ambient background again for every render instead of indexing it once')
+    parser.add_argument('--bg-index-dir', type=str, default=BACKGROUND_INDEX_DIR,
+                        help='Directory for precomputed background analyses')
+    parser.add_argument('--bg-mode', choices=['render', 'bed'], default='render',
+                        help='Render the ambient background for each job\'s length (render, best quality) or '
+                             'slice and loop a pre-rendered bed (bed, near-free per job)')
+    parser.add_argument('--bed-dir', type=str, default=BED_DIR,
+                        help='Directory for pre-rendered ambient beds')
+    parser.add_argument('--bed-seconds', type=float, default=BED_SECONDS,
+                        help='Length of pre-rendered ambient beds in seconds')
+    parser.add_argument('--job-workers', type=int, default=DEFAULT_JOB_WORKERS,
+                        help='Meditation jobs that run at the same time')
+    parser.add_argument('--max-queued-jobs', type=int, default=DEFAULT_MAX_QUEUED_JOBS,
+                        help='Jobs that may wait for a worker before requests are refused with 503')
+    parser.add_argument('--llm-workers', type=int, default=DEFAULT_STAGE_LIMITS['llm'],
+                        help='Concurrent script generations (Ollama requests)')
+    parser.add_argument('--tts-workers', type=int, default=DEFAULT_STAGE_LIMITS['tts'],
+                        help='Concurrent speech syntheses')
+    parser.add_argument('--dsp-workers', type=int, default=None,
+                        help='Concurrent background stretching/mixing renders '
+                             '(defaults to --dsp-processes, or 1 without worker processes)')
+    parser.add_argument('--dsp-processes', type=int, default=DEFAULT_DSP_PROCESSES,
+                        help='Worker processes stretching ambient backgrounds (0 renders them in the job thread)')
+    parser.add_argument('--streaming-dsp', action='store_true',
+                        help='Stretch and mix backgrounds block by block in constant memory, '
+                             'limiting peaks instead of normalizing')
+    parser.add_argument('--job-store', choices=['sqlite', 'memory'], default='sqlite',
+                        help='Where job records are kept (sqlite survives restarts)')
+    parser.add_argument('--job-db', type=str, default=JOB_DB_PATH,
+                        help='SQLite database for job records')
+    parser.add_argument('--job-ttl', type=int, default=DEFAULT_JOB_TTL,
+                        help='Delete finished jobs and their audio this many seconds after they finish (0 keeps them)')
+    parser.add_argument('--max-audio-mb', type=int, default=DEFAULT_ARTIFACT_MAX_BYTES // (1024 * 1024),
+                        help='Evict the oldest finished jobs early once generated audio exceeds this size (0 for no limit)')
+    parser.add_argument('--gc-interval', type=int, default=DEFAULT_GC_INTERVAL,
+                        help='Seconds between job garbage collection passes')
+    parser.add_argument('--allow-profiling', action='store_true',
+                        help='Let requests ask for their job to be profiled ("profile": true or X-Profile-Job: 1)')
+    parser.add_argument('--audio-format', choices=list(AUDIO_FORMATS), default=DEFAULT_AUDIO_FORMAT,
+                        help='Format meditations are delivered in when a request does not choose one')
+    parser.add_argument('--encoder-workers', type=int, default=1,
+                        help='Concurrent FLAC/Ogg encodes')
+    parser.add_argument('--result-cache-ttl', type=int, default=DEFAULT_RESULT_TTL,
+                        help='Seconds identical requests reuse an earlier result (0 disables reuse and coalescing)')
+    parser.add_argument('--result-cache-size', type=int, default=DEFAULT_RESULT_CACHE_SIZE,
+                        help='Distinct requests remembered for reuse')
+    parser.add_argument('--segment-cache', action='store_true',
+                        help='Synthesize sentence by sentence and reuse cached speech for repeated sentences '
+                             '(instead of synthesizing the script in larger batches)')
+    parser.add_argument('--segment-cache-dir', type=str, default=SEGMENT_CACHE_DIR,
+                        help='Directory for cached synthesized sentences')
+    parser.add_argument('--segment-cache-max-mb', type=int, default=512,
+                        help='Maximum disk usage of the sentence cache in MB')
     
     args = parser.parse_args()
     
+    PIPELINED_BY_DEFAULT = args.pipeline
+    STREAMING_DSP = args.streaming_dsp
+    PROFILING_ALLOWED = args.allow_profiling
+    DEFAULT_AUDIO_FORMAT = args.audio_format
+    result_cache = ResultCache(args.result_cache_ttl, args.result_cache_size)
+    audio_encoder = AudioEncoder(UPLOAD_FOLDER, workers=args.encoder_workers)
+    
+    if args.job_store == 'memory':
+        job_store = MemoryJobStore()
+    else:
+        job_store = SQLiteJobStore(args.job_db)
+        # Queued and running jobs died with the previous process
+        failed = job_store.fail_unfinished("Server restarted before the job finished")
+        if failed:
+            print(f"Marked {failed} unfinished jobs from a previous run as failed")
+    JobGarbageCollector(job_store, UPLOAD_FOLDER, ttl=args.job_ttl, max_bytes=args.max_audio_mb * 1024 * 1024,
+                        interval=args.gc_interval).start()
+    
+    if args.dsp_processes > 0:
+        dsp_pool = DSPPool(args.dsp_processes)
+        dsp_pool.start()
+    if args.dsp_workers is None:
+        args.dsp_workers = args.dsp_processes if dsp_pool is not None else DEFAULT_STAGE_LIMITS['dsp']
+    
+    job_scheduler = JobScheduler(args.job_workers, args.max_queued_jobs, {
+        'llm': args.llm_workers,
+        'tts': args.tts_workers,
+        'dsp': args.dsp_workers,
+    })
+    
+    if args.no_bg_cache:
+        background_cache = None
+    else:
+        background_cache = StretchedBackgroundCache(args.bg_cache_dir, max_bytes=args.bg_cache_max_mb * 1024 * 1024)
+    
+    background_index = None if args.no_bg_index else BackgroundIndex(args.bg_index_dir)
+    if args.bg_mode == 'bed':
+        ambient_beds = AmbientBedLibrary(args.bed_dir, bed_seconds=args.bed_seconds)
+    
+    if args.segment_cache:
+        tts_segment_cache = TTSSegmentCache(args.segment_cache_dir, max_bytes=args.segment_cache_max_mb * 1024 * 1024)
+    
+    # Keep the TTS model resident between jobs, releasing it only after a long idle period
+    tts_models.idle_timeout = args.model_idle_timeout
+    tts_models.start_reaper()
+    
+    # Heavy components are warmed up on a background thread so the server answers
+    # /api/health right away; /api/ready reports when they are all warm
+    readiness = Readiness(args.warmup_retry_interval)
+    readiness.add('tts_imports', import_tts)
+    if not args.no_warmup:
+        def register_voice_profiles():
+            for ref_audio in [None] + args.voice_profile:
+                register_voice_profile(ref_audio)
+        readiness.add('tts_model', warmup_tts)
+        readiness.add('voice_profiles', register_voice_profiles)
+    if background_index is not None:
+        # Analyze the background once now rather than in every job's render
+        readiness.add('background_index',
+                      lambda: background_index.build([BACKGROUND_PATH], BACKGROUND_SAMPLE_RATE, [0.25]))
+    if ambient_beds is not None:
+        readiness.add('ambient_bed', lambda: ambient_beds.prepare(BACKGROUND_PATH, BACKGROUND_SAMPLE_RATE, 0.25))
+    if not args.no_ollama_warmup:
+        # Ollama may still be starting, so it is retried until it answers
+        readiness.add('ollama', warmup_ollama, retry=True)
+    readiness.start()
+    
     # Only load/generate API key if we're exposing the API to LAN and auth is not disabled
     if args.host == '0.0.0.0' and not args.no_auth:
         api_key = load_or_generate_api_key()
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules directly, as the server does when run from this directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """The server module with a fresh in-memory job store and result cache, and its audio under tmp_path"""
+    import server
+    from audio_formats import AudioEncoder
+    from job_store import MemoryJobStore
+    from result_cache import ResultCache
+
+    monkeypatch.setattr(server, 'job_store', MemoryJobStore())
+    monkeypatch.setattr(server, 'result_cache', ResultCache())
+    monkeypatch.setattr(server, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(server, 'audio_encoder', AudioEncoder(str(tmp_path)))
+    return server
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
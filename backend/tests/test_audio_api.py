@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_formats import audio_path
+
+SR = 24000
+
+
+@pytest.fixture
+def finished_job(server):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, SR).astype(np.float32)
+    sf.write(audio_path(server.UPLOAD_FOLDER, 'j1', 'wav'), audio, SR)
+    server.job_store.create('j1', status='completed', progress=100, audio_format='wav',
+                            audio_url='/api/meditation-audio/j1')
+    return 'j1'
+
+
+def test_audio_download(client, finished_job):
+    response = client.get(f'/api/meditation-audio/{finished_job}')
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/wav'
+    assert response.headers['ETag']
+    # The negotiated variant can change as encodes finish, so clients revalidate it
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.headers['Vary'] == 'Accept'
+    assert sf.info(io.BytesIO(response.data)).frames == SR
+
+
+def test_audio_range_request(client, finished_job):
+    full = client.get(f'/api/meditation-audio/{finished_job}').data
+    response = client.get(f'/api/meditation-audio/{finished_job}', headers={'Range': 'bytes=100-1099'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-1099/{len(full)}'
+    assert response.data == full[100:1100]
+
+
+@pytest.mark.parametrize('query', ['', '?format=wav'])
+def test_audio_revalidation(client, finished_job, query):
+    etag = client.get(f'/api/meditation-audio/{finished_job}{query}').headers['ETag']
+    response = client.get(f'/api/meditation-audio/{finished_job}{query}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert not response.data
+
+
+def test_audio_encodes_requested_format(client, server, finished_job):
+    response = client.get(f'/api/meditation-audio/{finished_job}?format=flac')
+    assert response.status_code == 202
+    assert response.json['status'] == 'encoding'
+    assert response.headers['Retry-After'] == str(server.ENCODE_RETRY_AFTER)
+
+    server.audio_encoder.submit(finished_job, 'flac').result(timeout=30)
+    response = client.get(f'/api/meditation-audio/{finished_job}?format=flac')
+    assert response.status_code == 200
+    assert response.mimetype == 'audio/flac'
+    # A requested variant never changes once encoded
+    assert response.headers['Cache-Control'] == server.AUDIO_CACHE_CONTROL
+
+    # Now that it exists, Accept picks it without ?format=
+    response = client.get(f'/api/meditation-audio/{finished_job}', headers={'Accept': 'audio/flac'})
+    assert response.mimetype == 'audio/flac'
+
+
+def test_audio_errors(client, finished_job):
+    assert client.get(f'/api/meditation-audio/{finished_job}?format=mp3').status_code == 400
+    assert client.get('/api/meditation-audio/nope').status_code == 404
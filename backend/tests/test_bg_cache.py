@@ -0,0 +1,59 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from bg_cache import StretchedBackgroundCache
+
+SR = 24000
+
+
+@pytest.fixture
+def background(tmp_path):
+    # The cache only hashes the background file, so any content will do
+    path = tmp_path / "background.wav"
+    path.write_bytes(b"ambient")
+    return str(path)
+
+
+def ramp(length):
+    return np.arange(length, dtype=np.float32) / length
+
+
+def test_render_larger_than_cap_is_served(tmp_path, background):
+    cache = StretchedBackgroundCache(str(tmp_path / "cache"), max_bytes=1000, quantum_seconds=1)
+    audio = cache.get_or_render(background, SR, 0.25, SR * 10, ramp)
+    np.testing.assert_array_equal(audio, ramp(SR * 10))
+    assert cache.stats()['entries'] == 1
+
+    # The next render takes its place
+    cache.get_or_render(background, SR, 0.5, SR * 10, ramp)
+    assert [os.path.basename(path) for path, _, _ in cache.entries()] == [
+        f"{cache._prefix(cache.background_hash(background), SR, 0.5)}{SR * 10}.npy"]
+
+
+def test_streamed_render_larger_than_cap_is_served(tmp_path, background):
+    cache = StretchedBackgroundCache(str(tmp_path / "cache"), max_bytes=1000, quantum_seconds=1)
+    render = lambda length: ((length,), (block for block in np.array_split(ramp(length), 7)))
+    audio = cache.get_or_render(background, SR, 0.25, SR * 3, render)
+    np.testing.assert_array_equal(audio, ramp(SR * 3))
+
+
+def test_cached_render_is_reused_and_lru_evicted(tmp_path, background):
+    render_bytes = SR * 4 + 128  # samples as float32 plus the .npy header
+    cache = StretchedBackgroundCache(str(tmp_path / "cache"), max_bytes=2 * render_bytes, quantum_seconds=1)
+    for age, time_resolution in ((20, 0.25), (10, 0.5)):
+        cache.get_or_render(background, SR, time_resolution, SR, ramp)
+        # Modification times are the LRU clock; space the renders out beyond its resolution
+        path = cache.entries()[-1][0]
+        os.utime(path, (time.time() - age,) * 2)
+    # A shorter target is trimmed from the cached render instead of rendering again
+    cache.get_or_render(background, SR, 0.25, SR - 100, lambda length: pytest.fail("rendered again"))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # A third render evicts the least recently used one (0.5s)
+    cache.get_or_render(background, SR, 1.0, SR, ramp)
+    names = [os.path.basename(path) for path, _, _ in cache.entries()]
+    assert len(names) == 2
+    assert not any("-0.5s-" in name for name in names)
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+
+import pytest
+
+
+def read_events(response):
+    """(id, event, data) of every event in a finished SSE response, skipping keep-alives"""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def update_later(server, *updates):
+    """Apply each update to job j1 in turn, one every 0.2 seconds, on another thread"""
+    def run():
+        for update in updates:
+            time.sleep(0.2)
+            server.job_store.update('j1', **update)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def running_job(server, monkeypatch):
+    monkeypatch.setattr(server, 'EVENT_KEEPALIVE_INTERVAL', 0.05)
+    server.job_store.create('j1', status='generating_audio', progress=50)
+    return 'j1'
+
+
+def test_events_stream_until_finished(client, server, running_job):
+    writer = update_later(server, {'progress': 60}, {'progress': 100, 'status': 'completed'})
+    response = client.get(f'/api/meditation-events/{running_job}')
+    assert response.mimetype == 'text/event-stream'
+    # The stream ends on its own once the job has completed
+    events = read_events(response)
+    writer.join()
+    assert [(version, event) for version, event, _ in events] == [(1, 'status'), (2, 'status'), (3, 'status')]
+    assert [data['progress'] for _, _, data in events] == [50, 60, 100]
+    assert events[-1][2]['status'] == 'completed'
+    assert all(data['version'] == version for version, _, data in events)
+
+
+def test_events_resume_after_last_event_id(client, server, running_job):
+    server.job_store.update(running_job, progress=55)
+    writer = update_later(server, {'progress': 100, 'status': 'completed'})
+    response = client.get(f'/api/meditation-events/{running_job}', headers={'Last-Event-ID': '2'})
+    events = read_events(response)
+    writer.join()
+    # Version 2 is what the client already has
+    assert [version for version, _, _ in events] == [3]
+    assert events[0][2]['status'] == 'completed'
+
+
+def test_events_for_finished_job_close_at_once(client, server):
+    server.job_store.create('j1', status='completed', progress=100)
+    events = read_events(client.get('/api/meditation-events/j1'))
+    assert [(version, data['status']) for version, _, data in events] == [(1, 'completed')]
+
+
+def test_events_report_expired_job(client, server, running_job):
+    writer = threading.Timer(0.1, server.job_store.delete, (running_job,))
+    writer.start()
+    events = read_events(client.get(f'/api/meditation-events/{running_job}'))
+    writer.join()
+    assert events[-1][2] == {'status': 'error', 'error': 'Job expired'}
+
+
+def test_events_unknown_job(client):
+    assert client.get('/api/meditation-events/nope').status_code == 404
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import job_store
+from job_store import JobGarbageCollector, MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryJobStore()
+    return SQLiteJobStore(str(tmp_path / "db" / "jobs.db"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of job_store, which tests move forward with clock.advance(seconds)"""
+    clock = types.SimpleNamespace(offset=0.0)
+    clock.time = lambda: time.time() + clock.offset
+    clock.advance = lambda seconds: setattr(clock, 'offset', clock.offset + seconds)
+    monkeypatch.setattr(job_store, 'time', clock)
+    return clock
+
+
+def test_create_update_get_round_trip(store):
+    store.create('j1', status='queued', progress=0, audio_url=None, audio_stats={'eta_seconds': 3.5})
+    job = store.get('j1')
+    assert job['status'] == 'queued'
+    assert (job['progress'], job['audio_url'], job['audio_stats']) == (0, None, {'eta_seconds': 3.5})
+    assert job['version'] == 1
+
+    store.update('j1', status='generating_audio', progress=45)
+    store.update('j1', meditation_script='Breathe.')
+    job = store.get('j1')
+    assert job['status'] == 'generating_audio'
+    assert (job['progress'], job['meditation_script'], job['audio_stats']) == (45, 'Breathe.', {'eta_seconds': 3.5})
+    assert job['version'] == 3
+    assert job['updated_at'] >= job['created_at']
+
+    assert store.get('nope') is None
+    assert 'j1' in store and 'nope' not in store
+    store.update('nope', progress=1)  # no-op
+    assert 'nope' not in store
+
+
+def test_get_many(store):
+    for job_id in ('j1', 'j2', 'j3'):
+        store.create(job_id, status='queued')
+    store.update('j2', progress=10)
+    jobs = store.get_many(['j2', 'nope', 'j1', 'j2'])
+    assert set(jobs) == {'j1', 'j2'}
+    assert jobs['j2']['version'] == 2
+
+
+def test_delete_expire_and_counts(store, clock):
+    store.create('done', status='completed')
+    store.create('failed', status='error')
+    store.create('running', status='generating_audio')
+    store.delete('failed')
+    assert store.counts() == {'completed': 1, 'generating_audio': 1}
+
+    assert store.expire(clock.time() - 60) == []
+    clock.advance(120)
+    # Unfinished jobs are never expired, however old
+    assert store.expire(clock.time() - 60) == ['done']
+    assert store.counts() == {'generating_audio': 1}
+
+
+def test_fail_unfinished(store):
+    store.create('done', status='completed')
+    store.create('running', status='generating_audio')
+    assert store.fail_unfinished("restarted") == 1
+    assert store.get('running')['status'] == 'error'
+    assert store.get('running')['error'] == "restarted"
+    assert store.get('running')['version'] == 2
+    assert store.get('done')['status'] == 'completed'
+
+
+def test_wait_for_change_wakes_up_on_write(store):
+    store.create('j1', status='queued')
+    generation = store.generation()
+    assert not store.wait_for_change(generation, 0.05)
+
+    writer = threading.Timer(0.1, store.update, ('j1',), {'progress': 5})
+    start = time.perf_counter()
+    writer.start()
+    assert store.wait_for_change(generation, 10)
+    assert time.perf_counter() - start < 5
+    writer.join()
+    assert store.generation() != generation
+
+
+def test_concurrent_updates_keep_every_field(store):
+    store.create('j1', status='queued')
+
+    def write(field):
+        for i in range(20):
+            store.update('j1', **{field: i})
+
+    writers = [threading.Thread(target=write, args=(f"field{n}",)) for n in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    job = store.get('j1')
+    assert all(job[f"field{n}"] == 19 for n in range(4))
+    assert job['version'] == 1 + 4 * 20
+
+
+def test_sqlite_store_survives_reopening(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    SQLiteJobStore(path).create('j1', status='completed', audio_url='/api/meditation-audio/j1')
+    job = SQLiteJobStore(path).get('j1')
+    assert (job['status'], job['audio_url'], job['version']) == ('completed', '/api/meditation-audio/j1', 1)
+
+
+@pytest.fixture
+def artifact_dir(tmp_path):
+    directory = tmp_path / "generated_meditations"
+    directory.mkdir()
+    return str(directory)
+
+
+def write_artifact(directory, name, size=100, age=0):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    if age:
+        os.utime(path, (time.time() - age,) * 2)
+    return path
+
+
+def test_gc_expires_finished_jobs_with_their_files(store, artifact_dir, clock):
+    store.create('old', status='completed')
+    store.create('running', status='generating_audio')
+    for name in ('old.wav', 'old.flac', 'old.profile.json', 'running.partial.wav'):
+        write_artifact(artifact_dir, name)
+    gc = JobGarbageCollector(store, artifact_dir, ttl=3600, max_bytes=0, interval=60)
+
+    assert gc.collect() == (0, 0, 0)
+    clock.advance(2 * 3600)
+    assert gc.collect() == (1, 3, 300)
+    assert 'old' not in store and 'running' in store
+    assert sorted(os.listdir(artifact_dir)) == ['running.partial.wav']
+
+
+def test_gc_removes_orphaned_files_after_a_grace_period(store, artifact_dir):
+    store.create('live', status='completed')
+    write_artifact(artifact_dir, 'live.wav', age=7200)
+    write_artifact(artifact_dir, 'orphan.wav', age=7200)
+    write_artifact(artifact_dir, 'new-orphan.wav')
+    gc = JobGarbageCollector(store, artifact_dir, ttl=0, max_bytes=0, interval=3600)
+
+    assert gc.collect() == (0, 1, 100)
+    assert sorted(os.listdir(artifact_dir)) == ['live.wav', 'new-orphan.wav']
+
+
+def test_gc_evicts_oldest_finished_jobs_over_the_disk_cap(store, artifact_dir):
+    for job_id, status in (('oldest', 'completed'), ('running', 'generating_audio'), ('newer', 'error'),
+                           ('newest', 'completed')):
+        store.create(job_id, status=status)
+    write_artifact(artifact_dir, 'oldest.wav', 1000, age=400)
+    write_artifact(artifact_dir, 'oldest.flac', 500, age=400)
+    write_artifact(artifact_dir, 'running.partial.wav', 1000, age=300)
+    write_artifact(artifact_dir, 'newer.wav', 1000, age=200)
+    write_artifact(artifact_dir, 'newest.wav', 1000, age=100)
+    gc = JobGarbageCollector(store, artifact_dir, ttl=0, max_bytes=2500, interval=3600)
+
+    # Whole jobs go, oldest first, skipping the one still running
+    assert gc.collect() == (2, 3, 2500)
+    assert sorted(os.listdir(artifact_dir)) == ['newest.wav', 'running.partial.wav']
+    assert set(store.get_many(['oldest', 'running', 'newer', 'newest'])) == {'running', 'newest'}
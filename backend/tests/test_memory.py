@@ -0,0 +1,25 @@
+"""
+Peak RSS of post-processing, measured in fresh processes by benchmarks/bench_memory.py.
+"""
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+# A 10 minute voice track at 24 kHz is 55 MB as float32. The in-memory path holds the
+# voice and the stretched background (about 110 MB above baseline); streaming stays
+# around 13 MB whatever the length.
+VOICE_MINUTES = 10
+RSS_BUDGET_MB = {False: 160, True: 40}
+
+
+@pytest.mark.parametrize("streaming", [False, True], ids=["in-memory", "streaming"])
+def test_process_audio_peak_rss_within_budget(streaming):
+    command = [sys.executable, "benchmarks/bench_memory.py", "--minutes", str(VOICE_MINUTES),
+               "--max-mb", str(RSS_BUDGET_MB[streaming])]
+    if streaming:
+        command.append("--streaming")
+    result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
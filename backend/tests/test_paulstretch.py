@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from bg_index import BackgroundIndex
+from dsp import paulstretch_analyze, paulstretch_batched, paulstretch_parallel, paulstretch_stream
+from dsp_pool import new_process_pool
+from conftest import BACKEND_DIR
+
+SR = 8000
+SEED = 123
+# Few frames per batch, so the small input below still spans many batches and seams
+BATCH_FRAMES = 4
+
+
+@pytest.fixture(scope="module")
+def executor():
+    pool = new_process_pool(2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture(params=["mono", "stereo"])
+def smp(request):
+    rng = np.random.default_rng(0)
+    shape = (SR,) if request.param == "mono" else (SR, 2)
+    return rng.uniform(-0.5, 0.5, shape).astype(np.float32)
+
+
+@pytest.mark.parametrize("segments", [2, 5])
+def test_parallel_matches_seeded_batched(executor, smp, segments):
+    expected = paulstretch_batched(SR, smp, 8.0, batch_frames=BATCH_FRAMES, seed=SEED)
+    result = paulstretch_parallel(SR, smp, 8.0, batch_frames=BATCH_FRAMES, executor=executor,
+                                  segments=segments, seed=SEED)
+    assert result.shape == expected.shape
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_parallel_matches_batched_from_analysis(executor, smp):
+    analysis = paulstretch_analyze(SR, smp)
+    expected = paulstretch_batched(SR, smp, 8.0, batch_frames=BATCH_FRAMES, seed=SEED)
+    result = paulstretch_parallel(SR, None, 8.0, batch_frames=BATCH_FRAMES, executor=executor,
+                                  segments=3, seed=SEED, analysis=analysis)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_parallel_matches_batched_from_index(executor, tmp_path):
+    # Workers map the spectra of an index entry from disk instead of shared memory
+    background = str(tmp_path / "background.wav")
+    sf.write(background, np.random.default_rng(1).uniform(-0.5, 0.5, SR).astype(np.float32), SR)
+    analysis = BackgroundIndex(str(tmp_path / "index")).get(background, SR, 0.25)
+    assert isinstance(analysis['spectra'], np.memmap)
+    expected = paulstretch_batched(SR, None, 8.0, batch_frames=BATCH_FRAMES, seed=SEED, analysis=analysis)
+    result = paulstretch_parallel(SR, None, 8.0, batch_frames=BATCH_FRAMES, executor=executor,
+                                  segments=3, seed=SEED, analysis=analysis)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_stream_matches_seeded_batched(smp):
+    expected = paulstretch_batched(SR, smp, 8.0, batch_frames=BATCH_FRAMES, seed=SEED)
+    shape, blocks = paulstretch_stream(SR, smp, 8.0, batch_frames=BATCH_FRAMES, seed=SEED)
+    assert shape == expected.shape
+    np.testing.assert_array_equal(np.concatenate(list(blocks)), expected)
+
+
+def test_batched_statistically_matches_classic():
+    # The engines draw different random phases, so bench_paulstretch.py compares RMS and band energies
+    command = [sys.executable, "benchmarks/bench_paulstretch.py", "--minutes", "1"]
+    result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, timeout=600)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,143 @@
+import time
+import types
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache, result_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of result_cache, which tests move forward with clock.advance(seconds)"""
+    clock = types.SimpleNamespace(offset=0.0)
+    clock.time = lambda: time.time() + clock.offset
+    clock.advance = lambda seconds: setattr(clock, 'offset', clock.offset + seconds)
+    monkeypatch.setattr(result_cache, 'time', clock)
+    return clock
+
+
+class FakeJobs(dict):
+    """Job states by id, as the usable callable of ResultCache.claim() reports them"""
+
+    def usable(self, job_id):
+        return self.get(job_id)
+
+
+def test_result_key_ignores_trivial_differences():
+    assert result_key("I can't sleep.", format='wav') == result_key("  i CAN'T   sleep!", format='wav')
+    assert result_key("I can't sleep", format='wav') != result_key("I can't sleep", format='ogg')
+    assert result_key("I can't sleep") != result_key("I can't eat")
+
+
+def test_running_job_is_coalesced_and_completed_job_reused():
+    cache = ResultCache()
+    jobs = FakeJobs()
+    assert cache.claim('k', 'j1', jobs.usable) == ('j1', None)
+    jobs['j1'] = 'running'
+    assert cache.claim('k', 'j2', jobs.usable) == ('j1', 'running')
+    jobs['j1'] = 'completed'
+    assert cache.claim('k', 'j3', jobs.usable) == ('j1', 'completed')
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'coalesced': 1, 'misses': 1, 'hit_rate': 2 / 3}
+
+
+def test_unusable_job_is_replaced():
+    # An errored or deleted job (usable returns None) is not reused; the new job takes its place
+    cache = ResultCache()
+    jobs = FakeJobs(j1=None)
+    cache.claim('k', 'j1', jobs.usable)
+    assert cache.claim('k', 'j2', jobs.usable) == ('j2', None)
+    jobs['j2'] = 'completed'
+    assert cache.claim('k', 'j3', jobs.usable) == ('j2', 'completed')
+
+
+def test_fresh_skips_reuse_and_takes_over_the_key():
+    cache = ResultCache()
+    jobs = FakeJobs(j1='completed', j2='running')
+    cache.claim('k', 'j1', jobs.usable)
+    assert cache.claim('k', 'j2', jobs.usable, fresh=True) == ('j2', None)
+    assert cache.claim('k', 'j3', jobs.usable) == ('j2', 'running')
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(ttl=60)
+    jobs = FakeJobs(j1='completed')
+    cache.claim('k', 'j1', jobs.usable)
+    clock.advance(59)
+    assert cache.claim('k', 'j2', jobs.usable) == ('j1', 'completed')
+    clock.advance(2)
+    assert cache.claim('k', 'j2', jobs.usable) == ('j2', None)
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = ResultCache(max_entries=2)
+    jobs = FakeJobs(j1='completed', j2='completed', j3='completed')
+    cache.claim('k1', 'j1', jobs.usable)
+    cache.claim('k2', 'j2', jobs.usable)
+    cache.claim('k1', 'x', jobs.usable)  # k1 is now the most recently used
+    cache.claim('k3', 'j3', jobs.usable)
+    assert cache.stats()['entries'] == 2
+    assert cache.claim('k1', 'x', jobs.usable) == ('j1', 'completed')
+    assert cache.claim('k2', 'x', jobs.usable) == ('x', None)
+
+
+def test_disabled_cache_never_reuses():
+    for cache in (ResultCache(ttl=0), ResultCache(max_entries=0)):
+        jobs = FakeJobs(j1='completed')
+        cache.claim('k', 'j1', jobs.usable)
+        assert cache.claim('k', 'j2', jobs.usable) == ('j2', None)
+        assert cache.stats()['entries'] == 0
+
+
+def test_release_only_forgets_its_own_job():
+    cache = ResultCache()
+    jobs = FakeJobs(j1='running')
+    cache.claim('k', 'j1', jobs.usable)
+    cache.release('k', 'other')
+    assert cache.claim('k', 'j2', jobs.usable) == ('j1', 'running')
+    cache.release('k', 'j1')
+    assert cache.claim('k', 'j3', jobs.usable) == ('j3', None)
+
+
+def test_reusable_job_state(server):
+    server.job_store.create('queued', status='queued')
+    server.job_store.create('failed', status='error', error='boom')
+    server.job_store.create('done', status='completed')
+    server.job_store.create('done-no-audio', status='completed')
+    with open(server.audio_path(server.UPLOAD_FOLDER, 'done', 'wav'), 'wb') as f:
+        f.write(b'RIFF')
+
+    assert server.reusable_job_state('queued') == 'running'
+    assert server.reusable_job_state('done') == 'completed'
+    # Errored jobs, jobs whose audio is gone and deleted jobs are never reused
+    assert server.reusable_job_state('failed') is None
+    assert server.reusable_job_state('done-no-audio') is None
+    assert server.reusable_job_state('nope') is None
+
+
+@pytest.fixture
+def submitted(server, monkeypatch):
+    """Ids of the jobs handed to the scheduler, which leaves them queued"""
+    submitted = []
+    scheduler = types.SimpleNamespace(submit=lambda job_id, *args: submitted.append(job_id) or len(submitted),
+                                      position=lambda job_id: 1)
+    monkeypatch.setattr(server, 'job_scheduler', scheduler)
+    return submitted
+
+
+def test_identical_requests_share_a_job(client, server, submitted):
+    first = client.post('/api/generate-meditation', json={'worry': "I can't sleep"}).json
+    second = client.post('/api/generate-meditation', json={'worry': "i can't sleep."}).json
+    assert second['job_id'] == first['job_id']
+    assert second['coalesced'] and not second['cached']
+    assert submitted == [first['job_id']]
+
+    fresh = client.post('/api/generate-meditation', json={'worry': "I can't sleep", 'fresh': True}).json
+    assert fresh['job_id'] != first['job_id']
+    assert submitted == [first['job_id'], fresh['job_id']]
+
+    # A failed job is not reused
+    server.job_store.update(fresh['job_id'], status='error', error='boom')
+    retry = client.post('/api/generate-meditation', json={'worry': "I can't sleep"}).json
+    assert retry['job_id'] not in (first['job_id'], fresh['job_id'])
+    assert len(submitted) == 3
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pytest
+
+from segment_cache import TTSSegmentCache, segment_key
+
+SR = 24000
+
+
+def sentence_key(sentence):
+    return segment_key(sentence, voice_hash="voice", model_id="F5TTS_v1_Base", nfe_step=32, cfg_strength=2.0,
+                       speed=1.0, seed=1)
+
+
+def directory_usage(cache):
+    entries = cache.entries()
+    return len(entries), sum(size for _, size, _ in entries)
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = TTSSegmentCache(str(tmp_path))
+    key = sentence_key("Breathe in.")
+    assert cache.get(key) is None
+    wave = np.linspace(-0.5, 0.5, SR, dtype=np.float32)
+    cache.put(key, wave, SR)
+    cached, sr = cache.get(key)
+    assert sr == SR
+    np.testing.assert_array_equal(cached, wave)
+    assert cache.format_stats() == "hits=1, misses=1, hit_rate=50%, entries=1"
+
+
+def test_stats_do_not_walk_the_cache(tmp_path, monkeypatch):
+    cache = TTSSegmentCache(str(tmp_path))
+    for n in range(3):
+        cache.put(sentence_key(f"Sentence {n}."), np.zeros(SR * (n + 1), dtype=np.float32), SR)
+    # Replacing an entry changes its size but not the entry count
+    cache.put(sentence_key("Sentence 0."), np.zeros(SR * 4, dtype=np.float32), SR)
+    expected = directory_usage(cache)
+
+    monkeypatch.setattr(cache, 'entries', lambda: pytest.fail("stats() listed the cache directory"))
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == expected
+    assert stats['entries'] == 3
+
+
+def test_usage_is_counted_at_startup(tmp_path):
+    cache = TTSSegmentCache(str(tmp_path))
+    for n in range(2):
+        cache.put(sentence_key(f"Sentence {n}."), np.zeros(SR, dtype=np.float32), SR)
+    stats = TTSSegmentCache(str(tmp_path)).stats()
+    assert (stats['entries'], stats['bytes']) == directory_usage(cache)
+
+
+def test_eviction_keeps_usage_in_step(tmp_path):
+    entry_bytes = SR * 4 + 1024  # float32 samples plus WAV headers, rounded up
+    cache = TTSSegmentCache(str(tmp_path), max_bytes=3 * entry_bytes)
+    keys = [sentence_key(f"Sentence {n}.") for n in range(5)]
+    for n, key in enumerate(keys):
+        cache.put(key, np.zeros(SR, dtype=np.float32), SR)
+        # Space modification times (the LRU clock) beyond their resolution
+        os.utime(cache._path(key), (n, n))
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == directory_usage(cache)
+    assert stats['entries'] == 3 and stats['bytes'] <= cache.max_bytes
+    assert cache.get(keys[0]) is None and cache.get(keys[-1]) is not None
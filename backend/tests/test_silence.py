@@ -0,0 +1,110 @@
+"""
+remove_long_silences() against pydub's split_on_silence(), the reference it replaces.
+
+pydub's outputs for the random inputs below are recorded in data/silence_pydub.json, so
+the comparison runs without pydub; with pydub installed it is also checked live. After
+changing the inputs, record the outputs again (pydub required) from the backend directory:
+    python -m tests.test_silence
+"""
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytest
+
+from dsp import SILENCE_MIN_MS, process_audio_array, remove_long_silences
+
+SR = 24000
+CASES = 50
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "silence_pydub.json")
+
+
+def quantized(wave):
+    """Round a waveform to the 16-bit samples pydub works on."""
+    return (np.clip(np.round(wave * 32768), -32768, 32767) / 32768).astype(np.float32)
+
+
+def random_speech(seed):
+    """Alternate loud and near-silent parts of random lengths, like speech with pauses."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for _ in range(rng.integers(1, 8)):
+        length = int(rng.integers(1, 3 * SR))
+        amplitude = rng.choice([1e-4, 1e-3, 3e-3, 0.05, 0.5])
+        parts.append(rng.uniform(-amplitude, amplitude, length))
+    return quantized(np.concatenate(parts))
+
+
+def digest(wave):
+    """SHA-256 of a waveform as 16-bit samples"""
+    return hashlib.sha256(np.round(np.asarray(wave) * 32768).astype("<i2").tobytes()).hexdigest()
+
+
+def pydub_remove_long_silences(wave):
+    """The pydub reference: remove_silence_for_generated_wav() without the file round trip."""
+    from pydub import AudioSegment, silence
+
+    samples = np.round(wave * 32768).astype(np.int16)
+    segment = AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=SR, channels=1)
+    non_silent = AudioSegment.silent(duration=0)
+    for chunk in silence.split_on_silence(segment, min_silence_len=1000, silence_thresh=-50,
+                                          keep_silence=500, seek_step=10):
+        non_silent += chunk
+    return np.array(non_silent.get_array_of_samples(), dtype=np.float32) / 32768
+
+
+@functools.lru_cache(maxsize=None)
+def recorded_pydub_outputs():
+    with open(REFERENCE_PATH) as f:
+        return {case['seed']: case for case in json.load(f)['cases']}
+
+
+@pytest.mark.parametrize("seed", range(CASES))
+def test_matches_recorded_pydub_output(seed):
+    case = recorded_pydub_outputs()[seed]
+    wave = random_speech(seed)
+    # Guards against the random inputs changing (e.g. with NumPy's generator) under the recording
+    assert (len(wave), digest(wave)) == (case['input_length'], case['input_sha256'])
+    result = remove_long_silences(wave, SR)
+    assert (len(result), digest(result)) == (case['output_length'], case['output_sha256'])
+
+
+def test_matches_pydub():
+    pytest.importorskip("pydub")
+    for seed in range(CASES):
+        wave = random_speech(seed)
+        expected = pydub_remove_long_silences(wave)
+        result = remove_long_silences(wave, SR)
+        assert len(result) == len(expected)
+        np.testing.assert_allclose(result, expected, atol=1e-4)
+
+
+def test_short_input_is_unchanged():
+    wave = quantized(np.random.default_rng(1).uniform(-1e-4, 1e-4, SR * SILENCE_MIN_MS // 2000))
+    np.testing.assert_array_equal(remove_long_silences(wave, SR), wave)
+
+
+def test_silent_input_becomes_empty():
+    assert len(remove_long_silences(np.zeros(5 * SR, dtype=np.float32), SR)) == 0
+
+
+def test_empty_voice_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="empty"):
+        process_audio_array(np.zeros(0, dtype=np.float32), SR, "unused.wav", str(tmp_path / "out.wav"))
+
+
+if __name__ == "__main__":
+    from importlib.metadata import version
+
+    cases = []
+    for seed in range(CASES):
+        wave = random_speech(seed)
+        expected = pydub_remove_long_silences(wave)
+        cases.append({'seed': seed, 'input_length': len(wave), 'input_sha256': digest(wave),
+                      'output_length': len(expected), 'output_sha256': digest(expected)})
+    os.makedirs(os.path.dirname(REFERENCE_PATH), exist_ok=True)
+    with open(REFERENCE_PATH, "w") as f:
+        json.dump({'pydub': version('pydub'), 'cases': cases}, f, indent=1)
+    print(f"Recorded {len(cases)} pydub outputs in {REFERENCE_PATH}")
@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from conftest import BACKEND_DIR
+
+# Seconds each stubbed warmup step takes, standing in for the TTS imports and Ollama
+STUB_WARMUP_SECONDS = 3
+# /api/health must answer this soon after launch, well before the warmup is done
+HEALTH_BUDGET_SECONDS = 2.5
+READY_TIMEOUT_SECONDS = 30
+
+# Runs server.py as __main__ with its warmup steps replaced by sleeps
+SERVER_WITH_STUBBED_WARMUP = f"""
+import runpy, sys, time
+import main
+
+def stub_warmup():
+    time.sleep({STUB_WARMUP_SECONDS})
+
+main.import_tts = stub_warmup
+main.warmup_ollama = stub_warmup
+sys.argv[0] = 'server.py'
+runpy.run_path('server.py', run_name='__main__')
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def probe(url):
+    """(HTTP status, JSON body) of a GET, or (None, None) if the server is not listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError):
+        return None, None
+
+
+def test_health_answers_before_warmup_and_ready_follows(tmp_path):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-c", SERVER_WITH_STUBBED_WARMUP, "--port", str(port), "--job-store", "memory",
+               "--no-warmup", "--no-bg-index", "--bg-cache-dir", str(tmp_path / "bg_cache")]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while probe(base + "/api/health")[0] != 200:
+            assert server.poll() is None, "server exited during startup"
+            assert time.perf_counter() - start < HEALTH_BUDGET_SECONDS, "/api/health answered too late"
+            time.sleep(0.05)
+
+        status, body = probe(base + "/api/ready")
+        assert status == 503
+        assert not body['ready']
+        assert set(body['components']) == {'tts_imports', 'ollama'}
+
+        while status != 200:
+            assert time.perf_counter() - start < READY_TIMEOUT_SECONDS, "/api/ready never answered 200"
+            time.sleep(0.1)
+            status, body = probe(base + "/api/ready")
+        assert all(c['status'] == 'ready' for c in body['components'].values())
+        assert body['ready_after_seconds'] >= 2 * STUB_WARMUP_SECONDS
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_importing_main_writes_nothing(tmp_path):
+    # The CLI, the DSP benchmarks and the tests all import main; only the server creates its caches
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    subprocess.run([sys.executable, "-c", "import main"], cwd=tmp_path, env=env, check=True, timeout=60)
+    assert os.listdir(tmp_path) == []
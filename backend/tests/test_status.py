@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def running_job(server):
+    server.job_store.create('j1', status='generating_audio', progress=50)
+    return server.job_store.get('j1')['version']
+
+
+@pytest.mark.parametrize('wait', ['NaN', 'Infinity', '-Infinity', '"soon"', '[1]'])
+def test_batch_status_rejects_invalid_wait(client, running_job, wait):
+    start = time.perf_counter()
+    response = client.post('/api/meditation-status', data=f'{{"jobs": {{"j1": {running_job}}}, "wait": {wait}}}',
+                           content_type='application/json')
+    assert response.status_code == 400
+    assert time.perf_counter() - start < 1
+
+
+def test_batch_status_negative_wait_returns_at_once(client, running_job):
+    start = time.perf_counter()
+    response = client.post('/api/meditation-status', json={'jobs': {'j1': running_job}, 'wait': -5})
+    assert response.status_code == 200
+    assert response.json == {'jobs': {}, 'missing': [], 'unchanged': 1}
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize('wait', ['nan', 'inf', 'soon'])
+def test_status_rejects_invalid_wait(client, running_job, wait):
+    response = client.get(f'/api/meditation-status/j1?version={running_job}&wait={wait}')
+    assert response.status_code == 400
+
+
+def test_status_wait_returns_on_change(client, server, running_job):
+    server.job_store.update('j1', progress=60)
+    response = client.get(f'/api/meditation-status/j1?version={running_job}&wait=5')
+    assert response.json['progress'] == 60
@@ -0,0 +1,181 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+
+# Models unused for this long are released by the idle reaper (seconds)
+DEFAULT_MODEL_IDLE_TIMEOUT = 30 * 60
+
+class _ResidentModel:
+    """A loaded model plus the bookkeeping the registry needs for it"""
+
+    def __init__(self, key):
+        self.key = key
+        self.model = None
+        self.load_lock = threading.Lock()      # Held while the model is being constructed
+        self.infer_lock = threading.Lock()     # Serializes inference on this instance
+        self.in_use = 0
+        self.loaded_at = None
+        self.last_used = time.time()
+        self.load_seconds = None
+        self.uses = 0
+
+class TTSModelRegistry:
+    """
+    Process-wide registry of TTS model instances.
+
+    Each distinct (model_type, vocoder_name, device, use_ema, ckpt_file, vocab_file)
+    combination is constructed once through factory and then shared by every job.
+    Inference on one instance is serialized, since the model keeps per-call state
+    (seed, ASR pipeline) on itself; different configurations run independently.
+
+    Parameters:
+    - factory: callable taking the key fields as keyword arguments (e.g. F5TTS)
+    - idle_timeout: seconds of inactivity after which evict_idle() releases a model
+    """
+
+    KEY_FIELDS = ("model_type", "vocoder_name", "device", "use_ema", "ckpt_file", "vocab_file")
+
+    def __init__(self, factory, idle_timeout=DEFAULT_MODEL_IDLE_TIMEOUT):
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._models = {}
+        self._reaper = None
+        self._stop_reaper = threading.Event()
+
+    def _key(self, model_type, vocoder_name, device, use_ema, ckpt_file, vocab_file):
+        return (model_type, vocoder_name, device, bool(use_ema), ckpt_file, vocab_file)
+
+    def _entry(self, key):
+        """Return the loaded entry for key, constructing the model on first use"""
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                entry = _ResidentModel(key)
+                self._models[key] = entry
+            entry.in_use += 1
+
+        try:
+            with entry.load_lock:
+                if entry.model is None:
+                    print(f"Loading TTS model {key[0]} with {key[1]} vocoder (checkpoint: {key[4]})...")
+                    start = time.time()
+                    entry.model = self.factory(**dict(zip(self.KEY_FIELDS, key)))
+                    entry.loaded_at = time.time()
+                    entry.load_seconds = entry.loaded_at - start
+                    print(f"TTS model loaded in {entry.load_seconds:.1f}s")
+        except BaseException:
+            with self._lock:
+                entry.in_use -= 1
+                if entry.model is None and entry.in_use == 0:
+                    self._models.pop(key, None)
+            raise
+        return entry
+
+    @contextmanager
+    def acquire(self, model_type="F5-TTS", vocoder_name="vocos", device=None, use_ema=True,
+                ckpt_file=None, vocab_file=None):
+        """
+        Context manager yielding a ready model for exclusive use by the caller.
+
+        The model stays resident after the block exits; concurrent callers asking
+        for the same configuration wait for their turn instead of loading a copy.
+        """
+        entry = self._entry(self._key(model_type, vocoder_name, device, use_ema, ckpt_file, vocab_file))
+        try:
+            with entry.infer_lock:
+                entry.uses += 1
+                yield entry.model
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def warmup(self, model_type="F5-TTS", vocoder_name="vocos", device=None, use_ema=True,
+               ckpt_file=None, vocab_file=None):
+        """Load a model configuration ahead of the first job"""
+        with self.acquire(model_type, vocoder_name, device, use_ema, ckpt_file, vocab_file):
+            pass
+
+    def evict_idle(self, max_idle=None):
+        """
+        Release models that have not been used for max_idle seconds
+        (defaults to idle_timeout). Models in use are never evicted.
+
+        Returns:
+        - number of models released
+        """
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        if not max_idle or max_idle <= 0:
+            return 0
+
+        now = time.time()
+        evicted = []
+        with self._lock:
+            for key, entry in list(self._models.items()):
+                if entry.in_use == 0 and now - entry.last_used >= max_idle:
+                    evicted.append(self._models.pop(key))
+
+        for entry in evicted:
+            print(f"Releasing idle TTS model {entry.key[0]} ({entry.key[4]})")
+            entry.model = None
+        if evicted:
+            _release_memory()
+        return len(evicted)
+
+    def clear(self):
+        """Release every model that is not currently in use"""
+        with self._lock:
+            evicted = [self._models.pop(key) for key, entry in list(self._models.items()) if entry.in_use == 0]
+        for entry in evicted:
+            entry.model = None
+        if evicted:
+            _release_memory()
+        return len(evicted)
+
+    def start_reaper(self, interval=60):
+        """Start a daemon thread that periodically calls evict_idle()"""
+        if self._reaper is not None or not self.idle_timeout or self.idle_timeout <= 0:
+            return
+
+        def reap():
+            while not self._stop_reaper.wait(interval):
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    print(f"Error evicting idle TTS models: {str(e)}")
+
+        self._reaper = threading.Thread(target=reap, name="tts-model-reaper")
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop_reaper.set()
+
+    def resident(self):
+        """Describe every resident model configuration"""
+        now = time.time()
+        with self._lock:
+            entries = list(self._models.values())
+            return [
+                {
+                    **dict(zip(self.KEY_FIELDS, entry.key)),
+                    'loaded': entry.model is not None,
+                    'in_use': entry.in_use,
+                    'uses': entry.uses,
+                    'load_seconds': entry.load_seconds,
+                    'idle_seconds': None if entry.in_use else round(now - entry.last_used, 1),
+                }
+                for entry in entries
+            ]
+
+def _release_memory():
+    """Drop references and return cached accelerator memory after evicting models"""
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
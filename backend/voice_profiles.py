@@ -0,0 +1,195 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+from bg_cache import file_sha256
+
+# Default location for persisted voice profiles
+VOICE_PROFILE_DIR = "cache/voices"
+
+def normalize_ref_text(ref_text):
+    """Make reference text end the way F5-TTS expects (". " or a CJK full stop)"""
+    ref_text = ref_text.strip()
+    if ref_text.endswith("。"):
+        return ref_text
+    if ref_text.endswith("."):
+        return ref_text + " "
+    return ref_text + ". "
+
+class VoiceProfile:
+    """
+    A reference voice ready for synthesis.
+
+    Attributes:
+    - audio_hash: SHA-256 of the original reference audio file
+    - source_path: path the profile was first registered from
+    - ref_text: transcription of the reference clip, normalized for F5-TTS
+    - audio_path: preprocessed (clipped, silence-trimmed) reference clip
+    - duration: length of the preprocessed clip in seconds
+    """
+
+    def __init__(self, audio_hash, source_path, ref_text, audio_path, duration=None, created_at=None):
+        self.audio_hash = audio_hash
+        self.source_path = source_path
+        self.ref_text = ref_text
+        self.audio_path = audio_path
+        self.duration = duration
+        self.created_at = created_at or time.time()
+        self._features = None
+        self._features_lock = threading.Lock()
+
+    def with_text(self, ref_text):
+        """Copy of this profile using a caller-supplied transcription"""
+        profile = VoiceProfile(self.audio_hash, self.source_path, normalize_ref_text(ref_text),
+                               self.audio_path, self.duration, self.created_at)
+        profile._features = self._features
+        return profile
+
+    def features(self, loader):
+        """
+        Decoded reference audio, loaded once with loader(audio_path) and kept in memory
+        for every later job using this voice.
+        """
+        with self._features_lock:
+            if self._features is None:
+                self._features = loader(self.audio_path)
+            return self._features
+
+    def to_dict(self):
+        return {
+            'audio_hash': self.audio_hash,
+            'source_path': self.source_path,
+            'ref_text': self.ref_text,
+            'audio_path': self.audio_path,
+            'duration': self.duration,
+            'created_at': self.created_at,
+        }
+
+class VoiceProfileStore:
+    """
+    Persistent store of voice profiles keyed by the reference audio's content hash.
+
+    The first job with a given reference clip pays for transcription (when no
+    text is supplied) and reference preprocessing; the results are written to
+    profile_dir/<hash>/ and reused by every later job, across restarts.
+
+    Parameters:
+    - profile_dir: directory holding one subdirectory per profile, created with the first
+      profile (so constructing a store, e.g. by importing main, writes nothing)
+    - preprocess: callable(ref_audio, ref_text) -> (processed_audio_path, processed_text)
+    - transcribe: callable(ref_audio) -> text, used when no transcription is given
+    - duration: optional callable(path) -> seconds, recorded in the profile
+    """
+
+    def __init__(self, profile_dir=VOICE_PROFILE_DIR, preprocess=None, transcribe=None, duration=None):
+        self.profile_dir = profile_dir
+        self.preprocess = preprocess
+        self.transcribe = transcribe
+        self.duration = duration
+        self._lock = threading.Lock()
+        self._profile_locks = {}
+        self._profiles = {}
+        self._file_hashes = {}
+
+    def audio_hash(self, ref_audio):
+        """Content hash of a reference clip, memoized on (path, size, mtime)"""
+        st = os.stat(ref_audio)
+        memo_key = (os.path.abspath(ref_audio), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+        digest = file_sha256(ref_audio)
+        with self._lock:
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def _load(self, audio_hash):
+        """Read a persisted profile from disk, or None if absent or incomplete"""
+        meta_path = os.path.join(self.profile_dir, audio_hash, "profile.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(meta.get('audio_path', '')):
+            return None
+        return VoiceProfile(meta['audio_hash'], meta.get('source_path'), meta['ref_text'],
+                            meta['audio_path'], meta.get('duration'), meta.get('created_at'))
+
+    def _create(self, audio_hash, ref_audio, ref_text):
+        """Transcribe (if needed) and preprocess a reference clip into a new profile"""
+        if not ref_text:
+            if self.transcribe is None:
+                raise ValueError(f"No transcription given for {ref_audio} and no transcriber configured")
+            print(f"Transcribing reference audio {ref_audio} for voice profile...")
+            ref_text = self.transcribe(ref_audio)
+            print(f"Transcription: {ref_text}")
+
+        profile_path = os.path.join(self.profile_dir, audio_hash)
+        os.makedirs(profile_path, exist_ok=True)
+        audio_path = os.path.join(profile_path, "reference.wav")
+
+        if self.preprocess is not None:
+            print(f"Preprocessing reference audio {ref_audio} for voice profile...")
+            processed_path, ref_text = self.preprocess(ref_audio, ref_text)
+            # F5-TTS caches the processed file by audio hash and hands the same path out
+            # again, so it is copied rather than moved
+            shutil.copyfile(processed_path, audio_path)
+        else:
+            shutil.copyfile(ref_audio, audio_path)
+
+        profile = VoiceProfile(audio_hash, ref_audio, normalize_ref_text(ref_text), audio_path,
+                               self.duration(audio_path) if self.duration else None)
+
+        meta_path = os.path.join(profile_path, "profile.json")
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(profile.to_dict(), f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+        return profile
+
+    def get(self, ref_audio, ref_text=None):
+        """
+        Return the profile for a reference clip, creating and persisting it on first use.
+
+        An explicit ref_text overrides the stored transcription for this call only.
+        """
+        audio_hash = self.audio_hash(ref_audio)
+        with self._lock:
+            profile = self._profiles.get(audio_hash)
+            profile_lock = self._profile_locks.setdefault(audio_hash, threading.Lock())
+
+        if profile is None:
+            # One thread builds the profile while others with the same voice wait for it
+            with profile_lock:
+                with self._lock:
+                    profile = self._profiles.get(audio_hash)
+                if profile is None:
+                    profile = self._load(audio_hash)
+                    if profile is not None:
+                        print(f"Loaded voice profile {audio_hash[:12]} from disk")
+                    else:
+                        profile = self._create(audio_hash, ref_audio, ref_text)
+                        print(f"Created voice profile {audio_hash[:12]}")
+                    with self._lock:
+                        self._profiles[audio_hash] = profile
+
+        if ref_text and normalize_ref_text(ref_text) != profile.ref_text:
+            return profile.with_text(ref_text)
+        return profile
+
+    def register(self, ref_audio, ref_text=None, loader=None):
+        """
+        Create (or load) a profile ahead of time, optionally decoding its reference
+        audio with loader so the first job finds everything warm.
+        """
+        profile = self.get(ref_audio, ref_text)
+        if loader is not None:
+            profile.features(loader)
+        return profile
+
+    def profiles(self):
+        """Profiles currently held in memory"""
+        with self._lock:
+            return [profile.to_dict() for profile in self._profiles.values()]